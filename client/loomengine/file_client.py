@@ -24,7 +24,10 @@ class FileImport(object):
         server_url = get_server_url()
         verify_server_is_running(url=server_url)
         token = get_token()
-        self.filemanager = FileManager(server_url, token=token)
+        if self.args.jobs < 1:
+            raise SystemExit('ERROR! --jobs must be at least 1')
+        self.filemanager = FileManager(server_url, token=token,
+                                       jobs=self.args.jobs)
         self.connection = Connection(server_url, token=token)
 
     @classmethod
@@ -50,6 +53,11 @@ class FileImport(object):
                             default=False,
                             help='allow retries if there is a failure '\
                             'connecting to storage')
+        parser.add_argument('-j', '--jobs', metavar='JOBS', type=int,
+                            default=1,
+                            help='number of files to hash and copy at once. '\
+                            'With more than 1, hashing and copying overlap '\
+                            'and new files are registered in batches')
         parser.add_argument('-t', '--tag', metavar='TAG', action='append',
                             help='tag the file when it is created')
         parser.add_argument('-l', '--label', metavar='LABEL', action='append',
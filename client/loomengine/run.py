@@ -202,9 +202,17 @@ class RunList(object):
             '(ignored when RUN_IDENTIFIER is given)')
         parser.add_argument('-l', '--label', metavar='LABEL', action='append',
                             help='filter by label')
+        parser.add_argument(
+            '-f', '--follow',
+            action='store_true',
+            help='print status changes in RUN_IDENTIFIER and its steps '\
+            'as they happen, until it finishes, fails, or is killed')
         return parser
 
     def run(self):
+        if self.args.follow:
+            self._follow_run()
+            return
         if self.args.run_id:
             parent_only = False
         else:
@@ -224,6 +232,40 @@ class RunList(object):
             else:
                 break
 
+    def _follow_run(self):
+        if not self.args.run_id:
+            raise SystemExit('ERROR! RUN_IDENTIFIER is required with --follow')
+        run = self.connection.get_run_index(
+            min=1, max=1, query_string=self.args.run_id)[0]
+        print self._render_run(run)
+        # A change made while the server read the current statuses is
+        # sent again after them
+        statuses = {}
+        for message in self.connection.follow_run(run['uuid']):
+            data = message['data']
+            if message['event'] == 'status':
+                if statuses.get(data['uuid']) == data['status']:
+                    continue
+                statuses[data['uuid']] = data['status']
+            text = self._render_change(message['event'], data)
+            if text:
+                print text
+
+    def _render_change(self, event, data):
+        object_name = {'run': 'Run',
+                       'task': 'Task',
+                       'task_attempt': 'TaskAttempt'}.get(data.get('type'))
+        if event == 'status':
+            return '%s %s (%s)' % (object_name, data['uuid'], data['status'])
+        elif event == 'event':
+            text = '%s %s: %s' % (object_name, data['uuid'], data['event'])
+            if data.get('detail'):
+                text += ' (%s)' % data['detail']
+            return text
+        elif event == 'end':
+            return 'Run %s ended with status %s' % (
+                data['uuid'], data['status'])
+
     def _list_runs(self, runs):
         for run in runs:
             print self._render_run(run)
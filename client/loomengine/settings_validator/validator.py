@@ -25,6 +25,13 @@ class SettingsValidator(object):
         'LOOM_DELETE_SERVER_PLAYBOOK',
         'LOOM_RUN_TASK_ATTEMPT_PLAYBOOK',
         'LOOM_CLEANUP_TASK_ATTEMPT_PLAYBOOK',
+        'LOOM_TASK_EXECUTOR',
+        'LOOM_LOCAL_EXECUTOR_MAX_CORES',
+        'LOOM_LOCAL_EXECUTOR_MAX_MEMORY_GB',
+        'LOOM_SCHEDULER_MAX_CORES',
+        'LOOM_SCHEDULER_MAX_MEMORY_GB',
+        'LOOM_SCHEDULER_MAX_DISK_SIZE_GB',
+        'LOOM_SCHEDULER_INTERVAL_SECONDS',
         'LOOM_STORAGE_TYPE',
         'LOOM_ANSIBLE_INVENTORY',
         'LOOM_SERVER_NAME',
@@ -38,13 +45,30 @@ class SettingsValidator(object):
         'ANSIBLE_HOST_KEY_CHECKING', # copy of LOOM_ANSIBLE_HOST_KEY_CHECKING
         'LOOM_DEFAULT_DOCKER_REGISTRY',
         'LOOM_STORAGE_ROOT',
+        'LOOM_STORAGE_CONTENT_ADDRESSED',
+        'LOOM_LOCAL_COPY_STRATEGIES',
+        'LOOM_BLOB_GC_INTERVAL_HOURS',
+        'LOOM_INPUT_STAGING_MODE',
+        'LOOM_INPUT_COPY_JOBS',
         'MAXIMUM_RETRIES_FOR_TIMEOUT_FAILURE',
         'MAXIMUM_RETRIES_FOR_ANALYSIS_FAILURE',
         'MAXIMUM_RETRIES_FOR_SYSTEM_FAILURE',
         'LOOM_TASKRUNNER_HEARTBEAT_INTERVAL_SECONDS',
         'LOOM_TASKRUNNER_HEARTBEAT_TIMEOUT_SECONDS',
+        'LOOM_HEARTBEAT_STORE',
+        'LOOM_HEARTBEAT_FLUSH_INTERVAL_SECONDS',
+        'LOOM_HEARTBEAT_CACHE_BACKEND',
+        'LOOM_HEARTBEAT_CACHE_LOCATION',
+        'LOOM_RESPONSE_CACHE_BACKEND',
+        'LOOM_RESPONSE_CACHE_LOCATION',
+        'LOOM_RESPONSE_CACHE_TERMINAL_TTL_SECONDS',
+        'LOOM_RESPONSE_CACHE_ACTIVE_TTL_SECONDS',
+        'LOOM_STATUS_STREAM_POLL_INTERVAL_SECONDS',
+        'LOOM_STATUS_STREAM_MAX_SECONDS',
+        'LOOM_STATUS_CHANGE_RETENTION_HOURS',
         'LOOM_PRESERVE_ON_FAILURE',
         'LOOM_PRESERVE_ALL',
+        'LOOM_TEMPLATE_CACHE_SIZE',
         'LOOM_FORCE_DB_MIGRATIONS_ON_START',
         'LOOM_HTTP_PORT',
         'LOOM_HTTPS_PORT',
@@ -162,7 +186,10 @@ class SettingsValidator(object):
         self._validate_ssl_cert_settings()
         self._validate_server_name()
         self._validate_storage_root()
+        self._validate_local_copy_strategies()
+        self._validate_input_staging_mode()
         self._validate_gcloud_settings()
+        self._validate_task_executor()
         self._validate_auth_settings()
         self.raise_if_errors()
 
@@ -202,6 +229,25 @@ class SettingsValidator(object):
                 'Invalid value "%s" for setting LOOM_STORAGE_ROOT. '\
                 'Value must be an absolute path.' % LOOM_STORAGE_ROOT)
 
+    def _validate_local_copy_strategies(self):
+        strategies = self.settings.get('LOOM_LOCAL_COPY_STRATEGIES')
+        if not strategies:
+            return
+        for strategy in strategies.strip(' "\'[]').split(','):
+            if strategy.strip(' "\'') not in ['reflink', 'hardlink', 'copy']:
+                self.errors.append(
+                    'Invalid value "%s" for setting LOOM_LOCAL_COPY_STRATEGIES. '\
+                    'Valid strategies are reflink, hardlink, and copy.'
+                    % strategies)
+                return
+
+    def _validate_input_staging_mode(self):
+        mode = self.settings.get('LOOM_INPUT_STAGING_MODE')
+        if mode and mode.lower() not in ['copy', 'link']:
+            self.errors.append(
+                'Invalid value "%s" for setting LOOM_INPUT_STAGING_MODE. '\
+                'Valid values are copy and link.' % mode)
+
     def _validate_gcloud_settings(self):
         if not self.settings.get('LOOM_MODE') == 'gcloud':
             return
@@ -227,6 +273,20 @@ class SettingsValidator(object):
                     'Allowed values are "ephemeral" and "none". If you need to restrict '
                     'the IP address range, use a subnetwork.' % ip)
 
+    def _validate_task_executor(self):
+        executor = self.settings.get('LOOM_TASK_EXECUTOR')
+        if not executor:
+            return
+        if not executor.lower() in ['ansible', 'local']:
+            self.errors.append(
+                'Invalid value "%s" for LOOM_TASK_EXECUTOR. '\
+                'Allowed values are "ansible" and "local".' % executor)
+        elif executor.lower() == 'local' \
+             and self.settings.get('LOOM_MODE') == 'gcloud':
+            self.errors.append(
+                'Setting LOOM_TASK_EXECUTOR=local not allowed '\
+                'when LOOM_MODE==gcloud.')
+
     def _validate_auth_settings(self):
         if to_bool(self.settings.get('LOOM_LOGIN_REQUIRED')):
             for required_setting in [
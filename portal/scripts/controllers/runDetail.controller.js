@@ -12,8 +12,18 @@ RunDetailController.$inject = [
 function RunDetailController($scope, DataService, $routeParams) {
     $scope.activeData = DataService.getAllActive();
     $scope.loading = true;
+    var stopFollowing;
     DataService.setActiveRun($routeParams.runId).then(function() {
 	$scope.loading = false;
+	stopFollowing = DataService.followRun(
+	    $routeParams.runId, function(eventType, data) {
+		DataService.applyRunChange($scope.activeData.run, eventType, data);
+	    });
+    });
+    $scope.$on('$destroy', function() {
+	if (stopFollowing) {
+	    stopFollowing();
+	}
     });
 };
 }());
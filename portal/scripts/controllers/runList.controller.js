@@ -8,14 +8,41 @@ angular
 RunListController.$inject = ['$scope', 'DataService', '$location'];
 
 function RunListController($scope, DataService, $location) {
+    var stopFollowing = function() {};
     function loadRuns() {
 	var offset = ($scope.currentPage - 1) * $scope.pageSize
 	DataService.getRuns($scope.pageSize, offset).then(function(data) {
 	    $scope.runs = data.results;
 	    $scope.totalItems = data.count;
 	    $scope.loading = false;
+	    followActiveRuns();
 	});
     }
+    function followActiveRuns() {
+	// Only the status of each run on this page is shown
+	stopFollowing();
+	var activeRuns = {};
+	$scope.runs.forEach(function(run) {
+	    if (run.status != 'Finished' && run.status != 'Failed'
+		&& run.status != 'Killed') {
+		activeRuns[run.uuid] = run;
+	    }
+	});
+	var runIds = Object.keys(activeRuns);
+	if (runIds.length == 0) {
+	    return;
+	}
+	stopFollowing = DataService.followRuns(
+	    runIds, function(eventType, data) {
+		var run = activeRuns[data.uuid];
+		if (run && eventType != 'event') {
+		    run.status = data.status;
+		}
+	    });
+    }
+    $scope.$on('$destroy', function() {
+	stopFollowing();
+    });
     $scope.$location = $location;
     $scope.pageSize = 10;
     $scope.loading = true;
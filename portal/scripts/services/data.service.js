@@ -5,9 +5,9 @@
 	.module("loom.services")
 	.service("DataService", DataService)
 
-    DataService.$inject = ["$http", "$q"];
+    DataService.$inject = ["$http", "$q", "$rootScope"];
 
-    function DataService($http, $q) {
+    function DataService($http, $q, $rootScope) {
 	/* DataService retrieves and caches data from the server. */
 
 	this.setActiveRun = setActiveRun;
@@ -17,6 +17,9 @@
 	this.setActiveFile = setActiveFile;
 	this.getAllActive = getAllActive;
 	this.getRunSummary = getRunSummary;
+	this.followRun = followRun;
+	this.followRuns = followRuns;
+	this.applyRunChange = applyRunChange;
 	this.getRuns = getRuns;
 	this.getTemplates = getTemplates;
 	this.getImportedFiles = getImportedFiles;
@@ -101,6 +104,58 @@
 		    return response.data;
 		});
 	}
+	function followRun(runId, onChange) {
+	    /* Calls onChange(eventType, data) for each status change or new
+	       event in the run and its steps, until the run ends. The browser
+	       reconnects where it left off each time the server closes the
+	       stream. Returns a function that stops following. */
+	    return followRuns([runId], onChange);
+	}
+
+	function followRuns(runIds, onChange) {
+	    /* Same as followRun, but for several runs with one stream, so
+	       that a page does not hold a server worker for each run */
+	    var source = new EventSource(
+		"/api/runs/changes/?runs=" + runIds.join(","));
+	    var ended = 0;
+	    ["status", "event", "end"].forEach(function(eventType) {
+		source.addEventListener(eventType, function(message) {
+		    if (eventType == "end" && ++ended == runIds.length) {
+			source.close();
+		    }
+		    var data = JSON.parse(message.data);
+		    $rootScope.$applyAsync(function() {
+			onChange(eventType, data);
+		    });
+		});
+	    });
+	    return function() {
+		source.close();
+	    };
+	}
+
+	function applyRunChange(run, eventType, data) {
+	    /* Update run, its steps, or its tasks in place from a change
+	       sent by followRun */
+	    if (eventType == "event") {
+		if (data.type == "run" && data.uuid == run.uuid && run.events) {
+		    run.events.push({
+			timestamp: data.timestamp,
+			event: data.event,
+			detail: data.detail,
+			is_error: data.is_error
+		    });
+		}
+		return;
+	    }
+	    var candidates = [run].concat(run.steps || [], run.tasks || []);
+	    for (var i=0; i < candidates.length; i++) {
+		if (candidates[i].uuid == data.uuid) {
+		    candidates[i].status = data.status;
+		}
+	    }
+	}
+
 	function getRuns(limit, offset) {
             return $http.get("/api/runs/?parent_only&limit="+limit+"&offset="+offset)
 		.then(function(response) {
@@ -1,15 +1,12 @@
 from __future__ import absolute_import, unicode_literals
-from celery import shared_task
+from celery import group, shared_task
 from celery.decorators import periodic_task
-import copy
 from datetime import datetime, timedelta
 from django import db
 from django.utils import timezone
 import logging
 from api import get_setting
-import os
 import pytz
-import subprocess
 import threading
 import time
 
@@ -37,6 +34,27 @@ def _run_with_delay(task_function, args, kwargs):
     time.sleep(0.0001) # Release the GIL
     task_function.delay(*args, **kwargs)
 
+def _run_group_with_delay(task_function, args_list):
+    """Run many calls to one task asynchronously, sent as a single group.
+    Returns None, whether the calls ran synchronously or not.
+    """
+
+    if not args_list:
+        return
+
+    if get_setting('TEST_DISABLE_ASYNC_DELAY'):
+        # Delay disabled, run synchronously
+        logger.debug('Running function "%s" synchronously because '\
+                     'TEST_DISABLE_ASYNC_DELAY is True'
+                     % task_function.__name__)
+        for args in args_list:
+            task_function(*args)
+        return
+
+    db.connections.close_all()
+    time.sleep(0.0001) # Release the GIL
+    group(task_function.s(*args) for args in args_list).apply_async()
+
 @shared_task
 def _postprocess_run(run_uuid):
     from api.models import Run
@@ -52,6 +70,14 @@ def postprocess_run(*args, **kwargs):
 @shared_task
 def _run_task(task_uuid, delay=0):
     time.sleep(delay)
+    from api.models.task_queue import TaskQueueEntry
+    if TaskQueueEntry.is_enabled():
+        _queue_tasks([task_uuid])
+        return
+    _start_task(task_uuid)
+
+@shared_task
+def _start_task(task_uuid):
     # If task has been run before, old TaskAttempt will be rendered inactive
     from api.models.tasks import Task
     task = Task.objects.get(uuid=task_uuid)
@@ -60,15 +86,45 @@ def _run_task(task_uuid, delay=0):
         return
     task_attempt = task.create_and_activate_attempt()
     if get_setting('TEST_NO_RUN_TASK_ATTEMPT'):
-        logger.debug('Skipping async._run_execute_task_attempt_playbook because'\
+        logger.debug('Skipping task attempt execution because '\
                      'TEST_NO_RUN_TASK_ATTEMPT is True')
         return
-    _run_with_heartbeats(_run_execute_task_attempt_playbook, task_attempt,
+    from api.executors import get_executor
+    _run_with_heartbeats(get_executor().run, task_attempt,
                          args=[task_attempt])
 
 def run_task(*args, **kwargs):
     return _run_with_delay(_run_task, args, kwargs)
 
+def run_tasks(task_uuids):
+    from api.models.task_queue import TaskQueueEntry
+    if TaskQueueEntry.is_enabled():
+        return _run_with_delay(_queue_tasks, [task_uuids], {})
+    return _run_group_with_delay(
+        _run_task, [[task_uuid] for task_uuid in task_uuids])
+
+@shared_task
+def _queue_tasks(task_uuids):
+    from api.models.task_queue import TaskQueueEntry
+    TaskQueueEntry.enqueue(task_uuids)
+    _schedule_tasks()
+
+@shared_task
+def _schedule_tasks():
+    from api.models.task_queue import TaskQueueEntry
+    task_uuids = TaskQueueEntry.admit()
+    if task_uuids:
+        _run_group_with_delay(
+            _start_task, [[task_uuid] for task_uuid in task_uuids])
+
+def schedule_tasks():
+    """Admit queued tasks into capacity that was just released
+    """
+    from api.models.task_queue import TaskQueueEntry
+    if not TaskQueueEntry.is_enabled():
+        return
+    return _run_with_delay(_schedule_tasks, [], {})
+
 def _run_with_heartbeats(function, task_attempt, args=None, kwargs=None):
     from api.models.tasks import TaskAttempt
     heartbeat_interval = int(get_setting(
@@ -92,91 +148,12 @@ def _run_with_heartbeats(function, task_attempt, args=None, kwargs=None):
             last_heartbeat = task_attempt.heartbeat()
         time.sleep(polling_interval)
 
-def _run_execute_task_attempt_playbook(task_attempt):
-    from django.contrib.auth.models import User
-    from django.db import IntegrityError
-    from rest_framework.authtoken.models import Token
-
-    if get_setting('LOGIN_REQUIRED'):
-        try:
-            loom_user = User.objects.create(username='loom-system')
-        except IntegrityError:
-            loom_user = User.objects.get(username='loom-system')
-        try:
-            token = Token.objects.get(user=loom_user).key
-        except Token.DoesNotExist:
-            token = Token.objects.create(user=loom_user).key
-    else:
-        token = None
-
-    env = copy.copy(os.environ)
-    playbook = os.path.join(
-        get_setting('PLAYBOOK_PATH'),
-        get_setting('RUN_TASK_ATTEMPT_PLAYBOOK'))
-    cmd_list = ['ansible-playbook',
-                '-i', get_setting('ANSIBLE_INVENTORY'),
-                playbook,
-                # Without this, ansible uses /usr/bin/python,
-                # which may be missing needed modules
-                '-e', 'ansible_python_interpreter="/usr/bin/env python"',
-    ]
-
-    if get_setting('DEBUG'):
-        cmd_list.append('-vvvv')
-
-    resources = task_attempt.task.run.template.resources
-    if resources:
-        disk_size = str(resources.get('disk_size', ''))
-        cores = str(resources.get('cores', ''))
-        memory = str(resources.get('memory', ''))
-    else:
-        disk_size = ''
-        cores = ''
-        memory = ''
-    docker_image = task_attempt.task.run.template.environment.get(
-        'docker_image')
-    name = task_attempt.task.run.name
-
-    new_vars = {'LOOM_TASK_ATTEMPT_ID': str(task_attempt.uuid),
-                'LOOM_TASK_ATTEMPT_DOCKER_IMAGE': docker_image,
-                'LOOM_TASK_ATTEMPT_STEP_NAME': name,
-    }
-    if token:
-        new_vars['LOOM_TOKEN'] = token
-    if cores:
-        new_vars['LOOM_TASK_ATTEMPT_CORES'] = cores
-    if disk_size:
-        new_vars['LOOM_TASK_ATTEMPT_DISK_SIZE_GB'] = disk_size
-    if memory:
-        new_vars['LOOM_TASK_ATTEMPT_MEMORY'] = memory
-
-    env.update(new_vars)
-
-    p = subprocess.Popen(cmd_list,
-                         env=env,
-                         stdout=subprocess.PIPE,
-                         stderr=subprocess.STDOUT)
-    terminal_output = ''
-    for line in iter(p.stdout.readline, ''):
-        terminal_output += line
-        print line.strip()
-    p.wait()
-    if p.returncode != 0:
-        logger.error('async._run_execute_task_attempt_playbook failed for '\
-                     'task_attempt.uuid="%s" with returncode="%s".'
-                     % (task_attempt.uuid, p.returncode))
-        msg = "Failed to launch worker process for TaskAttempt %s" \
-              % task_attempt.uuid
-        task_attempt.add_event(msg,
-                               detail=terminal_output,
-                               is_error=True)
-        task_attempt.fail(detail="Failed to launch worker process")
-
 @shared_task
 def _cleanup_task_attempt(task_attempt_uuid):
     from api.models.tasks import TaskAttempt
+    from api.executors import get_executor
     task_attempt = TaskAttempt.objects.get(uuid=task_attempt_uuid)
-    _run_cleanup_task_playbook(task_attempt)
+    get_executor().cleanup(task_attempt)
     task_attempt.add_event('Cleaned up',
                            is_error=False)
     task_attempt.setattrs_and_save_with_retries({
@@ -185,39 +162,10 @@ def _cleanup_task_attempt(task_attempt_uuid):
 def cleanup_task_attempt(*args, **kwargs):
     return _run_with_delay(_cleanup_task_attempt, args, kwargs)
 
-def _run_cleanup_task_playbook(task_attempt):
-    env = copy.copy(os.environ)
-    playbook = os.path.join(
-        get_setting('PLAYBOOK_PATH'),
-        get_setting('CLEANUP_TASK_ATTEMPT_PLAYBOOK'))
-    cmd_list = ['ansible-playbook',
-                '-i', get_setting('ANSIBLE_INVENTORY'),
-                playbook,
-                # Without this, ansible uses /usr/bin/python,
-                # which may be missing needed modules
-                '-e', 'ansible_python_interpreter="/usr/bin/env python"',
-    ]
-
-    if get_setting('DEBUG'):
-        cmd_list.append('-vvvv')
-
-    new_vars = {'LOOM_TASK_ATTEMPT_ID': str(task_attempt.uuid),
-                'LOOM_TASK_ATTEMPT_STEP_NAME':
-                task_attempt.task.run.name,
-                }
-    env.update(new_vars)
-
-    p = subprocess.Popen(
-        cmd_list, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-    terminal_output, err_is_empty = p.communicate()
-    if p.returncode != 0:
-        msg = 'Cleanup failed for task_attempt.uuid="%s" with returncode="%s".' % (
-            task_attempt.uuid, p.returncode)
-        logger.error(msg)
-        task_attempt.add_event(msg,
-                               detail=terminal_output,
-                               is_error=True)
-        raise Exception(msg)
+def cleanup_task_attempts(task_attempt_uuids):
+    return _run_group_with_delay(
+        _cleanup_task_attempt,
+        [[task_attempt_uuid] for task_attempt_uuid in task_attempt_uuids])
 
 @shared_task
 def _finish_task_attempt(task_attempt_uuid):
@@ -256,28 +204,54 @@ SYSTEM_CHECK_INTERVAL_MINUTES = get_setting('SYSTEM_CHECK_INTERVAL_MINUTES')
 def check_for_stalled_tasks():
     """Check for tasks that are no longer sending a heartbeat
     """
+    from api.heartbeats import get_heartbeat_store
     from api.models.tasks import Task
-    for task in Task.objects.filter(status_is_running=True):
-        if task.is_unresponsive():
-            task.system_error()
+    get_heartbeat_store().flush()
+    for task in Task.get_unresponsive_tasks():
+        task.system_error()
+
+HEARTBEAT_FLUSH_INTERVAL_SECONDS = get_setting(
+    'HEARTBEAT_FLUSH_INTERVAL_SECONDS')
+
+@periodic_task(run_every=timedelta(seconds=HEARTBEAT_FLUSH_INTERVAL_SECONDS))
+def flush_heartbeats():
+    """Copy heartbeats from the heartbeat store to the database
+    """
+    from api.heartbeats import get_heartbeat_store
+    get_heartbeat_store().flush()
+
+SCHEDULER_INTERVAL_SECONDS = get_setting('SCHEDULER_INTERVAL_SECONDS')
+
+@periodic_task(run_every=timedelta(seconds=SCHEDULER_INTERVAL_SECONDS))
+def check_task_queue():
+    """Admit queued tasks, in case a release of capacity was missed
+    """
+    from api.models.task_queue import TaskQueueEntry
+    if TaskQueueEntry.is_enabled():
+        _schedule_tasks()
 
 @periodic_task(run_every=timedelta(minutes=SYSTEM_CHECK_INTERVAL_MINUTES))
 def check_for_missed_cleanup():
     """Check for TaskAttempts that were never cleaned up
     """
-    if get_setting('PRESERVE_ALL'):
-        return
     from api.models.tasks import TaskAttempt
-    if get_setting('PRESERVE_ON_FAILURE'):
-        for task_attempt in TaskAttempt.objects.filter(
-                status_is_running=False).filter(
-                    status_is_cleaned_up=False).exclude(
-                        status_is_failed=True):
-            task_attempt.cleanup()
-    else:
-        for task_attempt in TaskAttempt.objects.filter(
-                status_is_running=False).filter(status_is_cleaned_up=False):
-            task_attempt.cleanup()
+    cleanup_task_attempts(list(
+        TaskAttempt.get_missed_cleanup().values_list('uuid', flat=True)))
+
+BLOB_GC_INTERVAL_HOURS = get_setting('BLOB_GC_INTERVAL_HOURS')
+
+@periodic_task(run_every=timedelta(hours=BLOB_GC_INTERVAL_HOURS))
+def collect_unreferenced_blobs():
+    """Delete content-addressed files that no FileResource references
+    """
+    from api.models.data_objects import FileResource
+    if get_setting('STORAGE_CONTENT_ADDRESSED'):
+        FileResource.collect_unreferenced_blobs()
+
+@periodic_task(run_every=timedelta(hours=1))
+def clear_expired_status_changes():
+    from api.models.status_changes import StatusChange
+    StatusChange.delete_expired(get_setting('STATUS_CHANGE_RETENTION_HOURS'))
 
 @periodic_task(run_every=timedelta(hours=1))
 def clear_expired_logs():
@@ -0,0 +1,293 @@
+import copy
+import logging
+import multiprocessing
+import os
+import subprocess
+import threading
+
+from api import get_setting
+
+
+"""Executors launch the worker process for a TaskAttempt and clean up
+after it. Set LOOM_TASK_EXECUTOR to choose one.
+
+"ansible" runs a playbook for each attempt, so workers can be remote hosts.
+
+"local" runs loom-task-monitor as a child process of the async worker. It
+skips the playbook and the monitor container, and limits concurrent attempts
+to the cores and memory they request in "resources".
+"""
+
+
+logger = logging.getLogger(__name__)
+
+
+def get_executor():
+    executor_name = get_setting('TASK_EXECUTOR')
+    try:
+        executor_class = EXECUTORS[executor_name]
+    except KeyError:
+        raise Exception('Invalid value for TASK_EXECUTOR: "%s". Expected one '\
+                        'of %s' % (executor_name, ', '.join(sorted(EXECUTORS))))
+    # One instance per process, so the local pool can track everything
+    # this process is running
+    with _executors_lock:
+        if executor_name not in _executors:
+            _executors[executor_name] = executor_class()
+        return _executors[executor_name]
+
+def _get_worker_token():
+    from django.contrib.auth.models import User
+    from django.db import IntegrityError
+    from rest_framework.authtoken.models import Token
+
+    if not get_setting('LOGIN_REQUIRED'):
+        return None
+    try:
+        loom_user = User.objects.create(username='loom-system')
+    except IntegrityError:
+        loom_user = User.objects.get(username='loom-system')
+    try:
+        return Token.objects.get(user=loom_user).key
+    except Token.DoesNotExist:
+        return Token.objects.create(user=loom_user).key
+
+def _get_resources(task_attempt):
+    resources = task_attempt.task.run.template.resources
+    if not resources:
+        return {}
+    return resources
+
+def _fail_launch(task_attempt, terminal_output):
+    msg = "Failed to launch worker process for TaskAttempt %s" \
+          % task_attempt.uuid
+    task_attempt.add_event(msg,
+                           detail=terminal_output,
+                           is_error=True)
+    task_attempt.fail(detail="Failed to launch worker process")
+
+
+class AnsibleExecutor(object):
+    """Runs the RUN_TASK_ATTEMPT_PLAYBOOK and CLEANUP_TASK_ATTEMPT_PLAYBOOK
+    with ansible-playbook for each TaskAttempt
+    """
+
+    def run(self, task_attempt):
+        token = _get_worker_token()
+        resources = _get_resources(task_attempt)
+        disk_size = str(resources.get('disk_size', ''))
+        cores = str(resources.get('cores', ''))
+        memory = str(resources.get('memory', ''))
+        docker_image = task_attempt.task.run.template.environment.get(
+            'docker_image')
+        name = task_attempt.task.run.name
+
+        new_vars = {'LOOM_TASK_ATTEMPT_ID': str(task_attempt.uuid),
+                    'LOOM_TASK_ATTEMPT_DOCKER_IMAGE': docker_image,
+                    'LOOM_TASK_ATTEMPT_STEP_NAME': name,
+        }
+        if token:
+            new_vars['LOOM_TOKEN'] = token
+        if cores:
+            new_vars['LOOM_TASK_ATTEMPT_CORES'] = cores
+        if disk_size:
+            new_vars['LOOM_TASK_ATTEMPT_DISK_SIZE_GB'] = disk_size
+        if memory:
+            new_vars['LOOM_TASK_ATTEMPT_MEMORY'] = memory
+
+        p = subprocess.Popen(
+            self._get_cmd_list(get_setting('RUN_TASK_ATTEMPT_PLAYBOOK')),
+            env=self._get_env(new_vars),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT)
+        terminal_output = ''
+        for line in iter(p.stdout.readline, ''):
+            terminal_output += line
+            print line.strip()
+        p.wait()
+        if p.returncode != 0:
+            logger.error('AnsibleExecutor.run failed for '\
+                         'task_attempt.uuid="%s" with returncode="%s".'
+                         % (task_attempt.uuid, p.returncode))
+            _fail_launch(task_attempt, terminal_output)
+
+    def cleanup(self, task_attempt):
+        new_vars = {'LOOM_TASK_ATTEMPT_ID': str(task_attempt.uuid),
+                    'LOOM_TASK_ATTEMPT_STEP_NAME':
+                    task_attempt.task.run.name,
+        }
+        p = subprocess.Popen(
+            self._get_cmd_list(get_setting('CLEANUP_TASK_ATTEMPT_PLAYBOOK')),
+            env=self._get_env(new_vars),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT)
+        terminal_output, err_is_empty = p.communicate()
+        if p.returncode != 0:
+            msg = 'Cleanup failed for task_attempt.uuid="%s" with '\
+                  'returncode="%s".' % (task_attempt.uuid, p.returncode)
+            logger.error(msg)
+            task_attempt.add_event(msg,
+                                   detail=terminal_output,
+                                   is_error=True)
+            raise Exception(msg)
+
+    def _get_cmd_list(self, playbook_name):
+        playbook = os.path.join(get_setting('PLAYBOOK_PATH'), playbook_name)
+        cmd_list = ['ansible-playbook',
+                    '-i', get_setting('ANSIBLE_INVENTORY'),
+                    playbook,
+                    # Without this, ansible uses /usr/bin/python,
+                    # which may be missing needed modules
+                    '-e', 'ansible_python_interpreter="/usr/bin/env python"',
+        ]
+        if get_setting('DEBUG'):
+            cmd_list.append('-vvvv')
+        return cmd_list
+
+    def _get_env(self, new_vars):
+        env = copy.copy(os.environ)
+        env.update(new_vars)
+        return env
+
+
+class LocalExecutor(object):
+    """Runs loom-task-monitor for each TaskAttempt as a child process.
+    Attempts wait in run() until enough cores and memory are free.
+    A request larger than the whole pool is reduced to the pool size,
+    so it runs alone rather than waiting forever.
+    """
+
+    TASK_MONITOR_COMMAND = 'loom-task-monitor'
+    DOCKER_COMMAND = 'docker'
+    DEFAULT_CORES = 1
+    DEFAULT_MEMORY_GB = 1
+
+    def __init__(self, max_cores=None, max_memory_gb=None):
+        if max_cores is None:
+            max_cores = get_setting('LOCAL_EXECUTOR_MAX_CORES', required=False)
+        if max_memory_gb is None:
+            max_memory_gb = get_setting(
+                'LOCAL_EXECUTOR_MAX_MEMORY_GB', required=False)
+        self.max_cores = int(max_cores or multiprocessing.cpu_count())
+        self.max_memory_gb = float(max_memory_gb or _get_total_memory_gb())
+        self.cores_in_use = 0
+        self.memory_gb_in_use = 0
+        self.processes = {}
+        self.killed = set()
+        self.condition = threading.Condition()
+
+    def run(self, task_attempt):
+        cores, memory_gb = self._get_request(task_attempt)
+        self._reserve(cores, memory_gb)
+        task_attempt_id = str(task_attempt.uuid)
+        try:
+            p = subprocess.Popen(
+                self._get_cmd_list(task_attempt_id),
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT)
+            with self.condition:
+                self.processes[task_attempt_id] = p
+            terminal_output = ''
+            for line in iter(p.stdout.readline, ''):
+                terminal_output += line
+                print line.strip()
+            p.wait()
+        finally:
+            with self.condition:
+                self.processes.pop(task_attempt_id, None)
+                was_killed = task_attempt_id in self.killed
+                self.killed.discard(task_attempt_id)
+            self._release(cores, memory_gb)
+        if p.returncode != 0 and not was_killed:
+            logger.error('LocalExecutor.run failed for '\
+                         'task_attempt.uuid="%s" with returncode="%s".'
+                         % (task_attempt.uuid, p.returncode))
+            _fail_launch(task_attempt, terminal_output)
+
+    def cleanup(self, task_attempt):
+        # Cleanup may run in a different async worker process than the
+        # monitor, so the analysis container is removed by its name.
+        # A monitor still running in this process is stopped as well,
+        # and removes its container on SIGTERM.
+        task_attempt_id = str(task_attempt.uuid)
+        with self.condition:
+            p = self.processes.get(task_attempt_id)
+            if p is not None and p.poll() is None:
+                self.killed.add(task_attempt_id)
+            else:
+                p = None
+        if p is not None:
+            p.terminate()
+        p = subprocess.Popen(
+            self._get_remove_container_cmd_list(task_attempt_id),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT)
+        terminal_output, err_is_empty = p.communicate()
+        # The monitor usually removed the container already
+        if p.returncode != 0 and 'No such container' not in terminal_output:
+            msg = 'Cleanup failed for task_attempt.uuid="%s" with '\
+                  'returncode="%s".' % (task_attempt.uuid, p.returncode)
+            logger.error(msg)
+            task_attempt.add_event(msg,
+                                   detail=terminal_output,
+                                   is_error=True)
+            raise Exception(msg)
+
+    def get_stats(self):
+        with self.condition:
+            return {
+                'max_cores': self.max_cores,
+                'max_memory_gb': self.max_memory_gb,
+                'cores_in_use': self.cores_in_use,
+                'memory_gb_in_use': self.memory_gb_in_use,
+                'running': len(self.processes),
+            }
+
+    def _get_request(self, task_attempt):
+        resources = _get_resources(task_attempt)
+        cores = int(resources.get('cores') or self.DEFAULT_CORES)
+        memory_gb = float(resources.get('memory') or self.DEFAULT_MEMORY_GB)
+        return min(cores, self.max_cores), min(memory_gb, self.max_memory_gb)
+
+    def _reserve(self, cores, memory_gb):
+        with self.condition:
+            while self.cores_in_use + cores > self.max_cores \
+                  or self.memory_gb_in_use + memory_gb > self.max_memory_gb:
+                self.condition.wait()
+            self.cores_in_use += cores
+            self.memory_gb_in_use += memory_gb
+
+    def _release(self, cores, memory_gb):
+        with self.condition:
+            self.cores_in_use -= cores
+            self.memory_gb_in_use -= memory_gb
+            self.condition.notify_all()
+
+    def _get_remove_container_cmd_list(self, task_attempt_id):
+        # Same name the monitor gives the container
+        return [self.DOCKER_COMMAND, 'rm', '-f', '%s-attempt-%s' % (
+            get_setting('SERVER_NAME'), task_attempt_id)]
+
+    def _get_cmd_list(self, task_attempt_id):
+        cmd_list = [self.TASK_MONITOR_COMMAND,
+                    '--task_attempt_id', task_attempt_id,
+                    '--server_url', get_setting('SERVER_URL_FOR_WORKER'),
+                    '--log_level', get_setting('LOG_LEVEL'),
+        ]
+        token = _get_worker_token()
+        if token:
+            cmd_list.extend(['--token', token])
+        return cmd_list
+
+
+def _get_total_memory_gb():
+    return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') \
+        / float(1024**3)
+
+
+EXECUTORS = {
+    'ansible': AnsibleExecutor,
+    'local': LocalExecutor,
+}
+_executors = {}
+_executors_lock = threading.Lock()
@@ -0,0 +1,110 @@
+from django.core.cache import caches
+from django.db.models import Case, DateTimeField, F, Value, When
+from django.utils import timezone
+import threading
+
+from api import get_setting
+
+
+"""Heartbeat stores record when each running TaskAttempt last checked in.
+Set LOOM_HEARTBEAT_STORE to choose one.
+
+"database" writes last_heartbeat with a single-column UPDATE for each beat.
+
+"cache" writes beats to the "heartbeats" cache and copies them into
+last_heartbeat in batches, every HEARTBEAT_FLUSH_INTERVAL_SECONDS and
+before stalled tasks are checked. The cache must be shared by every
+server and async worker process, e.g. memcached.
+"""
+
+
+def get_heartbeat_store():
+    store_name = get_setting('HEARTBEAT_STORE')
+    try:
+        store_class = HEARTBEAT_STORES[store_name]
+    except KeyError:
+        raise Exception('Invalid value for HEARTBEAT_STORE: "%s". Expected '\
+                        'one of %s' % (
+                            store_name, ', '.join(sorted(HEARTBEAT_STORES))))
+    with _stores_lock:
+        if store_name not in _stores:
+            _stores[store_name] = store_class()
+        return _stores[store_name]
+
+
+class DatabaseHeartbeatStore(object):
+
+    def beat(self, task_attempt_uuid):
+        from api.models.task_attempts import TaskAttempt
+        now = timezone.now()
+        # No version check and no full save. A heartbeat cannot conflict
+        # with other changes to the TaskAttempt.
+        TaskAttempt.objects.filter(uuid=task_attempt_uuid)\
+                           .update(last_heartbeat=now)
+        return now
+
+    def get_last_heartbeat(self, task_attempt):
+        return task_attempt.last_heartbeat
+
+    def flush(self):
+        pass
+
+
+class CacheHeartbeatStore(object):
+
+    KEY_PREFIX = 'heartbeat-'
+
+    def __init__(self):
+        self.cache = caches['heartbeats']
+
+    def _get_key(self, task_attempt_uuid):
+        return self.KEY_PREFIX + task_attempt_uuid
+
+    def beat(self, task_attempt_uuid):
+        now = timezone.now()
+        # Keep beats long enough to survive a missed flush. Expired beats
+        # belong to attempts that are already past the timeout.
+        timeout = 2 * int(get_setting('TASKRUNNER_HEARTBEAT_TIMEOUT_SECONDS'))
+        self.cache.set(self._get_key(task_attempt_uuid), now, timeout)
+        return now
+
+    def get_last_heartbeat(self, task_attempt):
+        cached = self.cache.get(self._get_key(task_attempt.uuid))
+        if cached is None:
+            return task_attempt.last_heartbeat
+        return max(cached, task_attempt.last_heartbeat)
+
+    def flush(self, query_size=500):
+        """Copy beats for all running TaskAttempts into last_heartbeat,
+        with one UPDATE per batch
+        """
+        from api.models.task_attempts import TaskAttempt
+        task_attempt_uuids = list(
+            TaskAttempt.objects.filter(status_is_running=True)\
+                               .values_list('uuid', flat=True))
+        for i in range(0, len(task_attempt_uuids), query_size):
+            keys = [self._get_key(uuid) for uuid
+                    in task_attempt_uuids[i:i+query_size]]
+            beats = self.cache.get_many(keys)
+            if not beats:
+                continue
+            whens = [
+                # Never move a heartbeat backwards
+                When(uuid=key[len(self.KEY_PREFIX):],
+                     last_heartbeat__lt=value,
+                     then=Value(value))
+                for key, value in beats.items()]
+            TaskAttempt.objects.filter(
+                uuid__in=[key[len(self.KEY_PREFIX):] for key in beats])\
+                               .update(last_heartbeat=Case(
+                                   *whens,
+                                   default=F('last_heartbeat'),
+                                   output_field=DateTimeField()))
+
+
+HEARTBEAT_STORES = {
+    'database': DatabaseHeartbeatStore,
+    'cache': CacheHeartbeatStore,
+}
+_stores = {}
+_stores_lock = threading.Lock()
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from api.models import FileResource
+
+"""Deletes files in content-addressed storage (LOOM_STORAGE_CONTENT_ADDRESSED)
+that no FileResource references. This also runs every
+LOOM_BLOB_GC_INTERVAL_HOURS.
+
+./manage.py collect_unreferenced_blobs --dry-run
+"""
+
+class Command(BaseCommand):
+    help = 'Delete unreferenced files from content-addressed storage'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='list files that would be deleted '\
+                            'without deleting them')
+
+    def handle(self, *args, **options):
+        paths = FileResource.collect_unreferenced_blobs(
+            dry_run=options['dry_run'])
+        for path in paths:
+            print path
+        if options['dry_run']:
+            print "Found %s unreferenced files" % len(paths)
+        else:
+            print "Deleted %s unreferenced files" % len(paths)
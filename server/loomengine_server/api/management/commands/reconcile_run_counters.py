@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+
+from api.models import Run
+
+"""Runs check for completion with counters of expected and finished Tasks
+and steps. This recomputes the counters from scratch, e.g. after an upgrade
+or after a worker died between creating Tasks and counting them.
+
+./manage.py reconcile_run_counters --finish
+"""
+
+class Command(BaseCommand):
+    help = 'Recompute completion counters on active Runs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='include Runs that already have a '\
+                            'terminal status')
+        parser.add_argument('--finish', action='store_true',
+                            help='finish Runs whose recomputed counters '\
+                            'show that all Tasks or steps are finished')
+
+    def handle(self, *args, **options):
+        runs = Run.objects.all()
+        if not options['all']:
+            runs = runs.filter(status_is_finished=False,
+                               status_is_failed=False,
+                               status_is_killed=False)
+        # Deepest first, so that steps are finished before their
+        # parents are counted
+        run_ids = list(runs.order_by('-level').values_list('id', flat=True))
+        changed = 0
+        finished = 0
+        for run_id in run_ids:
+            run = Run.objects.get(id=run_id)
+            if run.reconcile_counters():
+                changed += 1
+            if options['finish'] and not run.has_terminal_status() \
+               and run.are_counters_complete():
+                run.finish()
+                finished += 1
+        print "Checked %s runs, corrected counters on %s, finished %s" % (
+            len(run_ids), changed, finished)
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-18 20:37
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import hashlib
+import json
+
+
+def get_data_path_hash(data_path):
+    # Same as Task.get_data_path_hash
+    canonical_path = [[int(index), int(degree)]
+                      for index, degree in data_path or []]
+    return hashlib.md5(
+        json.dumps(canonical_path, separators=(',',':'))).hexdigest()
+
+def set_data_path_hash(apps, schema_editor):
+    # Duplicate tasks may exist from concurrent pushes. Only the first
+    # one gets a hash. The rest keep NULL, which the constraint ignores.
+    Task = apps.get_model('api', 'Task')
+    seen = set()
+    for task in Task.objects.order_by('id').only('id', 'run', 'data_path'):
+        data_path_hash = get_data_path_hash(task.data_path)
+        if (task.run_id, data_path_hash) in seen:
+            continue
+        seen.add((task.run_id, data_path_hash))
+        Task.objects.filter(id=task.id).update(data_path_hash=data_path_hash)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_fix_notification_context'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='data_path_hash',
+            field=models.CharField(blank=True, editable=False, max_length=255, null=True),
+        ),
+        migrations.RunPython(set_data_path_hash, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='task',
+            unique_together=set([('run', 'data_path_hash')]),
+        ),
+    ]
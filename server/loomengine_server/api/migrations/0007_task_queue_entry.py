@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-18 20:58
+from __future__ import unicode_literals
+
+import api.models.base
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_task_data_path_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskQueueEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('_change', models.IntegerField(default=0)),
+                ('cores', models.IntegerField()),
+                ('memory', models.IntegerField()),
+                ('disk_size', models.IntegerField()),
+                ('priority', models.IntegerField(default=0)),
+                ('datetime_queued', models.DateTimeField(default=django.utils.timezone.now, editable=False)),
+                ('datetime_admitted', models.DateTimeField(blank=True, null=True)),
+                ('task', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='queue_entry', to='api.Task')),
+            ],
+            bases=(models.Model, api.models.base._FilterMixin),
+        ),
+        migrations.AlterIndexTogether(
+            name='taskqueueentry',
+            index_together=set([('datetime_admitted', 'priority', 'datetime_queued')]),
+        ),
+    ]
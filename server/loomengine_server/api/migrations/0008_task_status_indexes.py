@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-18 21:01
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_task_queue_entry'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='task',
+            index_together=set([('status_is_running', 'datetime_created')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='taskattempt',
+            index_together=set([('status_is_running', 'last_heartbeat'), ('status_is_running', 'status_is_cleaned_up', 'status_is_failed')]),
+        ),
+    ]
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-18 21:06
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def get_expected_task_count(data_paths):
+    # Same as Run.get_expected_task_count
+    expected = 1
+    seen = set()
+    for data_path in data_paths:
+        for i in range(len(data_path)):
+            branch = tuple([(int(index), int(degree))
+                            for index, degree in data_path[:i]])
+            if branch in seen:
+                continue
+            seen.add(branch)
+            expected += int(data_path[i][1]) - 1
+    return expected
+
+def set_counters(apps, schema_editor):
+    Run = apps.get_model('api', 'Run')
+    for run in Run.objects.all():
+        if run.is_leaf:
+            data_paths = [task.data_path for task
+                          in run.tasks.only('data_path')]
+            Run.objects.filter(id=run.id).update(
+                expected_task_count=get_expected_task_count(data_paths)
+                if data_paths else None,
+                finished_task_count=run.tasks.filter(
+                    status_is_finished=True).count())
+        else:
+            Run.objects.filter(id=run.id).update(
+                expected_step_count=run.template.steps.count()
+                if run.template else run.steps.count(),
+                finished_step_count=run.steps.filter(
+                    status_is_finished=True).count())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_task_status_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='run',
+            name='expected_step_count',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='run',
+            name='expected_task_count',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='run',
+            name='finished_step_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='run',
+            name='finished_task_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(set_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-18 21:10
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_run_completion_counters'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='dataobject',
+            index_together=set([('datetime_created', 'id')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='run',
+            index_together=set([('datetime_created', 'id')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='template',
+            index_together=set([('datetime_created', 'id')]),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-18 21:12
+from __future__ import unicode_literals
+
+import api.models.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_index_datetime_created'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='fileresource',
+            name='filename',
+            field=models.CharField(db_index=True, max_length=255, validators=[api.models.validators.validate_filename]),
+        ),
+        migrations.AlterField(
+            model_name='fileresource',
+            name='md5',
+            field=models.CharField(db_index=True, max_length=32, validators=[api.models.validators.validate_md5]),
+        ),
+    ]
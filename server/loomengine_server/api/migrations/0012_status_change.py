@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-18 21:19
+from __future__ import unicode_literals
+
+import api.models.base
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_file_resource_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatusChange',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('_change', models.IntegerField(default=0)),
+                ('object_type', models.CharField(choices=[(b'run', b'run'), (b'task', b'task'), (b'task_attempt', b'task_attempt')], max_length=255)),
+                ('uuid', models.CharField(max_length=255)),
+                ('status', models.CharField(blank=True, max_length=255)),
+                ('event', models.CharField(blank=True, max_length=255)),
+                ('detail', models.TextField(blank=True)),
+                ('is_error', models.BooleanField(default=False)),
+                ('timestamp', models.DateTimeField(db_index=True, default=django.utils.timezone.now, editable=False)),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='status_changes', to='api.Run')),
+            ],
+            options={
+                'abstract': False,
+            },
+            bases=(models.Model, api.models.base._FilterMixin),
+        ),
+    ]
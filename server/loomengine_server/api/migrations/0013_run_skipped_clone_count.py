@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-18 21:48
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_status_change'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='run',
+            name='skipped_clone_count',
+            field=models.IntegerField(default=0),
+        ),
+    ]
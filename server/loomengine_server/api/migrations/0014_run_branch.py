@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-18 21:52
+from __future__ import unicode_literals
+
+import api.models.base
+from django.db import migrations, models
+import django.db.models.deletion
+import hashlib
+import json
+
+
+def get_data_path_hash(data_path):
+    # Same as Task.get_data_path_hash
+    canonical_path = [[int(index), int(degree)]
+                      for index, degree in data_path or []]
+    return hashlib.md5(
+        json.dumps(canonical_path, separators=(',',':'))).hexdigest()
+
+def add_branches(apps, schema_editor):
+    # Branches of Tasks created before this migration, so that later
+    # pushes do not count them again
+    Run = apps.get_model('api', 'Run')
+    RunBranch = apps.get_model('api', 'RunBranch')
+    for run in Run.objects.filter(tasks__isnull=False).distinct():
+        path_hashes = set()
+        for task in run.tasks.only('data_path'):
+            for i in range(len(task.data_path)):
+                path_hashes.add(get_data_path_hash(task.data_path[:i]))
+        RunBranch.objects.bulk_create(
+            [RunBranch(run=run, path_hash=path_hash)
+             for path_hash in path_hashes])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_run_skipped_clone_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RunBranch',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('_change', models.IntegerField(default=0)),
+                ('path_hash', models.CharField(max_length=255)),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='branches', to='api.Run')),
+            ],
+            bases=(models.Model, api.models.base._FilterMixin),
+        ),
+        migrations.AlterUniqueTogether(
+            name='runbranch',
+            unique_together=set([('run', 'path_hash')]),
+        ),
+        migrations.RunPython(add_branches, migrations.RunPython.noop),
+    ]
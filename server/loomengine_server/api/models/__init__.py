@@ -1,16 +1,70 @@
+import collections
 import jinja2
+import threading
 import uuid
 
+from api import get_setting
+
 def uuidstr():
     return str(uuid.uuid4())
 
+
+class TemplateCache(object):
+    """Process-wide LRU cache of compiled jinja templates, keyed by
+    source text. Compiling a template costs much more than rendering it,
+    and the same command is rendered for every Task in a parallel Run.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._templates = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._environment = jinja2.Environment(
+            undefined=jinja2.StrictUndefined)
+
+    @property
+    def max_size(self):
+        return get_setting('TEMPLATE_CACHE_SIZE')
+
+    def get_template(self, raw_text):
+        with self._lock:
+            template = self._templates.pop(raw_text, None)
+            if template is not None:
+                self.hits += 1
+                # Re-insert to mark as most recently used
+                self._templates[raw_text] = template
+                return template
+            self.misses += 1
+        # Compile outside the lock. Syntax errors are raised, not cached.
+        template = self._environment.from_string(raw_text)
+        with self._lock:
+            self._templates[raw_text] = template
+            while len(self._templates) > max(self.max_size, 0):
+                self._templates.popitem(last=False)
+        return template
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._templates),
+                'max_size': self.max_size,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._templates.clear()
+            self.hits = 0
+            self.misses = 0
+
+template_cache = TemplateCache()
+
 def render_from_template(raw_text, context):
     if not raw_text:
 	return ''
-    loader = jinja2.DictLoader({'template': raw_text})
-    env = jinja2.Environment(loader=loader, undefined=jinja2.StrictUndefined)
-    template = env.get_template('template')
-    return template.render(**context)
+    return template_cache.get_template(raw_text).render(**context)
 
 def render_string_or_list(value, context):
     if isinstance(value, list):
@@ -125,7 +179,9 @@ from .data_objects import *
 from .data_nodes import *
 from .labels import *
 from .runs import *
+from .status_changes import *
 from .tags import *
 from .task_attempts import *
+from .task_queue import *
 from .tasks import *
 from .templates import *
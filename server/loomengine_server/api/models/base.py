@@ -1,3 +1,4 @@
+import bisect
 import django.db.utils
 from django.db import models, transaction
 import re
@@ -68,6 +69,61 @@ class FilterHelper(object):
             filter_args[self.Model.TAG_FIELD] = tag
         return self.Model.objects.filter(**filter_args)
 
+    def resolve_identifiers(self, query_strings, query_size=200):
+        """Find matches for many identifiers of the form accepted by
+        filter_by_name_or_id_or_tag_or_hash, with one query per
+        query_size identifiers instead of several per identifier.
+        Returns a dict of {query_string: [(id, name, uuid), ...]}.
+
+        Each query selects candidates by the most selective part of each
+        identifier: uuid prefix, then hash prefix, then name, then tag.
+        Candidates are then checked against every part in memory.
+        """
+        parsed = {}
+        for query_string in set(query_strings):
+            parsed[query_string] = \
+                self._parse_as_name_or_id_or_tag_or_hash(query_string)
+        query_strings = sorted(parsed.keys())
+        matches = {}
+        for i in range(0, len(query_strings), query_size):
+            chunk = query_strings[i:i+query_size]
+            candidates = self._get_candidates(
+                [parsed[query_string] for query_string in chunk])
+            for query_string in chunk:
+                matches[query_string] = candidates.match(
+                    *parsed[query_string])
+        return matches
+
+    def _get_candidates(self, parsed_identifiers):
+        names = set()
+        tags = set()
+        prefix_filter = models.Q()
+        for name, uuid, tag, hash_value in parsed_identifiers:
+            if uuid is not None:
+                prefix_filter |= models.Q(
+                    **{self.Model.ID_FIELD+'__startswith': uuid})
+            elif hash_value is not None:
+                prefix_filter |= models.Q(
+                    **{self.Model.HASH_FIELD+'__startswith': hash_value})
+            elif name is not None:
+                names.add(name)
+            elif tag is not None:
+                tags.add(tag)
+        candidate_filter = prefix_filter
+        if names:
+            candidate_filter |= models.Q(
+                **{self.Model.NAME_FIELD+'__in': names})
+        if tags:
+            candidate_filter |= models.Q(
+                **{self.Model.TAG_FIELD+'__in': tags})
+        if not candidate_filter:
+            return _Candidates([])
+        # One row per tag. Rows for untagged objects have tag None.
+        rows = self.Model.objects.filter(candidate_filter).values_list(
+            'id', self.Model.NAME_FIELD, self.Model.ID_FIELD,
+            self.Model.HASH_FIELD, self.Model.TAG_FIELD)
+        return _Candidates(rows)
+
     def _parse_as_name_or_id_or_tag_or_hash(self, query_string):
         name = None
         uuid = None
@@ -102,6 +158,63 @@ class FilterHelper(object):
         return name, uuid, tag
 
 
+class _Candidates(object):
+    """Objects that may match a batch of identifiers, indexed for lookup
+    by name, tag, and uuid or hash prefix
+    """
+
+    def __init__(self, rows):
+        self.objects = {}
+        for id, name, uuid, hash_value, tag in rows:
+            if id not in self.objects:
+                self.objects[id] = {'id': id, 'name': name, 'uuid': uuid,
+                                    'hash': hash_value, 'tags': set()}
+            if tag is not None:
+                self.objects[id]['tags'].add(tag)
+        self.by_name = {}
+        self.by_tag = {}
+        for obj in self.objects.values():
+            self.by_name.setdefault(obj['name'], []).append(obj)
+            for tag in obj['tags']:
+                self.by_tag.setdefault(tag, []).append(obj)
+        # Prefixes match without regard to case, as in the database
+        self.by_uuid = sorted((obj['uuid'].lower(), obj['id'])
+                              for obj in self.objects.values())
+        self.by_hash = sorted(((obj['hash'] or '').lower(), obj['id'])
+                              for obj in self.objects.values())
+
+    def match(self, name, uuid, tag, hash_value):
+        if uuid is not None:
+            objects = self._get_by_prefix(self.by_uuid, uuid)
+        elif hash_value is not None:
+            objects = self._get_by_prefix(self.by_hash, hash_value)
+        elif name is not None:
+            objects = self.by_name.get(name, [])
+        elif tag is not None:
+            objects = self.by_tag.get(tag, [])
+        else:
+            objects = []
+        matches = [obj for obj in objects
+                   if (name is None or obj['name'] == name)
+                   and (uuid is None
+                        or obj['uuid'].lower().startswith(uuid.lower()))
+                   and (hash_value is None
+                        or (obj['hash'] or '').lower().startswith(
+                            hash_value.lower()))
+                   and (tag is None or tag in obj['tags'])]
+        return sorted([(obj['id'], obj['name'], obj['uuid'])
+                       for obj in matches])
+
+    def _get_by_prefix(self, index, prefix):
+        objects = []
+        prefix = prefix.lower()
+        i = bisect.bisect_left(index, (prefix,))
+        while i < len(index) and index[i][0].startswith(prefix):
+            objects.append(self.objects[index[i][1]])
+            i += 1
+        return objects
+
+
 class _FilterMixin(object):
 
     NAME_FIELD = None
@@ -118,6 +231,11 @@ class _FilterMixin(object):
         helper = FilterHelper(cls)
         return helper.filter_by_name_or_id_or_tag(filter_string)
 
+    @classmethod
+    def resolve_identifiers(cls, query_strings):
+        helper = FilterHelper(cls)
+        return helper.resolve_identifiers(query_strings)
+
 
 class BaseModel(models.Model, _FilterMixin):
     _change = models.IntegerField(default=0)
@@ -145,11 +263,46 @@ class BaseModel(models.Model, _FilterMixin):
         max_retries=3
         while True:
             try:
-                return super(BaseModel, self).save(*args, **kwargs)
+                result = super(BaseModel, self).save(*args, **kwargs)
+                break
             except django.db.utils.OperationalError:
                 if count >= max_retries:
                     raise
                 count += 1
+        self.after_save()
+        return result
+
+    def after_save(self):
+        """Called after each save. Cached views of this object are keyed
+        on _change and expire by themselves. Override this if the object
+        also appears in cached views of other objects, or to record a
+        StatusChange.
+        """
+        pass
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(BaseModel, cls).from_db(db, field_names, values)
+        # Status flags as loaded, for has_new_status
+        instance._saved_status = dict(
+            [(name, value) for name, value in zip(field_names, values)
+             if name.startswith('status_is_')])
+        return instance
+
+    def has_new_status(self):
+        """True if the status_is_* fields changed since the object was
+        loaded or this was last called, or if it was never loaded.
+        Call from after_save to act only on status transitions.
+        """
+        deferred = self.get_deferred_fields()
+        status = dict(
+            [(field.attname, getattr(self, field.attname))
+             for field in self._meta.concrete_fields
+             if field.attname.startswith('status_is_')
+             and field.attname not in deferred])
+        saved_status = getattr(self, '_saved_status', None)
+        self._saved_status = status
+        return status != saved_status
 
     def setattrs_and_save_with_retries(self, assignments, max_retries=5):
         """
@@ -177,3 +330,39 @@ class BaseModel(models.Model, _FilterMixin):
                 obj = self.__class__.objects.get(id=self.id)
                 continue
             return obj
+
+    @classmethod
+    def bulk_setattrs(cls, queryset, assignments, query_size=500):
+        """
+        Apply assignments to every row in queryset with set-based UPDATEs
+        instead of a full_clean and save per object. _change is incremented
+        as in save, so a concurrent save of one of these rows raises
+        ConcurrentModificationError and retries against the new values.
+        Rows are locked while they are read and updated.
+        Returns the ids of the updated rows.
+        """
+        with transaction.atomic():
+            ids = list(queryset.select_for_update().values_list(
+                'id', flat=True))
+            for i in range(0, len(ids), query_size):
+                cls.objects.filter(id__in=ids[i:i+query_size]).update(
+                    _change=models.F('_change')+1, **assignments)
+        return ids
+
+    @classmethod
+    def bulk_create_with_ids(cls, models, query_size=500):
+        """
+        bulk_create doesn't set primary keys on SQLite or MySQL, so look
+        them up by uuid and assign them to the new models.
+        Lookups are chunked to stay below SQLite's limit on query variables.
+        """
+        cls.objects.bulk_create(models)
+        models_by_uuid = {model.uuid: model for model in models}
+        uuids = models_by_uuid.keys()
+        for i in range(0, len(uuids), query_size):
+            for uuid, id in cls.objects.filter(
+                    uuid__in=uuids[i:i+query_size]).values_list('uuid', 'id'):
+                models_by_uuid[uuid].id = id
+        for model in models:
+            model._state.adding = False
+        return models
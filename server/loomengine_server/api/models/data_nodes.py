@@ -1,6 +1,8 @@
 import copy
 from django.core.exceptions import ObjectDoesNotExist
-from django.db import models
+from django.db import models, transaction
+import itertools
+from mptt.utils import get_cached_trees
 from .async_safe_mptt import AsyncSafeMPTTModel, TreeForeignKey
 
 from .base import BaseModel
@@ -119,6 +121,171 @@ class DataNode(AsyncSafeMPTTModel, BaseModel):
             data_node.save()
             return data_node
 
+    @classmethod
+    def create_tree(cls, contents, data_type):
+        """Creates a new tree from 'contents', which is a DataObject
+        or a list of [lists of]^n DataObjects. An empty list is a branch
+        of degree 0.
+
+        Adding leaves one at a time with add_data_object costs several
+        queries per node and rewrites MPTT fields as the tree grows.
+        Since the whole tree is known up front, we assign lft/rght/level
+        in memory and write each level of the tree with one bulk insert.
+        """
+        return cls.create_trees([(contents, data_type)])[0]
+
+    @classmethod
+    def create_trees(cls, trees):
+        """Same as create_tree, for a list of (contents, data_type).
+        Levels of all trees are written together.
+        """
+        levels = []
+        roots = []
+        for contents, data_type in trees:
+            tree_id = cls._tree_manager._get_next_tree_id()
+            root = cls._build_unsaved_tree(
+                contents, data_type, tree_id, levels, itertools.count(1))
+            # Skip uniqueness and foreign key checks, which cost a query
+            # each. uuids are new and DataObjects are already saved.
+            root.clean_fields(exclude=['parent', 'data_object'])
+            roots.append(root)
+        with transaction.atomic():
+            cls._bulk_insert_levels(levels)
+        return roots
+
+    @classmethod
+    def _bulk_insert_levels(cls, levels):
+        # 'levels' is a list of lists of unsaved nodes, where parents
+        # are either saved already or in the preceding level.
+        for level in levels:
+            for node in level:
+                if node.parent is not None:
+                    node.parent_id = node.parent.id
+            cls.bulk_create_with_ids(level)
+        for level in levels:
+            for node in level:
+                node._mptt_saved = True
+                cls._mptt_meta.update_mptt_cached_fields(node)
+
+    @classmethod
+    def _build_unsaved_tree(cls, contents, data_type, tree_id, levels,
+                            counter, parent=None, index=None, level=0):
+        if len(levels) <= level:
+            levels.append([])
+        data_node = cls(type=data_type,
+                        parent=parent,
+                        index=index,
+                        tree_id=tree_id,
+                        level=level,
+                        lft=next(counter))
+        data_node._cached_children = []
+        levels[level].append(data_node)
+        if isinstance(contents, list):
+            data_node.degree = len(contents)
+            for i in range(len(contents)):
+                data_node._cached_children.append(cls._build_unsaved_tree(
+                    contents[i], data_type, tree_id, levels, counter,
+                    parent=data_node, index=i, level=level+1))
+        else:
+            assert contents.type == data_type, 'data type mismatch'
+            data_node.data_object = contents
+        data_node.rght = next(counter)
+        return data_node
+
+    def get_or_create_nodes(self, data_paths):
+        """Same as get_or_create_node, for a list of data_paths.
+        Missing nodes are written with a few bulk inserts.
+        """
+        tree = self.get_cached_tree()
+        nodes = []
+        new_branches = {} # key is id of saved parent, value is list of new nodes
+        new_degrees = {} # key is id of saved node, value is its new degree
+        for data_path in data_paths:
+            nodes.append(tree._get_or_add_unsaved_node(
+                copy.deepcopy(data_path), new_branches, new_degrees))
+        if new_degrees.pop(tree.id, None) is not None:
+            self.setattrs_and_save_with_retries({'degree': tree.degree})
+        with transaction.atomic():
+            for node_id, degree in new_degrees.iteritems():
+                DataNode.objects.filter(id=node_id).update(degree=degree)
+            for parent_id, branches in new_branches.iteritems():
+                self._insert_branches(parent_id, branches)
+        if new_branches:
+            # Space was made inside this node, so reload its tree fields
+            self.lft, self.rght = DataNode.objects.filter(id=self.id)\
+                                                  .values_list('lft', 'rght')\
+                                                  .get()
+        return nodes
+
+    def _get_or_add_unsaved_node(self, data_path, new_branches, new_degrees):
+        # Like _extend_to_data_path, but new nodes are only created in
+        # memory. New children of saved nodes are added to new_branches,
+        # and degrees set on saved nodes to new_degrees.
+        if not data_path:
+            return self
+        index, degree = data_path.pop(0)
+        if self.degree:
+            if not self.degree == degree:
+                raise DegreeMismatchException()
+        else:
+            self.degree = degree
+            if self.id is not None:
+                new_degrees[self.id] = degree
+        child = self._get_child_by_index(index)
+        if child is not None and data_path:
+            # A blank node has no degree yet and can still become a branch
+            if child.data_object_id is not None:
+                raise UnexpectedLeafNodeError('Expected branch but found leaf')
+            if child.degree is not None and child.degree != data_path[0][1]:
+                raise DegreeMismatchError(
+                    'Degree of branch conflicts with a value set previously')
+        if child is None:
+            child = DataNode(
+                parent=self,
+                index=index,
+                degree=data_path[0][1] if data_path else None,
+                type=self.type)
+            child._cached_children = []
+            self._cached_children.append(child)
+            self._get_cached_children_by_index()[index] = child
+            if self.id is not None:
+                new_branches.setdefault(self.id, []).append(child)
+        return child._get_or_add_unsaved_node(
+            data_path, new_branches, new_degrees)
+
+    @classmethod
+    def _insert_branches(cls, parent_id, branches):
+        # Make room to the right of the parent's last child,
+        # as mptt does when inserting one node, then write the new
+        # branches to that space. Reading the parent now and shifting with
+        # relative updates keeps this safe if the tree changed since
+        # it was cached.
+        parent = cls.objects.select_for_update().get(id=parent_id)
+        counter = itertools.count(parent.rght)
+        levels = []
+        for branch in branches:
+            cls._number_unsaved_nodes(branch, parent, counter, levels)
+        space = 2 * sum([len(level) for level in levels])
+        cls.objects.filter(tree_id=parent.tree_id, rght__gte=parent.rght)\
+                   .update(rght=models.F('rght') + space)
+        cls.objects.filter(tree_id=parent.tree_id, lft__gt=parent.rght)\
+                   .update(lft=models.F('lft') + space)
+        cls._bulk_insert_levels(levels)
+
+    @classmethod
+    def _number_unsaved_nodes(cls, data_node, parent, counter, levels,
+                              depth=0):
+        if len(levels) <= depth:
+            levels.append([])
+        levels[depth].append(data_node)
+        data_node.tree_id = parent.tree_id
+        data_node.level = parent.level + 1
+        data_node.lft = next(counter)
+        for child in data_node._cached_children:
+            cls._number_unsaved_nodes(
+                child, data_node, counter, levels, depth=depth+1)
+        data_node.rght = next(counter)
+
     def add_data_object(self, data_path, data_object):
         # 'data_path' is a list of (index, degree) pairs
         if not data_path:
@@ -154,13 +321,35 @@ class DataNode(AsyncSafeMPTTModel, BaseModel):
             seed_node = self.get_node(seed_path)
         except MissingBranchError:
             return []
+        # Load the subtree once, so that checking each path
+        # does not query the database node by node.
+        seed_node = seed_node.get_cached_tree()
         all_paths = seed_node._get_all_paths(seed_path, gather_depth)
         ready_data_nodes = []
         for path in all_paths:
-            if self.is_ready(data_path=path):
-                ready_data_nodes.append((path, self.get_node(path)))
+            try:
+                if len(path) >= len(seed_path):
+                    node = seed_node.get_node(path[len(seed_path):])
+                else:
+                    # Gathered above the seed node, so it is not in the cache
+                    node = self.get_node(path)
+            except MissingBranchError:
+                continue
+            if node.is_ready():
+                ready_data_nodes.append((path, node))
         return ready_data_nodes
 
+    def get_cached_tree(self):
+        """Returns a copy of this node with all descendants and their
+        DataObjects loaded into memory. get_node, is_ready, and other
+        lookups on the copy run without queries, but they will not see
+        changes saved after the tree was loaded.
+        """
+        descendants = self.get_descendants(include_self=True)
+        descendants = descendants.select_related('data_object')
+        descendants = descendants.select_related('data_object__file_resource')
+        return get_cached_trees(descendants)[0]
+
     def _get_all_paths(self, seed_path, gather_depth):
         if self.is_leaf:
             path = copy.copy(seed_path)
@@ -176,7 +365,7 @@ class DataNode(AsyncSafeMPTTModel, BaseModel):
             # Recursively get paths to leaf nodes
             paths = []
             last_paths = None
-            for child in self.children.all():
+            for child in self._get_children():
                 path = seed_path + [(child.index, self.degree),]
                 new_paths = child._get_all_paths(path, gather_depth)
                 if not new_paths == last_paths:
@@ -241,12 +430,26 @@ class DataNode(AsyncSafeMPTTModel, BaseModel):
 
     def _get_child_by_index(self, index):
         self._check_index(index)
+        if hasattr(self, '_cached_children'):
+            return self._get_cached_children_by_index().get(index)
         try:
             child = self.children.get(index=index)
         except ObjectDoesNotExist:
             child = None
         return child
 
+    def _get_cached_children_by_index(self):
+        if not hasattr(self, '_cached_children_by_index'):
+            self._cached_children_by_index = {
+                child.index: child for child in self._cached_children}
+        return self._cached_children_by_index
+
+    def _get_children(self):
+        # Use children loaded by get_cached_tree if present
+        if hasattr(self, '_cached_children'):
+            return self._cached_children
+        return self.children.all()
+
     def _get_branch_by_index(self, index, degree):
         branch = self._get_child_by_index(index)
         if branch is not None:
@@ -325,7 +528,8 @@ class DataNode(AsyncSafeMPTTModel, BaseModel):
             return self.data_object.substitution_value
         else:
             return [child.substitution_value for child
-                    in self.children.order_by('index')]
+                    in sorted(self._get_children(),
+                              key=lambda child: child.index)]
 
     @property
     def downstream_run_inputs(self):
@@ -389,6 +593,6 @@ class DataNode(AsyncSafeMPTTModel, BaseModel):
             return [self]
 
         leaves = []
-        for child in self.children.all():
+        for child in self._get_children():
             leaves.extend(child._get_leaves())
         return leaves
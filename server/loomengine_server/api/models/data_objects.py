@@ -3,6 +3,7 @@ from django.db import models
 from django.utils import timezone
 import jsonfield
 import os
+import time
 
 from .base import BaseModel
 from api import get_setting
@@ -47,6 +48,9 @@ class DataObject(BaseModel):
         default=timezone.now)
     data = jsonfield.JSONField(blank=True)
 
+    class Meta:
+        index_together = (('datetime_created', 'id'),)
+
     def clean(self):
         validators.DataObjectValidator.validate_model(self)
 
@@ -65,6 +69,21 @@ class DataObject(BaseModel):
             data_object.save()
             return data_object
 
+    @classmethod
+    def get_by_value_list(cls, values, type):
+        """ Same as get_by_value, for a list of values. Non-file DataObjects
+        are validated first and then written with a single bulk insert.
+        """
+        if type == 'file':
+            return cls._get_files_by_value_list(values)
+        data_objects = []
+        for value in values:
+            data_object = DataObject(data={
+                'value': cls._type_cast(value, type)}, type=type)
+            data_object.full_clean(validate_unique=False)
+            data_objects.append(data_object)
+        return cls.bulk_create_with_ids(data_objects)
+
     FALSE_VALUES = [False, 0, '', 'false', 'False', 'FALSE',
                     'f', 'F', 'no', 'No', 'NO', 'n', 'N', '0']
 
@@ -86,19 +105,37 @@ class DataObject(BaseModel):
     def _get_file_by_value(cls, value):
         """Look up a file DataObject by name, uuid, and/or md5.
         """
-        matches = FileResource.filter_by_name_or_id_or_tag_or_hash(value)
-        if matches.count() == 0:
-            raise ValidationError(
-                'No file found that matches value "%s"' % value)
-        elif matches.count() > 1:
-            match_id_list = ['%s@%s' % (match.filename, match.get_uuid())
-                             for match in matches]
-            match_id_string = ('", "'.join(match_id_list))
-            raise ValidationError(
-                'Multiple files were found matching value "%s": "%s". '\
-                'Use a more precise identifier to select just one file.' % (
-                    value, match_id_string))
-        return matches.first().data_object
+        return cls._get_files_by_value_list([value])[0]
+
+    @classmethod
+    def _get_files_by_value_list(cls, values, query_size=500):
+        """Look up file DataObjects by name, uuid, and/or md5 for
+        a list of values, with a few queries for the whole list.
+        """
+        matches = FileResource.resolve_identifiers(values)
+        file_resource_ids = []
+        for value in values:
+            value_matches = matches[value]
+            if len(value_matches) == 0:
+                raise ValidationError(
+                    'No file found that matches value "%s"' % value)
+            elif len(value_matches) > 1:
+                match_id_list = ['%s@%s' % (filename, uuid)
+                                 for id, filename, uuid in value_matches]
+                match_id_string = ('", "'.join(match_id_list))
+                raise ValidationError(
+                    'Multiple files were found matching value "%s": "%s". '\
+                    'Use a more precise identifier to select just one file.' % (
+                        value, match_id_string))
+            file_resource_ids.append(value_matches[0][0])
+        unique_ids = list(set(file_resource_ids))
+        data_objects = {}
+        for i in range(0, len(unique_ids), query_size):
+            for file_resource in FileResource.objects.filter(
+                    id__in=unique_ids[i:i+query_size])\
+                    .select_related('data_object'):
+                data_objects[file_resource.id] = file_resource.data_object
+        return [data_objects[id] for id in file_resource_ids]
 
     @property
     def _value_info(self):
@@ -157,11 +194,13 @@ class FileResource(BaseModel):
         related_name='file_resource',
         on_delete=models.PROTECT)
     filename = models.CharField(
-        max_length=255, validators=[validators.validate_filename])
+        max_length=255, db_index=True,
+        validators=[validators.validate_filename])
     file_url = models.TextField(
         validators=[validators.validate_url])
     md5 = models.CharField(
-        max_length=32, validators=[validators.validate_md5])
+        max_length=32, db_index=True,
+        validators=[validators.validate_md5])
     import_comments = models.TextField(blank=True)
     imported_from_url = models.TextField(
         blank=True,
@@ -174,6 +213,11 @@ class FileResource(BaseModel):
         max_length=16,
         choices=SOURCE_TYPE_CHOICES)
 
+    # Content-addressed files are stored under STORAGE_ROOT/BLOB_DIR
+    BLOB_DIR = 'blobs'
+    # Unreferenced blobs modified more recently are not collected
+    BLOB_GC_MIN_AGE_SECONDS = 3600
+
     @property
     def is_ready(self):
         return self.upload_status == 'complete'
@@ -186,7 +230,18 @@ class FileResource(BaseModel):
 
     @classmethod
     def initialize(cls, **kwargs):
-        if not kwargs.get('file_url'):
+        if not kwargs.get('file_url') and cls._is_content_addressed(
+                kwargs.get('source_type'), kwargs.get('md5')):
+            kwargs.pop('task_attempt', None)
+            kwargs['file_url'] = cls._add_url_prefix(
+                cls._get_blob_path(kwargs['md5']))
+            if cls.objects.filter(md5=kwargs['md5'],
+                                  file_url=kwargs['file_url'],
+                                  upload_status='complete').exists():
+                # Same content is already stored, so there is nothing
+                # to upload
+                kwargs['upload_status'] = 'complete'
+        elif not kwargs.get('file_url'):
             kwargs['file_url'] = cls._add_url_prefix(
                 cls._get_path_for_import(
                     kwargs.get('filename'),
@@ -206,6 +261,75 @@ class FileResource(BaseModel):
             filename, data_object.uuid, source_type))
         return os.path.join(*parts)
 
+    @classmethod
+    def _is_content_addressed(cls, source_type, md5):
+        return get_setting('STORAGE_CONTENT_ADDRESSED') \
+            and get_setting('STORAGE_TYPE').lower() == 'local' \
+            and source_type in ['imported', 'result'] \
+            and bool(md5)
+
+    @classmethod
+    def _get_blob_root(cls):
+        return os.path.join(cls._get_file_root(), cls.BLOB_DIR)
+
+    @classmethod
+    def _get_blob_path(cls, md5):
+        return os.path.join(cls._get_blob_root(), md5[0:2], md5[2:4], md5)
+
+    @classmethod
+    def collect_unreferenced_blobs(cls, dry_run=False, query_size=500):
+        """Delete files in content-addressed storage that no FileResource
+        references, including temporary files left by failed copies.
+        Returns the paths deleted, or the paths that would be deleted if
+        dry_run. Files are checked in chunks of query_size, just before
+        they are deleted, and recently modified files are skipped, since
+        they may be in use by a copy in progress.
+        """
+        deleted = []
+        paths = []
+        for path in cls._iter_old_blobs():
+            paths.append(path)
+            if len(paths) == query_size:
+                deleted.extend(cls._delete_unreferenced(paths, dry_run))
+                paths = []
+        deleted.extend(cls._delete_unreferenced(paths, dry_run))
+        return deleted
+
+    @classmethod
+    def _iter_old_blobs(cls):
+        now = time.time()
+        for (directory, subdirs, filenames) in os.walk(cls._get_blob_root()):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                try:
+                    if now - os.path.getmtime(path) \
+                       < cls.BLOB_GC_MIN_AGE_SECONDS:
+                        continue
+                except OSError:
+                    # Deleted since the walk listed it
+                    continue
+                yield path
+
+    @classmethod
+    def _delete_unreferenced(cls, paths, dry_run):
+        if not paths:
+            return []
+        # md5 is indexed and file_url is not
+        referenced = set(cls.objects.filter(
+            md5__in=set(os.path.basename(path) for path in paths)
+        ).values_list('file_url', flat=True))
+        deleted = []
+        for path in paths:
+            if cls._add_url_prefix(path) in referenced:
+                continue
+            if not dry_run:
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+            deleted.append(path)
+        return deleted
+
     @classmethod
     def _get_file_root(cls):
         file_root = get_setting('STORAGE_ROOT')
@@ -1,7 +1,8 @@
 import copy
+import logging
 import re
 
-from data_nodes import DegreeMismatchError
+from data_nodes import DataNode, DegreeMismatchError
 
 """InputCalculator analyzes the set of nodes acting as inputs
 for one Run to determine when sufficient data is available to 
@@ -44,10 +45,13 @@ iterations). A cross-product is performed between all groups, with the
 order of the cross-product corresponding to the order of group numbers.
 """
 
+logger = logging.getLogger(__name__)
+
 
 class InputCalculator(object):
 
     def __init__(self, data_channels, target_channel, triggered_data_path):
+        self.input_items = []
         target_node_list = filter(lambda n: n.channel==target_channel, data_channels)
         assert len(target_node_list) == 1, \
             'expected exactly 1 node with channel %s but found %s' \
@@ -87,7 +91,8 @@ class InputCalculator(object):
                     generator = InputSetGeneratorNode.create_from_data_channel(
                         node,
                         target_path=group_data_path,
-                        gather_depth=self._get_gather_depth(node))
+                        gather_depth=self._get_gather_depth(node),
+                        input_items=self.input_items)
                 except DegreeMismatchError:
                     raise Exception(
                         'Input dimensions do not match in group %s' % group)
@@ -103,6 +108,18 @@ class InputCalculator(object):
 
         self.generator = combined_generator
 
+    def record_skipped_clones(self):
+        """Call after InputSets have been used to create Tasks.
+        Counts DataNodes that were never cloned because no new Task
+        needed them. Before InputItems were flattened lazily, these
+        would have been written as orphaned DataNodes. The caller adds
+        the count to Run.skipped_clone_count.
+        """
+        count = sum([item.get_clone_size() for item in self.input_items
+                     if not item.is_flattened])
+        logger.debug('Skipped cloning %s DataNodes' % count)
+        return count
+
     def get_input_sets(self):
         seed_path = []
         return self.generator.get_input_sets(seed_path)
@@ -171,9 +188,11 @@ class InputSetGeneratorNode(object):
         self.input_items = [] # list of InputItems, only on leaf nodes
 
     @classmethod
-    def create_from_data_channel(cls, data_channel, target_path=None, gather_depth=0):
+    def create_from_data_channel(cls, data_channel, target_path=None,
+                                 gather_depth=0, input_items=None):
         """Scan the data tree on the given data_channel to create a corresponding
-        InputSetGenerator tree.
+        InputSetGenerator tree. If a list is given for input_items, new
+        InputItems are appended to it.
         """
         # If target_path is given, any data above that path will be ignored.
         # The path [] represents the root node, so this default value scans
@@ -184,12 +203,10 @@ class InputSetGeneratorNode(object):
         generator = InputSetGeneratorNode()
         for (data_path, data_node) in data_channel.get_ready_data_nodes(
                 target_path, gather_depth):
-            # If gather depth > 1, the data has to be flattened before we
-            # attach it to the task. If gather depth is 1 or 0, the flattened
-            # clone is an unchanged copy.
-            flat_data_node = data_node.flattened_clone()
-            input_item = InputItem(flat_data_node, data_channel.channel, data_channel.as_channel, mode=data_channel.mode)
+            input_item = InputItem(data_node, data_channel.channel, data_channel.as_channel, mode=data_channel.mode)
             generator._add_input_item(data_path, input_item)
+            if input_items is not None:
+                input_items.append(input_item)
         return generator
 
     def _add_input_item(self, data_path, input_item):
@@ -289,18 +306,59 @@ class InputSet(object):
 
 class InputItem(object):
     """All the information needed by the Task to construct one TaskInput.
-    For array inputs, we avoid creating the ArrayDataObject now and instead
-    provide the data_node from which the array can be generated. That way,
-    if we find that the downstream Task has already been created, we can
-    refrain from creating a new ArrayDataObject for no reason.
+    For array inputs, the flattened DataNode is not created until the Task
+    asks for it. That way, if we find that the downstream Task has already
+    been created, we can refrain from cloning DataNodes for no reason.
     """
 
     def __init__(self, data_node, channel, as_channel, mode):
         self.channel = channel
         self.as_channel = as_channel
-        self.data_node = data_node
+        self.source_data_node = data_node
         self.mode = mode
+        self._flattened_data_node = None
+
+    @property
+    def data_node(self):
+        # If gather depth > 1, the data has to be flattened before we
+        # attach it to the task. If gather depth is 1 or 0, the flattened
+        # clone is an unchanged copy.
+        # One InputItem may be shared by many InputSets, so clone only once.
+        if self._flattened_data_node is None:
+            self._flattened_data_node = self.source_data_node.flattened_clone()
+        return self._flattened_data_node
+
+    @classmethod
+    def flatten_all(cls, input_items):
+        """Same as getting data_node on each item, but all clones are
+        written with a few bulk inserts.
+        """
+        unique_items = {}
+        for input_item in input_items:
+            if not input_item.is_flattened:
+                unique_items[id(input_item)] = input_item
+        input_items = unique_items.values()
+        trees = []
+        for input_item in input_items:
+            data_node = input_item.source_data_node
+            if data_node.is_leaf:
+                contents = data_node.data_object
+            else:
+                contents = [leaf.data_object for leaf in data_node._get_leaves()]
+            trees.append((contents, data_node.type))
+        for input_item, clone in zip(input_items, DataNode.create_trees(trees)):
+            input_item._flattened_data_node = clone
+
+    @property
+    def is_flattened(self):
+        return self._flattened_data_node is not None
 
     @property
     def type(self):
-        return self.data_node.type
+        return self.source_data_node.type
+
+    def get_clone_size(self):
+        # Number of DataNodes that flattened_clone creates for this item
+        if self.source_data_node.is_leaf:
+            return 1
+        return 1 + len(self.source_data_node._get_leaves())
@@ -1,7 +1,7 @@
 from django.core import mail
 from django.core.exceptions import ObjectDoesNotExist, MultipleObjectsReturned, \
     ValidationError
-from django.db import models
+from django.db import models, transaction
 from django.dispatch import receiver
 from django.template.loader import render_to_string
 from django.utils import timezone
@@ -12,6 +12,7 @@ from .async_safe_mptt import AsyncSafeMPTTModel, TreeForeignKey
 from .base import BaseModel
 from api import get_setting
 from api import async
+from api import response_cache
 from api.exceptions import *
 from api.models import uuidstr
 from api.models import validators
@@ -19,7 +20,9 @@ from api.models.data_objects import DataObject
 from api.models.data_channels import DataChannel
 from api.models.input_calculator import InputCalculator
 from api.models.tasks import Task, TaskInput, TaskOutput, TaskAlreadyExistsException
+from api.models.task_attempts import TaskAttempt
 from api.models.templates import Template
+from api.models.status_changes import StatusChange
 from api.exceptions import ConcurrentModificationError
 
 
@@ -89,10 +92,24 @@ class Run(AsyncSafeMPTTModel, BaseModel):
     status_is_running = models.BooleanField(default=False)
     status_is_waiting = models.BooleanField(default=True)
 
+    # Counters for checking completion without loading every Task or step.
+    # expected_task_count is null until the first push, and
+    # expected_step_count is null until steps are created.
+    expected_task_count = models.IntegerField(null=True, blank=True)
+    finished_task_count = models.IntegerField(default=0)
+    expected_step_count = models.IntegerField(null=True, blank=True)
+    finished_step_count = models.IntegerField(default=0)
+    # DataNodes that InputCalculator did not need to clone for new Tasks.
+    # These used to be written and then orphaned.
+    skipped_clone_count = models.IntegerField(default=0)
+
     # For leaf nodes only
     command = models.TextField(blank=True)
     interpreter = models.CharField(max_length=1024, blank=True)
 
+    class Meta:
+        index_together = (('datetime_created', 'id'),)
+
     @property
     def status(self):
         if self.status_is_failed:
@@ -127,18 +144,138 @@ class Run(AsyncSafeMPTTModel, BaseModel):
              'status_is_waiting': False,
              'status_is_finished': True})
         if self.parent:
-            if self.parent._are_children_finished():
+            if self.parent.add_finished_step():
                 self.parent.finish()
         else:
             # Send notifications only if topmost run
             async.send_run_notifications(self.uuid)
 
-    def _are_children_finished(self):
-        return all([step.status_is_finished for step in self.steps.all()])
+    def add_finished_task(self):
+        """Count one more finished Task. Returns True if that was the last one.
+        """
+        return self._add_finished('finished_task_count', 'expected_task_count')
+
+    def add_finished_step(self):
+        """Count one more finished step. Returns True if that was the last one.
+        """
+        return self._add_finished('finished_step_count', 'expected_step_count')
+
+    def _add_finished(self, finished_field, expected_field):
+        # The UPDATE locks the row until commit, so only one caller
+        # can see the count reach the expected total
+        with transaction.atomic():
+            Run.objects.filter(id=self.id).update(
+                _change=models.F('_change')+1,
+                **{finished_field: models.F(finished_field)+1})
+            finished, expected, change = Run.objects.filter(id=self.id)\
+                .values_list(finished_field, expected_field, '_change').get()
+        setattr(self, finished_field, finished)
+        setattr(self, expected_field, expected)
+        self._change = change
+        return expected is not None and finished >= expected
+
+    def _count_expected_tasks(self, tasks, query_size=500):
+        """Add the branches that new Tasks reveal to expected_task_count.
+        A branch is new if no earlier Task of this Run is below it, which
+        is looked up in the Run's RunBranches rather than by reloading
+        every Task. Branches are only written while holding the row lock,
+        so concurrent pushes each add different branches.
+        """
+        branches = self._get_branch_degrees(
+            [task.data_path for task in tasks])
+        with transaction.atomic():
+            expected = Run.objects.select_for_update().filter(id=self.id)\
+                                  .values_list('expected_task_count',
+                                               flat=True).get()
+            if expected is None:
+                expected = 1
+            path_hashes = list(branches)
+            existing_hashes = set()
+            for i in range(0, len(path_hashes), query_size):
+                existing_hashes.update(self.branches.filter(
+                    path_hash__in=path_hashes[i:i+query_size])\
+                    .values_list('path_hash', flat=True))
+            new_hashes = [path_hash for path_hash in path_hashes
+                          if path_hash not in existing_hashes]
+            RunBranch.objects.bulk_create(
+                [RunBranch(run=self, path_hash=path_hash)
+                 for path_hash in new_hashes])
+            expected += sum([branches[path_hash] - 1
+                             for path_hash in new_hashes])
+            Run.objects.filter(id=self.id).update(
+                _change=models.F('_change')+1,
+                expected_task_count=expected)
+            self._change = Run.objects.filter(id=self.id)\
+                                      .values_list('_change', flat=True).get()
+        self.expected_task_count = expected
+
+    def _get_task_data_paths(self):
+        # values_list would return data_path as a JSON string
+        return [task.data_path for task in self.tasks.only('data_path')]
+
+    @classmethod
+    def get_expected_task_count(cls, data_paths):
+        """Number of Tasks a leaf Run will have, given the data_paths of the
+        Tasks created so far. Every (index, degree) hop on a data_path
+        gives the degree of one branch in the input data tree. Each branch
+        replaces one expected Task with one per child, so a branch with no
+        Tasks yet counts as a single Task until its degree is known.
+        """
+        return 1 + sum([degree - 1 for degree
+                        in cls._get_branch_degrees(data_paths).values()])
+
+    @classmethod
+    def _get_branch_degrees(cls, data_paths):
+        # Branches are keyed on the hash of the data_path that leads
+        # to them, so they match the path_hash of RunBranches
+        branches = {}
+        for data_path in data_paths:
+            for i in range(len(data_path)):
+                path_hash = Task.get_data_path_hash(data_path[:i])
+                if path_hash not in branches:
+                    branches[path_hash] = int(data_path[i][1])
+        return branches
+
+    def reconcile_counters(self):
+        """Recompute the completion counters from the Tasks and steps,
+        and rewrite the RunBranches. Returns True if any counter changed.
+        """
+        if self.is_leaf:
+            branches = self._get_branch_degrees(self._get_task_data_paths())
+            with transaction.atomic():
+                Run.objects.select_for_update().filter(id=self.id).exists()
+                self.branches.all().delete()
+                RunBranch.objects.bulk_create(
+                    [RunBranch(run=self, path_hash=path_hash)
+                     for path_hash in branches])
+            counters = {
+                'expected_task_count': 1 + sum(
+                    [degree - 1 for degree in branches.values()])
+                if self.tasks.exists() else None,
+                'finished_task_count': self.tasks.filter(
+                    status_is_finished=True).count(),
+            }
+        else:
+            counters = {
+                'expected_step_count': self.template.steps.count()
+                if self.template else self.steps.count(),
+                'finished_step_count': self.steps.filter(
+                    status_is_finished=True).count(),
+            }
+        if all(getattr(self, field) == value
+               for field, value in counters.items()):
+            return False
+        self.setattrs_and_save_with_retries(counters)
+        return True
 
-    def are_tasks_finished(self):
-        task_tree = TaskNode.create_from_task_list(self.tasks.all())
-        return task_tree.is_complete()
+    def are_counters_complete(self):
+        if self.is_leaf:
+            expected = self.expected_task_count
+            finished = self.finished_task_count
+        else:
+            expected = self.expected_step_count
+            finished = self.finished_step_count
+        return expected is not None and finished >= expected
 
     @classmethod
     def create_from_template(cls, template, name=None,
@@ -251,6 +388,12 @@ class Run(AsyncSafeMPTTModel, BaseModel):
             or self.status_is_failed \
             or self.status_is_killed
 
+    def after_save(self):
+        if self.has_new_status():
+            StatusChange.record_status(self.id, 'run', self.uuid, self.status)
+        # Steps appear in summary views of every Run above them
+        response_cache.invalidate_tree(self.tree_id)
+
     def fail(self, detail=''):
         if self.has_terminal_status():
             return
@@ -278,11 +421,53 @@ class Run(AsyncSafeMPTTModel, BaseModel):
              'status_is_waiting': False})
         self._kill_children(detail=detail)
 
-    def _kill_children(self, detail=''):
-        for step in self.steps.all():
-            step.kill(detail=detail)
-        for task in self.tasks.all():
-            task.kill(detail=detail)
+    def _kill_children(self, detail='', query_size=500):
+        """Kill all steps below this Run and their Tasks and TaskAttempts.
+        Each model gets set-based UPDATEs and one bulk insert of events,
+        instead of a save and an event per object. Objects that already
+        have a terminal status are left alone.
+        """
+        assignments = {
+            'status_is_running': False,
+            'status_is_waiting': False,
+            'status_is_killed': True,
+        }
+        runs = self.get_descendants()
+        tasks = Task.objects.filter(run__tree_id=self.tree_id,
+                                    run__lft__gte=self.lft,
+                                    run__rght__lte=self.rght)
+        run_ids = Run.bulk_setattrs(
+            runs.filter(status_is_finished=False,
+                        status_is_failed=False,
+                        status_is_killed=False),
+            assignments)
+        task_ids = Task.bulk_setattrs(
+            tasks.filter(status_is_finished=False,
+                         status_is_failed=False,
+                         status_is_killed=False),
+            assignments)
+        StatusChange.bulk_record('run', run_ids, status='Killed')
+        StatusChange.bulk_record('task', task_ids, status='Killed')
+        Run.bulk_add_event(run_ids, 'Run was killed',
+                           detail=detail, is_error=True)
+        Task.bulk_add_event(task_ids, 'Task was killed',
+                            detail=detail, is_error=True)
+        for i in range(0, len(task_ids), query_size):
+            TaskAttempt.bulk_kill(
+                TaskAttempt.objects.filter(
+                    task_id__in=task_ids[i:i+query_size]),
+                detail=detail)
+        response_cache.invalidate_tree(self.tree_id)
+        async.schedule_tasks()
+
+    @classmethod
+    def bulk_add_event(cls, ids, event, detail='', is_error=False):
+        RunEvent.objects.bulk_create([
+            RunEvent(event=event, run_id=id,
+                     detail=detail[-1000:], is_error=is_error)
+            for id in ids])
+        StatusChange.bulk_record('run', ids, event=event,
+                                 detail=detail[-1000:], is_error=is_error)
 
     def send_notifications(self):
         context = self.notification_context
@@ -390,6 +575,11 @@ class Run(AsyncSafeMPTTModel, BaseModel):
             event=event, run=self, detail=detail[-1000:], is_error=is_error)
         event.full_clean()
         event.save()
+        # Recorded here rather than in RunEvent.after_save, which would
+        # have to load the Run
+        StatusChange.record_event(self.id, 'run', self.uuid, event.event,
+                                  detail=event.detail,
+                                  is_error=event.is_error)
 
     def _claim_for_postprocessing(self):
         # There are two paths to get Run.postprocess():
@@ -512,7 +702,10 @@ class Run(AsyncSafeMPTTModel, BaseModel):
         """
         if self.is_leaf:
             return
-        for step in self.template.steps.all():
+        steps = self.template.steps.all()
+        self.setattrs_and_save_with_retries(
+            {'expected_step_count': len(steps)})
+        for step in steps:
             child_run = self.create_from_template(step, parent=self)
             child_run.initialize_inputs()
             child_run.initialize_outputs()
@@ -549,8 +742,9 @@ class Run(AsyncSafeMPTTModel, BaseModel):
         if get_setting('TEST_NO_PUSH_INPUTS_ON_RUN_CREATION'):
             return
         if self.inputs.exists():
-            for input in self.inputs.all():
-                self.push(input.channel, [])
+            # Pushing any channel on the root path scans all inputs,
+            # so one push finds every InputSet that is ready.
+            self.push(self.inputs.first().channel, [])
         elif self.is_leaf:
             # Special case: No inputs on leaf node
             self._push_input_set([])
@@ -565,18 +759,64 @@ class Run(AsyncSafeMPTTModel, BaseModel):
             return
         if not self.is_leaf:
             return
-        for input_set in InputCalculator(self.inputs.all(), channel, data_path)\
-            .get_input_sets():
-            self._push_input_set(input_set)
+        # Only the target group is searched below data_path, so candidate
+        # InputSets are those the new data can complete. Of these,
+        # create_from_input_sets skips the ones that already have a Task
+        # by looking up their data_path_hash, so earlier Tasks of the run
+        # are not loaded on each push.
+        input_calculator = InputCalculator(
+            self.inputs.all(), channel, data_path)
+        tasks = Task.create_from_input_sets(
+            input_calculator.get_input_sets(), self)
+        if tasks:
+            self._count_expected_tasks(tasks)
+        async.run_tasks([task.uuid for task in tasks])
+        skipped_clone_count = input_calculator.record_skipped_clones()
+        if skipped_clone_count:
+            self._add_skipped_clones(skipped_clone_count)
+
+    def _add_skipped_clones(self, count):
+        with transaction.atomic():
+            Run.objects.filter(id=self.id).update(
+                _change=models.F('_change')+1,
+                skipped_clone_count=models.F('skipped_clone_count')+count)
+            self.skipped_clone_count, self._change = Run.objects\
+                .filter(id=self.id)\
+                .values_list('skipped_clone_count', '_change').get()
+
+    @classmethod
+    def get_stats(cls):
+        return {
+            'skipped_clone_count': cls.objects.aggregate(
+                models.Sum('skipped_clone_count'))[
+                    'skipped_clone_count__sum'] or 0,
+        }
 
     def _push_input_set(self, input_set):
         try:
             task = Task.create_from_input_set(input_set, self)
+            self._count_expected_tasks([task])
             async.run_task(task.uuid)
         except TaskAlreadyExistsException:
             pass
 
 
+class RunBranch(BaseModel):
+    """A branch of the input data that a leaf Run iterates over, recorded
+    when the first Task below it is created. path_hash is
+    Task.get_data_path_hash of the data_path leading to the branch.
+    """
+
+    run = models.ForeignKey(
+        'Run',
+        related_name='branches',
+        on_delete=models.CASCADE)
+    path_hash = models.CharField(max_length=255)
+
+    class Meta:
+        unique_together = (("run", "path_hash"),)
+
+
 class RunEvent(BaseModel):
 
     run = models.ForeignKey(
@@ -589,6 +829,13 @@ class RunEvent(BaseModel):
     detail = models.TextField(blank=True)
     is_error = models.BooleanField(default=False)
 
+    def after_save(self):
+        if not response_cache.is_enabled():
+            return
+        response_cache.invalidate_tree(
+            Run.objects.filter(id=self.run_id).values_list(
+                'tree_id', flat=True).first())
+
 
 class UserInput(DataChannel):
 
@@ -656,52 +903,3 @@ class RunConnectorNode(DataChannel):
 
     class Meta:
         unique_together = (("run", "channel"),)
-
-class TaskNode(object):
-    """This converts tasks into a tree for the sole purpose of checking
-    to see if the tree is complete. Each node knows its degree, so the tree
-    is complete if the number of existing children matches the degree, and
-    if all those children are also complete.
-    """
-
-    def __init__(self):
-        self.degree = None
-        self.children = {}
-        self.task = None
-
-    @classmethod
-    def create_from_task_list(cls, tasks):
-        root = TaskNode()
-        for task in tasks:
-            root._extend_to_leaf(task, task.data_path)
-        return root
-
-    def _extend_to_leaf(self, task, data_path):
-        if len(data_path) == 0:
-            self.task = task
-            self.degree = None
-            return
-        else:
-            first_hop = data_path.pop(0)
-            degree = first_hop[1]
-            index = first_hop[0]
-            if self.degree is None:
-                self.degree = degree
-            assert self.degree == degree, 'Degree mismatch in tasks'
-            child = self.children.get(index)
-            if child is None:
-                child = TaskNode()
-                self.children[index] = child
-            child._extend_to_leaf(task, data_path)
-
-    def is_complete(self):
-        if self.degree == None:
-            # leaf
-            if self.task is not None:
-                return self.task.status_is_finished
-            else:
-                return False
-        else:
-            # non-leaf
-            return len(self.children) == self.degree \
-                and all([self.children[i].is_complete() for i in range(self.degree)])
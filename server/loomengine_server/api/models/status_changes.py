@@ -0,0 +1,119 @@
+from datetime import timedelta
+from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+
+from .base import BaseModel
+
+
+class StatusChange(BaseModel):
+    """A StatusChange records the status of a Run, Task, or TaskAttempt
+    after a save, or an event added to one of them. Each change is
+    filed under the Run that owns the object, so the changes for a Run
+    subtree can be read in order of id, as a feed for clients that
+    follow a Run instead of polling it.
+
+    A status is written when a save changes the status flags of the
+    object, or when it is first saved. Old changes are deleted after
+    STATUS_CHANGE_RETENTION_HOURS.
+    """
+
+    OBJECT_TYPES = ('run', 'task', 'task_attempt')
+
+    run = models.ForeignKey('Run',
+                            related_name='status_changes',
+                            on_delete=models.CASCADE)
+    object_type = models.CharField(
+        max_length=255,
+        choices=[(object_type, object_type) for object_type in OBJECT_TYPES])
+    uuid = models.CharField(max_length=255)
+    status = models.CharField(max_length=255, blank=True)
+    event = models.CharField(max_length=255, blank=True)
+    detail = models.TextField(blank=True)
+    is_error = models.BooleanField(default=False)
+    timestamp = models.DateTimeField(default=timezone.now, editable=False,
+                                     db_index=True)
+
+    @classmethod
+    def record_status(cls, run_id, object_type, uuid, status):
+        cls.objects.create(run_id=run_id, object_type=object_type,
+                           uuid=uuid, status=status)
+
+    @classmethod
+    def record_event(cls, run_id, object_type, uuid, event, detail='',
+                     is_error=False):
+        cls.objects.create(run_id=run_id, object_type=object_type,
+                           uuid=uuid, event=event, detail=detail[-1000:],
+                           is_error=is_error)
+
+    @classmethod
+    def record_events(cls, run_id, object_type, uuid, events):
+        """Record many events on one object with one bulk insert.
+        events are unsaved event models with event, detail, is_error,
+        and timestamp.
+        """
+        cls.objects.bulk_create([
+            cls(run_id=run_id, object_type=object_type, uuid=uuid,
+                event=event.event, detail=event.detail,
+                is_error=event.is_error, timestamp=event.timestamp)
+            for event in events])
+
+    @classmethod
+    def bulk_record(cls, object_type, ids, query_size=500, **fields):
+        """Record the same status or event for many objects of one type,
+        e.g. after bulk_setattrs or bulk_add_event, which bypass save.
+        """
+        Model, run_id_field = cls._get_model(object_type)
+        for i in range(0, len(ids), query_size):
+            cls.objects.bulk_create([
+                cls(run_id=run_id, object_type=object_type, uuid=uuid,
+                    **fields)
+                for run_id, uuid in Model.objects.filter(
+                        id__in=ids[i:i+query_size]).values_list(
+                            run_id_field, 'uuid')
+                if run_id is not None])
+
+    @classmethod
+    def _get_model(cls, object_type):
+        from api.models.runs import Run
+        from api.models.tasks import Task
+        from api.models.task_attempts import TaskAttempt
+        return {
+            'run': (Run, 'id'),
+            'task': (Task, 'run_id'),
+            'task_attempt': (TaskAttempt, 'task__run_id'),
+        }[object_type]
+
+    @classmethod
+    def get_subtree_changes(cls, runs, after_id=None):
+        if not runs:
+            return cls.objects.none()
+        subtrees = Q()
+        for run in runs:
+            subtrees |= Q(run__tree_id=run.tree_id,
+                          run__lft__gte=run.lft,
+                          run__rght__lte=run.rght)
+        changes = cls.objects.filter(subtrees)
+        if after_id is not None:
+            changes = changes.filter(id__gt=after_id)
+        return changes.select_related('run').order_by('id')
+
+    @classmethod
+    def delete_expired(cls, retention_hours):
+        cls.objects.filter(
+            timestamp__lt=timezone.now()
+            - timedelta(hours=retention_hours)).delete()
+
+    def to_dict(self):
+        data = {'id': self.id,
+                'type': self.object_type,
+                'uuid': self.uuid,
+                'run': self.run.uuid,
+                'timestamp': self.timestamp.isoformat()}
+        if self.event:
+            data.update({'event': self.event,
+                         'detail': self.detail,
+                         'is_error': self.is_error})
+        else:
+            data['status'] = self.status
+        return data
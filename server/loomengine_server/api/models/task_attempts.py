@@ -9,8 +9,10 @@ from .base import BaseModel
 from .data_channels import DataChannel
 from api import get_setting
 from api import async
+from api import response_cache
 from api.models import uuidstr
 from api.models.data_objects import DataObject, FileResource
+from api.models.status_changes import StatusChange
 from api.models import validators
 
 
@@ -37,6 +39,12 @@ class TaskAttempt(BaseModel):
     status_is_running = models.BooleanField(default=True)
     status_is_cleaned_up = models.BooleanField(default=False)
 
+    class Meta:
+        index_together = (
+            ('status_is_running', 'last_heartbeat'),
+            ('status_is_running', 'status_is_cleaned_up', 'status_is_failed'),
+        )
+
     @property
     def status(self):
         if self.status_is_failed:
@@ -51,11 +59,14 @@ class TaskAttempt(BaseModel):
             return 'Unknown'
 
     def heartbeat(self):
-        # Saving with an empty set of attributes will update
-        # last_heartbeat since auto_now=True
-        self.setattrs_and_save_with_retries({})
+        from api.heartbeats import get_heartbeat_store
+        self.last_heartbeat = get_heartbeat_store().beat(self.uuid)
         return self.last_heartbeat
 
+    def get_last_heartbeat(self):
+        from api.heartbeats import get_heartbeat_store
+        return get_heartbeat_store().get_last_heartbeat(self)
+
     def get_output(self, channel):
         return self.outputs.get(channel=channel)
 
@@ -92,6 +103,22 @@ class TaskAttempt(BaseModel):
             or self.status_is_failed \
             or self.status_is_killed
 
+    def after_save(self):
+        # Most saves, e.g. heartbeats, change neither the status nor
+        # anything in cached views, so look up the Run only if needed
+        has_new_status = self.has_new_status()
+        if not has_new_status and not response_cache.is_enabled():
+            return
+        run_id, tree_id = TaskAttempt.objects.filter(id=self.id).values_list(
+            'task__run_id', 'task__run__tree_id').first()
+        if run_id is None:
+            return
+        if has_new_status:
+            StatusChange.record_status(
+                run_id, 'task_attempt', self.uuid, self.status)
+        # TaskAttempt status appears in summary views of the Run tree
+        response_cache.invalidate_tree(tree_id)
+
     def finish(self):
         if self.has_terminal_status():
             return
@@ -112,6 +139,41 @@ class TaskAttempt(BaseModel):
             event=event, task_attempt=self, detail=detail[-1000:], is_error=is_error)
         event.full_clean()
         event.save()
+        self.record_events([event])
+
+    def add_events(self, events):
+        """Add events with one bulk insert. Each event is a dict with
+        "event", and optionally "detail", "is_error", and "timestamp",
+        the time when the event happened.
+        """
+        new_events = []
+        for event in events:
+            model = TaskAttemptEvent(
+                task_attempt=self, event=event.get('event', ''),
+                detail=event.get('detail', '')[-1000:],
+                is_error=event.get('is_error', False))
+            if event.get('timestamp'):
+                model.timestamp = event['timestamp']
+            model.full_clean()
+            new_events.append(model)
+        TaskAttemptEvent.objects.bulk_create(new_events)
+        self.record_events(new_events)
+
+    def record_events(self, events):
+        """Record saved events on this TaskAttempt as StatusChanges,
+        with one bulk insert
+        """
+        run_id = self._get_run_id()
+        if run_id is not None:
+            StatusChange.record_events(
+                run_id, 'task_attempt', self.uuid, events)
+
+    def _get_run_id(self):
+        # Don't load the whole Task just for its run_id
+        if TaskAttempt.task.is_cached(self):
+            return self.task.run_id
+        return TaskAttempt.objects.filter(id=self.id).values_list(
+            'task__run_id', flat=True).first()
 
     @classmethod
     def create_from_task(cls, task):
@@ -210,6 +272,62 @@ class TaskAttempt(BaseModel):
             self.add_event('TaskAttempt was killed', detail=detail, is_error=True)
         self.cleanup()
 
+    @classmethod
+    def bulk_kill(cls, task_attempts, detail=''):
+        """Kill and clean up TaskAttempts with set-based UPDATEs and one
+        bulk insert of events, rather than a save and event for each one
+        """
+        ids = cls.bulk_setattrs(
+            task_attempts.filter(status_is_finished=False,
+                                 status_is_failed=False,
+                                 status_is_killed=False),
+            {'status_is_killed': True,
+             'status_is_running': False})
+        StatusChange.bulk_record('task_attempt', ids, status='Killed')
+        cls.bulk_add_event(ids, 'TaskAttempt was killed',
+                           detail=detail, is_error=True)
+        # Attempts that already ended were cleaned up when they ended
+        cls.bulk_cleanup(cls.objects.filter(id__in=ids))
+
+    @classmethod
+    def bulk_cleanup(cls, task_attempts):
+        task_attempts = task_attempts.filter(status_is_cleaned_up=False)
+        if get_setting('PRESERVE_ALL'):
+            cls.bulk_add_event(
+                list(task_attempts.values_list('id', flat=True)),
+                'Skipped cleanup because PRESERVE_ALL is True')
+            return
+        if get_setting('PRESERVE_ON_FAILURE'):
+            cls.bulk_add_event(
+                list(task_attempts.filter(status_is_failed=True)\
+                     .values_list('id', flat=True)),
+                'Skipped cleanup because PRESERVE_ON_FAILURE is True')
+            task_attempts = task_attempts.exclude(status_is_failed=True)
+        async.cleanup_task_attempts(
+            list(task_attempts.values_list('uuid', flat=True)))
+
+    @classmethod
+    def bulk_add_event(cls, ids, event, detail='', is_error=False):
+        TaskAttemptEvent.objects.bulk_create([
+            TaskAttemptEvent(event=event, task_attempt_id=id,
+                             detail=detail[-1000:], is_error=is_error)
+            for id in ids])
+        StatusChange.bulk_record('task_attempt', ids, event=event,
+                                 detail=detail[-1000:], is_error=is_error)
+
+    @classmethod
+    def get_missed_cleanup(cls):
+        """TaskAttempts that stopped running but were never cleaned up,
+        leaving out those that settings say to preserve
+        """
+        if get_setting('PRESERVE_ALL'):
+            return cls.objects.none()
+        task_attempts = cls.objects.filter(status_is_running=False,
+                                           status_is_cleaned_up=False)
+        if get_setting('PRESERVE_ON_FAILURE'):
+            task_attempts = task_attempts.exclude(status_is_failed=True)
+        return task_attempts
+
     def cleanup(self):
         if self.status_is_cleaned_up:
             return
@@ -280,6 +398,7 @@ class TaskAttemptEvent(BaseModel):
     is_error = models.BooleanField(default=False)
 
 
+
 class ArrayInputContext(object):
     """This class is used with jinja templates to make the 
     default representation of an array a space-delimited list.
@@ -0,0 +1,199 @@
+from django.db import models, transaction
+from django.db.models import Min, Q, Sum
+from django.utils import timezone
+import math
+
+from .base import BaseModel
+from api import get_setting
+
+
+class TaskQueueEntry(BaseModel):
+    """A TaskQueueEntry holds a Task until the scheduler admits it to run.
+    From admission until the Task reaches a terminal status, the entry's
+    cores, memory, and disk_size count against the capacity set by
+    SCHEDULER_MAX_CORES, SCHEDULER_MAX_MEMORY_GB, and
+    SCHEDULER_MAX_DISK_SIZE_GB. Entries are admitted by priority, then
+    oldest first. The queue never skips an entry that does not fit yet,
+    so large Tasks are not starved by a stream of small ones.
+    """
+
+    DEFAULT_CORES = 1
+    DEFAULT_MEMORY_GB = 1
+    DEFAULT_DISK_SIZE_GB = 0
+
+    task = models.OneToOneField('Task',
+                                related_name='queue_entry',
+                                on_delete=models.CASCADE)
+    cores = models.IntegerField()
+    memory = models.IntegerField()
+    disk_size = models.IntegerField()
+    priority = models.IntegerField(default=0)
+    datetime_queued = models.DateTimeField(default=timezone.now,
+                                           editable=False)
+    datetime_admitted = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        index_together = (
+            ('datetime_admitted', 'priority', 'datetime_queued'),)
+
+    @classmethod
+    def get_capacity(cls):
+        # None means that resource is not limited
+        return {
+            'cores': get_setting('SCHEDULER_MAX_CORES', required=False),
+            'memory': get_setting('SCHEDULER_MAX_MEMORY_GB', required=False),
+            'disk_size': get_setting(
+                'SCHEDULER_MAX_DISK_SIZE_GB', required=False),
+        }
+
+    @classmethod
+    def is_enabled(cls):
+        return any(limit is not None for limit in cls.get_capacity().values())
+
+    @classmethod
+    def enqueue(cls, task_uuids, query_size=500):
+        """Put Tasks at the back of the queue. A Task that is already
+        queued or admitted is queued again, which releases its capacity.
+        """
+        from api.models.tasks import Task
+        capacity = cls.get_capacity()
+        now = timezone.now()
+        with transaction.atomic():
+            for i in range(0, len(task_uuids), query_size):
+                chunk = task_uuids[i:i+query_size]
+                # Keep the caller's order, since ties on datetime_queued
+                # are broken by id
+                positions = dict((uuid, j) for j, uuid in enumerate(chunk))
+                tasks = sorted(Task.objects.filter(uuid__in=chunk),
+                               key=lambda task: positions[task.uuid])
+                cls.objects.filter(task__in=tasks).delete()
+                cls.objects.bulk_create([
+                    cls(task=task,
+                        priority=cls._get_priority(task),
+                        datetime_queued=now,
+                        **cls._get_request(task, capacity))
+                    for task in tasks])
+
+    @classmethod
+    def _get_priority(cls, task):
+        # Retries go first. Their runs have already waited in the queue once.
+        return task.analysis_failure_count + task.system_failure_count
+
+    @classmethod
+    def _get_request(cls, task, capacity):
+        resources = task.resources or {}
+        request = {
+            'cores': cls._parse_resource(
+                resources.get('cores'), cls.DEFAULT_CORES),
+            'memory': cls._parse_resource(
+                resources.get('memory'), cls.DEFAULT_MEMORY_GB),
+            'disk_size': cls._parse_resource(
+                resources.get('disk_size'), cls.DEFAULT_DISK_SIZE_GB),
+        }
+        # A request larger than the pool would wait forever, and block
+        # everything behind it. Reduce it so it runs alone.
+        for resource, limit in capacity.items():
+            if limit is not None:
+                request[resource] = min(request[resource], int(limit))
+        return request
+
+    @classmethod
+    def _parse_resource(cls, value, default):
+        """Templates accept any value, e.g. "2.5". Round fractions up, so
+        the Task gets at least what it asked for, and use the default
+        for values that are not numbers.
+        """
+        try:
+            return max(int(math.ceil(float(value))), 1)
+        except (TypeError, ValueError):
+            return default
+
+    @classmethod
+    def _get_terminal_filter(cls):
+        return Q(task__status_is_finished=True) \
+            | Q(task__status_is_failed=True) \
+            | Q(task__status_is_killed=True)
+
+    @classmethod
+    def _get_usage(cls):
+        usage = cls.objects.filter(datetime_admitted__isnull=False)\
+                           .exclude(cls._get_terminal_filter())\
+                           .aggregate(Sum('cores'),
+                                      Sum('memory'),
+                                      Sum('disk_size'))
+        return {'cores': usage['cores__sum'] or 0,
+                'memory': usage['memory__sum'] or 0,
+                'disk_size': usage['disk_size__sum'] or 0}
+
+    @classmethod
+    def admit(cls, query_size=500):
+        """Admit queued entries in order until the next one does not fit.
+        Returns the uuids of the admitted Tasks.
+        """
+        capacity = cls.get_capacity()
+        admitted = []
+        with transaction.atomic():
+            # Entries for Tasks that finished, failed, or were killed
+            # no longer hold capacity or a place in the queue
+            cls.objects.filter(cls._get_terminal_filter()).delete()
+            # Locking the head of the queue keeps two schedulers from
+            # admitting against the same free capacity
+            queued = cls.objects.select_for_update()\
+                                .filter(datetime_admitted__isnull=True)\
+                                .order_by('-priority', 'datetime_queued', 'id')
+            usage = cls._get_usage()
+            is_full = False
+            offset = 0
+            while not is_full:
+                entries = list(queued.select_related('task')[
+                    offset:offset+query_size])
+                if not entries:
+                    break
+                offset += query_size
+                for entry in entries:
+                    if not entry._fits(usage, capacity):
+                        is_full = True
+                        break
+                    for resource in usage:
+                        usage[resource] += getattr(entry, resource)
+                    admitted.append(entry)
+            now = timezone.now()
+            for i in range(0, len(admitted), query_size):
+                cls.objects.filter(
+                    id__in=[entry.id for entry
+                            in admitted[i:i+query_size]])\
+                           .update(datetime_admitted=now)
+        return [entry.task.uuid for entry in admitted]
+
+    def _fits(self, usage, capacity):
+        for resource, limit in capacity.items():
+            if limit is not None \
+               and usage[resource] + getattr(self, resource) > limit:
+                return False
+        return True
+
+    @classmethod
+    def get_stats(cls):
+        now = timezone.now()
+        queued = cls.objects.filter(datetime_admitted__isnull=True)\
+                            .exclude(cls._get_terminal_filter())
+        admitted = cls.objects.filter(datetime_admitted__isnull=False)\
+                              .exclude(cls._get_terminal_filter())
+        oldest = queued.aggregate(Min('datetime_queued'))[
+            'datetime_queued__min']
+        # Admitted entries are bounded by capacity, so this list is short
+        waits = [(datetime_admitted - datetime_queued).total_seconds()
+                 for datetime_queued, datetime_admitted
+                 in admitted.values_list('datetime_queued',
+                                         'datetime_admitted')]
+        return {
+            'enabled': cls.is_enabled(),
+            'queued': queued.count(),
+            'admitted': len(waits),
+            'longest_queued_wait_seconds':
+            (now - oldest).total_seconds() if oldest else 0,
+            'average_admitted_wait_seconds':
+            sum(waits)/len(waits) if waits else 0,
+            'capacity': cls.get_capacity(),
+            'in_use': cls._get_usage(),
+        }
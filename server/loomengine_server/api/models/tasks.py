@@ -1,5 +1,9 @@
-from django.db import models
+from datetime import timedelta
+from django.db import models, transaction, IntegrityError
+from django.db.models import Q
 from django.utils import timezone
+import hashlib
+import json
 import jsonfield
 
 from . import render_from_template, render_string_or_list, ArrayInputContext
@@ -7,9 +11,12 @@ from .base import BaseModel
 from .data_channels import DataChannel
 from api import get_setting
 from api import async
+from api import response_cache
 from api.exceptions import ConcurrentModificationError
 from api.models import uuidstr
+from api.models.input_calculator import InputItem
 from api.models.task_attempts import TaskAttempt
+from api.models.status_changes import StatusChange
 from api.models import validators
 
 
@@ -44,6 +51,9 @@ class Task(BaseModel):
     data_path = jsonfield.JSONField(
         validators=[validators.validate_data_path],
         blank=True)
+    # Set on save. Lets the database enforce one Task per data_path on a Run.
+    data_path_hash = models.CharField(max_length=255, null=True, blank=True,
+                                      editable=False)
     datetime_created = models.DateTimeField(default=timezone.now,
                                             editable=False)
     datetime_finished = models.DateTimeField(null=True, blank=True)
@@ -53,6 +63,37 @@ class Task(BaseModel):
     status_is_running = models.BooleanField(default=False)
     status_is_waiting = models.BooleanField(default=True)
 
+    class Meta:
+        unique_together = (("run", "data_path_hash"),)
+        index_together = (("status_is_running", "datetime_created"),)
+
+    def save(self, *args, **kwargs):
+        # Only for new Tasks. Duplicates from before the unique
+        # constraint keep a NULL hash, so later saves must not set it.
+        if self._state.adding:
+            self.data_path_hash = self.get_data_path_hash(self.data_path)
+        return super(Task, self).save(*args, **kwargs)
+
+    def after_save(self):
+        if self.run_id is None:
+            return
+        if self.has_new_status():
+            StatusChange.record_status(
+                self.run_id, 'task', self.uuid, self.status)
+        # Tasks appear in summary views of every Run in the tree
+        if response_cache.is_enabled():
+            response_cache.invalidate_tree(
+                Task.objects.filter(id=self.id).values_list(
+                    'run__tree_id', flat=True).first())
+
+    @classmethod
+    def get_data_path_hash(cls, data_path):
+        # data_path may have lists or tuples, so hash a canonical form
+        canonical_path = [[int(index), int(degree)]
+                          for index, degree in data_path or []]
+        return hashlib.md5(
+            json.dumps(canonical_path, separators=(',',':'))).hexdigest()
+
     @property
     def status(self):
         if self.status_is_failed:
@@ -68,15 +109,30 @@ class Task(BaseModel):
         else:
             return 'Unknown'
 
-    def is_unresponsive(self):
-        heartbeat = int(get_setting('TASKRUNNER_HEARTBEAT_INTERVAL_SECONDS'))
+    @classmethod
+    def get_heartbeat_cutoff(cls):
         timeout = int(get_setting('TASKRUNNER_HEARTBEAT_TIMEOUT_SECONDS'))
+        return timezone.now() - timedelta(seconds=timeout)
+
+    def is_unresponsive(self):
         try:
-            last_heartbeat = self.task_attempt.last_heartbeat
+            last_heartbeat = self.task_attempt.get_last_heartbeat()
         except AttributeError:
             # No TaskAttempt selected
             last_heartbeat = self.datetime_created
-        return (timezone.now() - last_heartbeat).total_seconds() > timeout
+        return last_heartbeat < self.get_heartbeat_cutoff()
+
+    @classmethod
+    def get_unresponsive_tasks(cls):
+        """Running Tasks that are unresponsive, found with one query
+        on the heartbeat columns rather than a check per Task.
+        Heartbeats must be flushed to the database first.
+        """
+        cutoff = cls.get_heartbeat_cutoff()
+        return cls.objects.filter(status_is_running=True).filter(
+            Q(task_attempt__last_heartbeat__lt=cutoff)
+            | Q(task_attempt__isnull=True, datetime_created__lt=cutoff))\
+                          .select_related('task_attempt', 'run')
 
     def _process_error(self, detail, max_retries,
                        failure_count_attribute, failure_text,
@@ -114,6 +170,7 @@ class Task(BaseModel):
                 is_error=True)
             self._kill_children(detail=detail)
             self.run.fail(detail='Task %s failed' % self.uuid)
+            async.schedule_tasks()
     
     def system_error(self, detail=''):
         self._process_error(
@@ -146,12 +203,13 @@ class Task(BaseModel):
               'status_is_running': False,
               'status_is_waiting': False,
             })
-        if self.run.are_tasks_finished():
+        if self.run.add_finished_task():
             self.run.finish()
         for output in self.outputs.all():
             output.push_data(self.data_path)
         for task_attempt in self.all_task_attempts.all():
             task_attempt.cleanup()
+        async.schedule_tasks()
 
     def kill(self, detail=''):
         if self.has_terminal_status():
@@ -163,18 +221,25 @@ class Task(BaseModel):
         })
         self.add_event('Task was killed', detail=detail, is_error=True)
         self._kill_children(detail=detail)
+        async.schedule_tasks()
 
     def _kill_children(self, detail=''):
-        for task_attempt in self.all_task_attempts.all():
-            async.kill_task_attempt(task_attempt.uuid, detail)
+        TaskAttempt.bulk_kill(self.all_task_attempts.all(), detail=detail)
+
+    @classmethod
+    def bulk_add_event(cls, ids, event, detail='', is_error=False):
+        TaskEvent.objects.bulk_create([
+            TaskEvent(event=event, task_id=id,
+                      detail=detail[-1000:], is_error=is_error)
+            for id in ids])
+        StatusChange.bulk_record('task', ids, event=event,
+                                 detail=detail[-1000:], is_error=is_error)
 
     @classmethod
     def create_from_input_set(cls, input_set, run):
         try:
             if input_set:
                 data_path = input_set.data_path
-                if run.tasks.filter(data_path=data_path).count() > 0:
-                    raise TaskAlreadyExistsException
             else:
                 # If run has no inputs, we get an empty input_set.
                 # Task will go on the root node.
@@ -188,8 +253,14 @@ class Task(BaseModel):
                 resources=run.template.resources,
                 data_path=data_path,
             )
-            task.full_clean()
-            task.save()
+            # Uniqueness of (run, data_path_hash) is left to the database,
+            # so that concurrent pushes cannot both create the Task.
+            task.full_clean(validate_unique=False)
+            try:
+                with transaction.atomic():
+                    task.save()
+            except IntegrityError:
+                raise TaskAlreadyExistsException
             for input_item in input_set:
                 task_input =TaskInput(
                     task=task,
@@ -221,6 +292,115 @@ class Task(BaseModel):
                 run.fail(detail='Error creating Task: "%s"' % str(e))
             raise
 
+    @classmethod
+    def create_from_input_sets(cls, input_sets, run, query_size=500):
+        """Creates Tasks for many InputSets at once, as with
+        create_from_input_set. Tasks, TaskInputs, TaskOutputs and the
+        DataNodes they need are written with bulk inserts.
+        InputSets that already have a Task are skipped.
+        Returns a list of new Tasks.
+        """
+        try:
+            tasks = []
+            data_path_hashes = set()
+            for input_set in input_sets:
+                task = Task(
+                    run=run,
+                    raw_command=run.command,
+                    interpreter=run.interpreter,
+                    environment=run.template.environment,
+                    resources=run.template.resources,
+                    data_path=input_set.data_path,
+                )
+                if not tasks:
+                    # Tasks differ only in data_path, which comes from
+                    # InputCalculator, so validating one is enough.
+                    task.full_clean(validate_unique=False)
+                task.data_path_hash = cls.get_data_path_hash(task.data_path)
+                if task.data_path_hash in data_path_hashes:
+                    continue
+                data_path_hashes.add(task.data_path_hash)
+                task._input_set = input_set
+                tasks.append(task)
+            data_path_hashes = list(data_path_hashes)
+            existing_hashes = set()
+            for i in range(0, len(data_path_hashes), query_size):
+                existing_hashes.update(run.tasks.filter(
+                    data_path_hash__in=data_path_hashes[i:i+query_size])\
+                    .values_list('data_path_hash', flat=True))
+            tasks = [task for task in tasks
+                     if task.data_path_hash not in existing_hashes]
+            if not tasks:
+                return []
+
+            InputItem.flatten_all(
+                [item for task in tasks for item in task._input_set])
+            run_outputs = run.outputs.all()
+            for task in tasks:
+                task._unsaved_inputs = [
+                    TaskInput(
+                        task=task,
+                        channel=input_item.channel,
+                        as_channel=input_item.as_channel,
+                        type=input_item.type,
+                        mode=input_item.mode,
+                        data_node=input_item.data_node)
+                    for input_item in task._input_set]
+                task._unsaved_outputs = [
+                    TaskOutput(
+                        channel=run_output.channel,
+                        as_channel=run_output.as_channel,
+                        type=run_output.type,
+                        task=task,
+                        mode=run_output.mode,
+                        source=run_output.source,
+                        parser=run_output.parser)
+                    for run_output in run_outputs]
+                task.command = task.render_command(
+                    inputs=task._unsaved_inputs, outputs=task._unsaved_outputs)
+
+            try:
+                with transaction.atomic():
+                    Task.bulk_create_with_ids(tasks)
+            except IntegrityError:
+                # Another process created some of these Tasks.
+                # Fall back to creating them one at a time.
+                new_tasks = []
+                for task in tasks:
+                    try:
+                        new_tasks.append(
+                            cls.create_from_input_set(task._input_set, run))
+                    except TaskAlreadyExistsException:
+                        pass
+                return new_tasks
+
+            for j, run_output in enumerate(run_outputs):
+                data_nodes = run_output.data_node.get_or_create_nodes(
+                    [task.data_path for task in tasks])
+                for task, data_node in zip(tasks, data_nodes):
+                    task._unsaved_outputs[j].data_node = data_node
+            task_inputs = []
+            task_outputs = []
+            for task in tasks:
+                for channel in task._unsaved_inputs + task._unsaved_outputs:
+                    # Task had no id when the channel was created
+                    channel.task_id = task.id
+                task_inputs.extend(task._unsaved_inputs)
+                task_outputs.extend(task._unsaved_outputs)
+            # Field values were copied from validated Runs and InputItems,
+            # so full_clean is skipped. It costs a query per foreign key.
+            TaskInput.objects.bulk_create(task_inputs)
+            TaskOutput.objects.bulk_create(task_outputs)
+            # bulk_create skips after_save
+            StatusChange.bulk_record('task', [task.id for task in tasks],
+                                     status=tasks[0].status)
+            response_cache.invalidate_tree(run.tree_id)
+            run.set_running_status()
+            return tasks
+        except Exception as e:
+            run.fail(detail='Error creating Task: "%s"' % str(e))
+            raise
+
     def create_and_activate_attempt(self):
         try:
             self._kill_children(
@@ -235,9 +415,11 @@ class Task(BaseModel):
             self.system_error(detail='Error creating TaskAttempt: "%s"' % str(e))
             raise
 
-    def get_input_context(self):
+    def get_input_context(self, inputs=None):
+        if inputs is None:
+            inputs = self.inputs.all()
         context = {}
-        for input in self.inputs.all():
+        for input in inputs:
             if input.as_channel:
                 channel = input.as_channel
             else:
@@ -252,12 +434,14 @@ class Task(BaseModel):
                 )
         return context
 
-    def get_output_context(self, input_context):
+    def get_output_context(self, input_context, outputs=None):
         # This returns a value only for Files, where the filename
         # is known beforehand and may be used in the command.
         # For other types, nothing is added to the context.
+        if outputs is None:
+            outputs = self.outputs.all()
         context = {}
-        for output in self.outputs.all():
+        for output in outputs:
             if output.as_channel:
                 channel = output.as_channel
             else:
@@ -267,15 +451,16 @@ class Task(BaseModel):
                     output.source.get('filename'), input_context)
         return context
     
-    def get_full_context(self):
-        context = self.get_input_context()
-        context.update(self.get_output_context(context))
+    def get_full_context(self, inputs=None, outputs=None):
+        # inputs and outputs may be given for a Task not yet saved
+        context = self.get_input_context(inputs=inputs)
+        context.update(self.get_output_context(context, outputs=outputs))
         return context
 
-    def render_command(self):
+    def render_command(self, inputs=None, outputs=None):
         return render_from_template(
             self.raw_command,
-            self.get_full_context())
+            self.get_full_context(inputs=inputs, outputs=outputs))
 
     def get_output(self, channel):
         return self.outputs.get(channel=channel)
@@ -286,6 +471,10 @@ class Task(BaseModel):
             detail=detail[-1000:], is_error=is_error)
         event.full_clean()
         event.save()
+        if self.run_id is not None:
+            StatusChange.record_event(self.run_id, 'task', self.uuid,
+                                      event.event, detail=event.detail,
+                                      is_error=event.is_error)
 
 
 class TaskInput(DataChannel):
@@ -334,3 +523,4 @@ class TaskEvent(BaseModel):
     event = models.CharField(max_length=255)
     detail = models.TextField(blank=True)
     is_error = models.BooleanField(default=False)
+
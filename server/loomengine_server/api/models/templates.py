@@ -62,6 +62,9 @@ class Template(BaseModel):
     )
     raw_data = jsonfield.JSONField(blank=True)
 
+    class Meta:
+        index_together = (('datetime_created', 'id'),)
+
     def get_name_and_id(self):
         return "%s@%s" % (self.name, self.id)
 
@@ -0,0 +1,98 @@
+import base64
+import collections
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(LimitOffsetPagination):
+    """Pages through an index newest first, seeking on
+    (datetime_created, id) instead of using OFFSET, so deep pages cost the
+    same as the first one. Pass ?page_size=N to get the first page. Each
+    page gives the URL of the next one, with an opaque ?cursor, until
+    "next" is null.
+
+    Without ?cursor or ?page_size, ?limit and ?offset work as before,
+    and without those the full index is returned.
+    """
+
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    default_page_size = 100
+    max_page_size = 1000
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.use_keyset = self.cursor_query_param in request.query_params \
+            or self.page_size_query_param in request.query_params
+        if not self.use_keyset:
+            return super(KeysetPagination, self).paginate_queryset(
+                queryset, request, view=view)
+        self.request = request
+        self.page_size = self._get_page_size(request)
+        queryset = queryset.order_by('-datetime_created', '-id')
+        cursor = self._decode_cursor(
+            request.query_params.get(self.cursor_query_param))
+        if cursor is not None:
+            datetime_created, id = cursor
+            queryset = queryset.filter(
+                Q(datetime_created__lt=datetime_created)
+                | Q(datetime_created=datetime_created, id__lt=id))
+        # Fetch one extra row to learn whether there is a next page
+        page = list(queryset[:self.page_size+1])
+        if len(page) > self.page_size:
+            page = page[:self.page_size]
+            self.next_cursor = self._encode_cursor(page[-1])
+        else:
+            self.next_cursor = None
+        return page
+
+    def get_paginated_response(self, data):
+        if not self.use_keyset:
+            return super(KeysetPagination, self).get_paginated_response(data)
+        return Response(collections.OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data)
+        ]))
+
+    def get_next_link(self):
+        if not self.use_keyset:
+            return super(KeysetPagination, self).get_next_link()
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(
+            url, self.page_size_query_param, self.page_size)
+        return replace_query_param(
+            url, self.cursor_query_param, self.next_cursor)
+
+    def _get_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get(
+                self.page_size_query_param, self.default_page_size))
+        except ValueError:
+            return self.default_page_size
+        if page_size < 1:
+            return self.default_page_size
+        return min(page_size, self.max_page_size)
+
+    def _encode_cursor(self, instance):
+        position = '%s,%s' % (instance.datetime_created.isoformat(),
+                              instance.id)
+        return base64.urlsafe_b64encode(position)
+
+    def _decode_cursor(self, cursor):
+        if not cursor:
+            return None
+        try:
+            datetime_string, id = base64.urlsafe_b64decode(
+                str(cursor)).rsplit(',', 1)
+            datetime_created = parse_datetime(datetime_string)
+            id = int(id)
+        except (TypeError, ValueError):
+            raise NotFound('Invalid cursor')
+        if datetime_created is None:
+            raise NotFound('Invalid cursor')
+        return datetime_created, id
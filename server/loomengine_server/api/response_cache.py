@@ -0,0 +1,88 @@
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.http import HttpResponse, HttpResponseNotModified
+import hashlib
+from rest_framework.renderers import JSONRenderer
+
+from api import get_setting
+
+
+"""Caches rendered detail and summary views of Runs and Templates.
+
+Entries are keyed on the object's uuid and _change, so any save or
+set-based UPDATE of the object itself makes old entries unreachable.
+Views of a Run also include its steps and Tasks, so saves anywhere in a
+Run tree bump a generation counter for that tree, which is part of the
+key as well.
+
+Responses carry a strong ETag, the md5 of the rendered body. A request
+with a matching If-None-Match gets 304 Not Modified. This works even
+with the default dummy cache, where the body is rendered every time.
+"""
+
+
+def _get_cache():
+    return caches['responses']
+
+def is_enabled():
+    return not isinstance(_get_cache(), DummyCache)
+
+def invalidate_tree(tree_id):
+    if tree_id is None or not is_enabled():
+        return
+    cache = _get_cache()
+    key = _get_tree_key(tree_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Missing or expired. Any value other than the last one will do.
+        cache.set(key, 1, None)
+
+def get_response(request, instance, serialize, is_terminal, tree_id=None):
+    """Return the rendered view of instance, from the cache if possible.
+    serialize() is called on a miss and returns the data to render.
+    Objects with a terminal status cannot change except by a save, so
+    they are kept much longer than active ones.
+    """
+    cache = _get_cache()
+    key = _get_response_key(request, instance, tree_id)
+    cached = cache.get(key)
+    if cached is None:
+        content = JSONRenderer().render(serialize())
+        cached = ('"%s"' % hashlib.md5(content).hexdigest(), content)
+        if is_terminal:
+            timeout = get_setting('RESPONSE_CACHE_TERMINAL_TTL_SECONDS')
+        else:
+            timeout = get_setting('RESPONSE_CACHE_ACTIVE_TTL_SECONDS')
+        if timeout > 0:
+            cache.set(key, cached, timeout)
+    etag, content = cached
+    if _etag_matches(request, etag):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(content, content_type='application/json')
+    response['ETag'] = etag
+    return response
+
+def _etag_matches(request, etag):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    return etag in [value.strip() for value in if_none_match.split(',')]
+
+def _get_tree_key(tree_id):
+    return 'tree-generation-%s' % tree_id
+
+def _get_response_key(request, instance, tree_id):
+    if tree_id is None:
+        generation = None
+    else:
+        generation = _get_cache().get(_get_tree_key(tree_id))
+    # The full URI covers query params such as ?summary and the host
+    # used in hyperlinked fields
+    return hashlib.md5((u'%s:%s:%s:%s:%s' % (
+        instance.__class__.__name__, instance.uuid, instance._change,
+        generation, request.build_absolute_uri())
+    ).encode('utf-8')).hexdigest()
@@ -1,6 +1,4 @@
-import copy
 from django.db import models
-from mptt.utils import get_cached_trees
 import jsonschema
 from rest_framework import serializers
 
@@ -102,54 +100,37 @@ class DataNodeSerializer(serializers.HyperlinkedModelSerializer):
         return minheight + 1
 
     def _create_data_node_from_data_objects(self, contents, data_type):
-        data_node = DataNode(type=data_type)
-        data_node.full_clean()
-        data_node.save()
-        self._add_data_objects(data_node, contents, data_type)
-        return data_node
-
-    def _add_data_objects(self, data_node, contents, data_type):
-        path = []
-        self._extend_all_paths_and_add_data_at_leaves(
-            data_node, contents, path, data_type)
-
-    def _extend_all_paths_and_add_data_at_leaves(
-            self, data_node, contents, path, data_type):
-        # Recursive function that extends 'path' until reaching a leaf node,
-        # where data is finally added.
-        # 'path' is the partial path to some intermediate
-        # node, while 'contents' is the representation of all branches and 
-        # leaves beyond that path.
-        # For example, given path (0,2) and contents [['10','20']['30','40']],
-        # the function places all data under (0,2) and ignores the other
-        # root-level branch (1,2).
-        # The function adds these four data objects at
-        # their corresponding paths:
-        # 10 at [(0,2), (0,2), (0,2)]
-        # 20 at [(0,2), (0,2), (1,2)]
-        # 30 at [(0,2), (1,2), (0,2)]
-        # 40 at [(0,2), (1,2), (1,2)]
-        if not isinstance(contents, list):
-            if isinstance(contents, dict):
-                s = DataObjectSerializer(data=contents, context=self.context)
-                s.is_valid(raise_exception=True)
-                data_object = s.save()
-            else:
-                data_object = DataObject.get_by_value(
-                    contents,
-                    data_type)
-            data_node.add_data_object(path, data_object)
-            return
-        elif len(contents) == 0:
-            # An empty list represents a node of degree 0
-            data_node.setattrs_and_save_with_retries({
-                'degree': 0})
+        # Convert all values in 'contents' to DataObjects first,
+        # then write the complete tree of DataNodes at once.
+        values = []
+        self._get_values(contents, values)
+        data_objects = iter(DataObject.get_by_value_list(values, data_type))
+        contents = self._replace_values_with_data_objects(
+            contents, data_objects)
+        return DataNode.create_tree(contents, data_type)
+
+    def _get_values(self, contents, values):
+        # Recursively collects all leaf values from 'contents', in order.
+        # Dicts are skipped since they are handled by DataObjectSerializer.
+        if isinstance(contents, list):
+            for item in contents:
+                self._get_values(item, values)
+        elif not isinstance(contents, dict):
+            values.append(contents)
+
+    def _replace_values_with_data_objects(self, contents, data_objects):
+        # Returns a copy of 'contents' with the same nesting, where each
+        # leaf is replaced by its DataObject. 'data_objects' is an iterator
+        # over DataObjects for the values found by _get_values.
+        if isinstance(contents, list):
+            return [self._replace_values_with_data_objects(item, data_objects)
+                    for item in contents]
+        elif isinstance(contents, dict):
+            s = DataObjectSerializer(data=contents, context=self.context)
+            s.is_valid(raise_exception=True)
+            return s.save()
         else:
-            for i in range(len(contents)):
-                path_i = copy.deepcopy(path)
-                path_i.append((i, len(contents)))
-                self._extend_all_paths_and_add_data_at_leaves(
-                    data_node, contents[i], path_i, data_type)
+            return next(data_objects)
 
 
 class ExpandedDataNodeSerializer(DataNodeSerializer):
@@ -190,8 +171,25 @@ class ExpandedDataNodeSerializer(DataNodeSerializer):
 
     def _apply_prefetch_to_instance(self, instance):
         if not hasattr(instance, '_cached_children'):
-            descendants = instance.get_descendants(include_self=True)
-            descendants = descendants.select_related('data_object')
-            descendants = descendants.select_related('data_object__file_resource')
-            instance = get_cached_trees(descendants)[0]
+            instance = instance.get_cached_tree()
         return instance
+
+
+class StreamDataNodeSerializer(serializers.ModelSerializer):
+    """One DataNode in an NDJSON export. Nodes are written flat, with the
+    uuid of their parent, instead of as nested contents. Only leaves have
+    a data_object.
+    """
+
+    class Meta:
+        model = DataNode
+        fields = ('uuid', 'parent', 'index', 'degree', 'type', 'data_object')
+
+    parent = serializers.SlugRelatedField(slug_field='uuid', read_only=True)
+    data_object = DataObjectSerializer(read_only=True)
+
+    @classmethod
+    def apply_prefetch(cls, queryset):
+        return queryset.select_related('parent')\
+                       .select_related('data_object')\
+                       .select_related('data_object__file_resource')
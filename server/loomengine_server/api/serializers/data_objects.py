@@ -78,14 +78,15 @@ class DataObjectSerializer(serializers.HyperlinkedModelSerializer):
         if not isinstance(value, dict):
             # If it's a string, treat it as a data_object identifier and
             # look it up.
-            data_objects = DataObject.filter_by_name_or_id_or_tag_or_hash(value)
-            if data_objects.count() == 0:
+            matches = DataObject.resolve_identifiers([value])[value]
+            if len(matches) == 0:
                 raise serializers.ValidationError(
                     'No matching DataObject found for "%s"' % value)
-            elif data_objects.count() > 1:
+            elif len(matches) > 1:
                 raise serializers.ValidationError(
                     'Multiple matching DataObjects found for "%s"' % value)
-            self._cached_data_object = data_objects.first()
+            self._cached_data_object = DataObject.objects.get(
+                id=matches[0][0])
             self._do_create_new_data_object = False
         else:
             # Otherwise, create new.
@@ -358,3 +358,31 @@ class ExpandedRunSerializer(RunSerializer):
             .prefetch_related(
                 'tasks__task_attempt__log_files__data_object__file_resource')\
             .prefetch_related('tasks__all_task_attempts')
+
+
+class StreamRunSerializer(RunSerializer):
+    """One Run in an NDJSON export. Tasks are left out, since each Task
+    is its own record and names its Run. "parent" links the Run to its
+    parent, so the tree can be rebuilt one record at a time.
+    """
+
+    class Meta:
+        model = Run
+        fields = [field for field in _run_serializer_fields
+                  if field != 'tasks'] + ['parent']
+
+    parent = serializers.SlugRelatedField(slug_field='uuid', read_only=True)
+
+    @classmethod
+    def apply_prefetch(cls, queryset):
+        return queryset\
+            .select_related('template')\
+            .select_related('parent')\
+            .prefetch_related('events')\
+            .prefetch_related('inputs')\
+            .prefetch_related('inputs__data_node')\
+            .prefetch_related('outputs')\
+            .prefetch_related('outputs__data_node')\
+            .prefetch_related('user_inputs')\
+            .prefetch_related('user_inputs__data_node')\
+            .prefetch_related('steps')
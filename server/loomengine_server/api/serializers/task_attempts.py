@@ -159,6 +159,10 @@ class TaskAttemptSerializer(serializers.HyperlinkedModelSerializer):
             attributes['environment_info'] = environment_info
         if resources_info is not None:
             attributes['resources_info'] = resources_info
+        if not attributes:
+            # An empty update is a heartbeat from an older task monitor
+            instance.heartbeat()
+            return instance
         instance = instance.setattrs_and_save_with_retries(attributes)
         return instance
 
@@ -219,3 +223,18 @@ class URLTaskAttemptSerializer(TaskAttemptSerializer):
     @classmethod
     def apply_prefetch(cls, queryset):
         return queryset
+
+
+class StreamTaskAttemptSerializer(TaskAttemptSerializer):
+    """One TaskAttempt in an NDJSON export, with the uuid of its Task"""
+
+    class Meta:
+        model = TaskAttempt
+        fields = TaskAttemptSerializer.Meta.fields + ['task']
+
+    task = serializers.SlugRelatedField(slug_field='uuid', read_only=True)
+
+    @classmethod
+    def apply_prefetch(cls, queryset):
+        return super(StreamTaskAttemptSerializer, cls).apply_prefetch(
+            queryset.select_related('task'))
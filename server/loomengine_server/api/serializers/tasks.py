@@ -198,3 +198,18 @@ class ExpandedTaskSerializer(TaskSerializer):
 
 #    all_task_attempts = TaskAttemptSerializer(many=True)
     task_attempt = TaskAttemptSerializer()
+
+
+class StreamTaskSerializer(TaskSerializer):
+    """One Task in an NDJSON export, with the uuid of its Run"""
+
+    class Meta:
+        model = Task
+        fields = TaskSerializer.Meta.fields + ['run']
+
+    run = serializers.SlugRelatedField(slug_field='uuid', read_only=True)
+
+    @classmethod
+    def apply_prefetch(cls, queryset):
+        return super(StreamTaskSerializer, cls).apply_prefetch(
+            queryset.select_related('run'))
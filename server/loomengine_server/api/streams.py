@@ -0,0 +1,170 @@
+from django.db.models import Max, Q
+import json
+import time
+
+from api import models
+from api import serializers
+
+
+"""Streams a Run tree as newline-delimited JSON, one record per line.
+Each record is {"type": ..., "data": ...}, with type "run", "task",
+"task_attempt", or "data_node". Records refer to each other by uuid,
+so a client can rebuild the tree without holding the whole response.
+The last record has type "end" and gives the number of records of
+each type, so a truncated stream can be detected.
+
+Objects are read in chunks of chunk_size, ordered by id, so memory
+does not grow with the size of the tree.
+"""
+
+
+def stream_run_tree(run, context, chunk_size=100):
+    counts = {}
+    for record_type, queryset, Serializer in _get_querysets(run):
+        counts[record_type] = 0
+        for instance in _iterate_in_chunks(
+                Serializer.apply_prefetch(queryset), chunk_size):
+            data = Serializer(instance, context=context).data
+            counts[record_type] += 1
+            yield _to_line(record_type, data)
+    yield _to_line('end', counts)
+
+def _get_querysets(run):
+    runs = run.get_descendants(include_self=True)
+    tasks = models.Task.objects.filter(run__tree_id=run.tree_id,
+                                       run__lft__gte=run.lft,
+                                       run__rght__lte=run.rght)
+    task_attempts = models.TaskAttempt.objects.filter(task__in=tasks)
+    # Each channel points to a node in some DataNode tree. Export the
+    # whole tree, so that both the node and its contents can be found.
+    tree_ids = Q()
+    for channels in (
+            models.UserInput.objects.filter(run__in=runs),
+            models.RunInput.objects.filter(run__in=runs),
+            models.RunOutput.objects.filter(run__in=runs),
+            models.TaskInput.objects.filter(task__in=tasks),
+            models.TaskOutput.objects.filter(task__in=tasks),
+            models.TaskAttemptInput.objects.filter(
+                task_attempt__in=task_attempts),
+            models.TaskAttemptOutput.objects.filter(
+                task_attempt__in=task_attempts)):
+        tree_ids |= Q(tree_id__in=channels.values('data_node__tree_id'))
+    data_nodes = models.DataNode.objects.filter(tree_ids)
+    return [
+        ('run', runs, serializers.StreamRunSerializer),
+        ('task', tasks, serializers.StreamTaskSerializer),
+        ('task_attempt', task_attempts,
+         serializers.StreamTaskAttemptSerializer),
+        ('data_node', data_nodes, serializers.StreamDataNodeSerializer),
+    ]
+
+def _iterate_in_chunks(queryset, chunk_size):
+    # Seek on id instead of using OFFSET, which rescans skipped rows
+    last_id = None
+    while True:
+        chunk = queryset.order_by('id')
+        if last_id is not None:
+            chunk = chunk.filter(id__gt=last_id)
+        chunk = list(chunk[:chunk_size])
+        if not chunk:
+            return
+        for instance in chunk:
+            yield instance
+        last_id = chunk[-1].id
+
+def _to_line(record_type, data):
+    return json.dumps({'type': record_type, 'data': data}) + '\n'
+
+
+"""Streams status changes in one or more Run subtrees as Server-Sent
+Events, so clients can follow Runs without polling them. Each change is
+sent as "status" or "event" with the id of its StatusChange. A client
+that reconnects with that id as Last-Event-ID gets only later changes.
+A new client, or one whose id has expired, first gets the current
+status of every object in the subtrees.
+
+Each open stream holds a server worker, so this is a long poll: the
+stream closes as soon as it has sent changes, or after max_seconds
+without any, and the client reconnects after the "retry" delay. Once
+every Run has a terminal status, the stream sends an "end" event for
+each Run and closes.
+"""
+
+
+def stream_status_changes(runs, last_id=None, poll_interval=1,
+                          max_seconds=5, chunk_size=100):
+    yield 'retry: %d\n\n' % (max(poll_interval, 1) * 1000)
+    sent_current_status = False
+    if last_id is None or _is_expired(last_id):
+        last_id = models.StatusChange.objects.aggregate(
+            Max('id'))['id__max'] or 0
+        for run in runs:
+            for data in _get_current_status(run):
+                yield _to_event('status', data, id=last_id)
+        sent_current_status = True
+    run_ids = [run.id for run in runs]
+    start_time = time.time()
+    while True:
+        # Check for terminal statuses first, so that no change made
+        # before a Run finished can be missed
+        runs = list(models.Run.objects.filter(id__in=run_ids).only(
+            'uuid', 'tree_id', 'lft', 'rght', 'status_is_finished',
+            'status_is_failed', 'status_is_killed'))
+        is_terminal = all(run.has_terminal_status() for run in runs)
+        changes = list(models.StatusChange.get_subtree_changes(
+            runs, after_id=last_id)[:chunk_size])
+        for change in changes:
+            event_type = 'event' if change.event else 'status'
+            yield _to_event(event_type, change.to_dict(), id=change.id)
+            last_id = change.id
+        if len(changes) == chunk_size:
+            continue
+        elif changes:
+            return
+        elif is_terminal:
+            for run in runs:
+                yield _to_event('end', {'type': 'run', 'uuid': run.uuid,
+                                        'run': run.uuid,
+                                        'status': run.status},
+                                id=last_id)
+            return
+        if sent_current_status or time.time() - start_time > max_seconds:
+            return
+        time.sleep(poll_interval)
+
+def _is_expired(last_id):
+    return not models.StatusChange.objects.filter(id__lte=last_id).exists()
+
+def _get_current_status(run):
+    # Subqueries rather than lists of ids, which may be too long for
+    # one query
+    runs = run.get_descendants(include_self=True)
+    run_uuids = {}
+    for step in runs.only('uuid', *_RUN_STATUS_FIELDS):
+        run_uuids[step.id] = step.uuid
+        yield {'type': 'run', 'uuid': step.uuid, 'run': step.uuid,
+               'status': step.status}
+    task_run_ids = {}
+    tasks = models.Task.objects.filter(run__in=runs)
+    for task in tasks.only('uuid', 'run', *_RUN_STATUS_FIELDS):
+        task_run_ids[task.id] = task.run_id
+        yield {'type': 'task', 'uuid': task.uuid,
+               'run': run_uuids[task.run_id], 'status': task.status}
+    for task_attempt in models.TaskAttempt.objects.filter(
+            task__in=tasks).only(
+                'uuid', 'task', *_TASK_ATTEMPT_STATUS_FIELDS):
+        yield {'type': 'task_attempt', 'uuid': task_attempt.uuid,
+               'run': run_uuids[task_run_ids[task_attempt.task_id]],
+               'status': task_attempt.status}
+
+_TASK_ATTEMPT_STATUS_FIELDS = ('status_is_finished', 'status_is_failed',
+                               'status_is_killed', 'status_is_running')
+_RUN_STATUS_FIELDS = _TASK_ATTEMPT_STATUS_FIELDS + ('status_is_waiting',)
+
+def _to_event(event_type, data, id=None):
+    lines = []
+    if id is not None:
+        lines.append('id: %s' % id)
+    lines.append('event: %s' % event_type)
+    lines.append('data: %s' % json.dumps(data))
+    return '\n'.join(lines) + '\n\n'
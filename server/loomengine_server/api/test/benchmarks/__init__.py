@@ -0,0 +1,20 @@
+import os
+import sys
+
+
+"""Benchmarks that time a slow path against its replacement. They are
+not collected by the test runner. Run each module from the directory
+of manage.py, e.g.
+
+python -m api.test.benchmarks.benchmark_task_creation
+"""
+
+
+def setup_django():
+    # Same as manage.py
+    sys.path.append(os.path.join(
+        os.path.dirname(__file__), '..', '..', '..', '..'))
+    os.environ.setdefault(
+        'DJANGO_SETTINGS_MODULE', 'loomengine_server.core.settings')
+    import django
+    django.setup()
@@ -0,0 +1,73 @@
+import argparse
+import time
+
+
+"""Compare the speed of building a DataNode tree one leaf at a time
+with add_data_object against the bulk insert used by DataNodeSerializer.
+Changes are rolled back, so this is safe to run against a live database.
+
+cd server/loomengine_server
+python -m api.test.benchmarks.benchmark_data_node_creation --breadth 10 --depth 3
+"""
+
+
+def get_raw_data_integer_tree(breadth, depth):
+    if depth == 0:
+        return 0
+    return [get_raw_data_integer_tree(breadth, depth-1)
+            for i in range(breadth)]
+
+def count_nodes(raw_data):
+    if not isinstance(raw_data, list):
+        return 1
+    return 1 + sum([count_nodes(item) for item in raw_data])
+
+def create_by_leaf(raw_data):
+    from api.models import DataNode
+    root = DataNode.objects.create(type='string')
+    _add_leaves(root, raw_data, [])
+    return root
+
+def _add_leaves(root, raw_data, path):
+    from api.models import DataObject
+    if not isinstance(raw_data, list):
+        root.add_data_object(
+            path, DataObject.get_by_value(raw_data, 'string'))
+        return
+    for i in range(len(raw_data)):
+        _add_leaves(root, raw_data[i], path + [(i, len(raw_data))])
+
+def create_in_bulk(raw_data):
+    from api.serializers import DataNodeSerializer
+    s = DataNodeSerializer(
+        data={'contents': raw_data}, context={'type': 'string'})
+    s.is_valid(raise_exception=True)
+    return s.save()
+
+def main(args):
+    from django.db import transaction
+    raw_data = get_raw_data_integer_tree(args.breadth, args.depth)
+    node_count = count_nodes(raw_data)
+    for label, create in (
+            ('add_data_object', create_by_leaf),
+            ('bulk', create_in_bulk)):
+        with transaction.atomic():
+            start = time.time()
+            create(raw_data)
+            elapsed = time.time() - start
+            transaction.set_rollback(True)
+        print "%s: %s nodes in %.2fs (%.0f nodes/s)" % (
+            label, node_count, elapsed, node_count / elapsed)
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description='Measure DataNode tree creation speed in nodes per second')
+    parser.add_argument('--breadth', type=int, default=10)
+    parser.add_argument('--depth', type=int, default=3)
+    return parser
+
+
+if __name__ == '__main__':
+    from api.test.benchmarks import setup_django
+    setup_django()
+    main(get_parser().parse_args())
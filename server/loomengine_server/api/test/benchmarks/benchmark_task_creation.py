@@ -0,0 +1,68 @@
+import argparse
+import os
+import time
+
+
+"""Compare the speed of creating Tasks for a scatter one at a time
+with create_from_input_set against the batch create_from_input_sets.
+Changes are rolled back, so this is safe to run against a live database.
+
+cd server/loomengine_server
+python -m api.test.benchmarks.benchmark_task_creation --sizes 1000,10000,100000
+"""
+
+
+def get_run_and_input_sets(size):
+    from django.test.utils import override_settings
+    from api.models.input_calculator import InputCalculator
+    from api.test.helper import request_run_from_template_file
+    with override_settings(TEST_DISABLE_ASYNC_DELAY=True,
+                           TEST_NO_CREATE_TASK=True):
+        run = request_run_from_template_file(
+            os.path.join(os.path.dirname(__file__), '..',
+                         'fixtures', 'simple', 'simple.yaml'),
+            word_in=['word%s' % i for i in range(size)])
+    input_sets = InputCalculator(run.inputs.all(), 'word_in', [])\
+                 .get_input_sets()
+    return run, input_sets
+
+def create_one_at_a_time(input_sets, run):
+    from api.models import Task
+    for input_set in input_sets:
+        Task.create_from_input_set(input_set, run)
+
+def create_in_batch(input_sets, run):
+    from api.models import Task
+    Task.create_from_input_sets(input_sets, run)
+
+def main(args):
+    from django.db import transaction
+    methods = [('batch', create_in_batch)]
+    if not args.skip_one_at_a_time:
+        methods.insert(0, ('one at a time', create_one_at_a_time))
+    for size in [int(size) for size in args.sizes.split(',')]:
+        for label, create in methods:
+            with transaction.atomic():
+                run, input_sets = get_run_and_input_sets(size)
+                start = time.time()
+                create(input_sets, run)
+                elapsed = time.time() - start
+                transaction.set_rollback(True)
+            print "%s tasks, %s: %.2fs (%.0f tasks/s)" % (
+                size, label, elapsed, size / elapsed)
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description='Measure Task creation speed for scatters of '\
+        'different sizes')
+    parser.add_argument('--sizes', default='1000,10000,100000',
+                        help='comma-separated list of scatter sizes')
+    parser.add_argument('--skip-one-at-a-time', action='store_true',
+                        help='only measure batch creation')
+    return parser
+
+
+if __name__ == '__main__':
+    from api.test.benchmarks import setup_django
+    setup_django()
+    main(get_parser().parse_args())
@@ -246,3 +246,118 @@ class TestDataNode(TestCase):
         node = tree.get_or_create_node([(2,3),(3,5)])
         new_node = tree.get_node([(2,3),(3,5)])
         self.assertEqual(new_node.uuid, node.uuid)
+
+    def testCreateTree(self):
+        contents = [[_get_string_data_object(value) for value in branch]
+                    for branch in [['i'], ['a','m'], ['r','o','b','o','t']]]
+        tree = DataNode.create_tree(contents, 'string')
+
+        self.assertEqual(tree.get_data_object([(0,3),(0,1)]).substitution_value, 'i')
+        self.assertEqual(tree.get_data_object([(1,3),(1,2)]).substitution_value, 'm')
+        self.assertEqual(tree.get_data_object([(2,3),(4,5)]).substitution_value, 't')
+        self.assertTrue(tree.is_ready())
+
+    def testCreateTree_mpttFields(self):
+        # Fields computed in memory should match a tree built node by node
+        contents = [[_get_string_data_object(value) for value in branch]
+                    for branch in [['i'], ['a','m'], ['r','o','b','o','t']]]
+        tree1 = DataNode.create_tree(contents, 'string')
+        tree2 = self.getTree(self.INPUT_DATA)
+
+        def get_fields(tree):
+            return sorted([(node.lft, node.rght, node.level,
+                            node.index, node.degree)
+                           for node in tree.get_descendants(include_self=True)])
+        self.assertEqual(get_fields(tree1), get_fields(tree2))
+
+    def testCreateTree_leaf(self):
+        data_object = _get_string_data_object('leaf')
+        tree = DataNode.create_tree(data_object, 'string')
+        self.assertTrue(tree.is_leaf)
+        self.assertEqual(tree.get_data_object([]).uuid, data_object.uuid)
+
+    def testCreateTree_emptyBranch(self):
+        tree = DataNode.create_tree([], 'string')
+        self.assertEqual(DataNode.objects.get(uuid=tree.uuid).degree, 0)
+        self.assertTrue(tree._is_empty_branch())
+
+    def testCreateTree_saveAfterCreate(self):
+        contents = [_get_string_data_object('a'), _get_string_data_object('b')]
+        tree = DataNode.create_tree(contents, 'string')
+        tree.setattrs_and_save_with_retries({})
+        tree = DataNode.objects.get(uuid=tree.uuid)
+        self.assertEqual((tree.lft, tree.rght), (1, 6))
+        child = tree.get_node([(1,2)])
+        self.assertEqual(child.parent.uuid, tree.uuid)
+        self.assertEqual(child.tree_id, tree.tree_id)
+
+    def testGetReadyDataNodes(self):
+        tree = self.getTree(self.INPUT_DATA[:-1])
+        ready_nodes = tree.get_ready_data_nodes([(2,3)], 0)
+        self.assertEqual([path for path, node in ready_nodes],
+                         [[(2,3),(0,5)], [(2,3),(1,5)], [(2,3),(2,5)],
+                          [(2,3),(3,5)]])
+        self.assertEqual(ready_nodes[3][1].data_object.substitution_value, 'o')
+
+    def testGetReadyDataNodes_gather(self):
+        tree = self.getTree(self.INPUT_DATA[:-1])
+        ready_nodes = tree.get_ready_data_nodes([], 1)
+        # Branch (2,3) is missing a leaf, so it is not ready
+        self.assertEqual([path for path, node in ready_nodes],
+                         [[(0,3)], [(1,3)]])
+
+    def testGetCachedTree(self):
+        tree = self.getTree(self.INPUT_DATA).get_cached_tree()
+        with self.assertNumQueries(0):
+            self.assertTrue(tree.is_ready())
+            self.assertEqual(
+                tree.get_node([(2,3),(4,5)]).data_object.substitution_value,
+                't')
+            self.assertEqual(len(tree._get_all_paths([], 0)), 8)
+
+    def assertTreeFieldsAreValid(self, root):
+        nodes = list(DataNode.objects.filter(tree_id=root.tree_id))
+        self.assertEqual(sorted([n.lft for n in nodes] + [n.rght for n in nodes]),
+                         range(1, 2*len(nodes)+1))
+        for node in nodes:
+            children = [n for n in nodes if n.parent_id == node.id]
+            descendants = [n for n in nodes
+                           if node.lft < n.lft and n.rght < node.rght]
+            self.assertEqual(node.rght - node.lft - 1, 2 * len(descendants))
+            for child in children:
+                self.assertEqual(child.level, node.level + 1)
+                self.assertIn(child, descendants)
+
+    def testGetOrCreateNodes(self):
+        tree = self.getTree(self.INPUT_DATA[:2])
+        paths = [[(1,3),(1,2)], [(2,3),(3,5)], [(2,3),(4,5)], [(1,3),(0,2)]]
+        nodes = tree.get_or_create_nodes(paths)
+
+        for path, node in zip(paths, nodes):
+            self.assertEqual(tree.get_node(path).uuid, node.uuid)
+        # Existing node is returned
+        self.assertEqual(nodes[3].data_object.substitution_value, 'a')
+        self.assertTreeFieldsAreValid(tree)
+
+    def testGetOrCreateNodes_emptyTree(self):
+        tree = DataNode.objects.create(type='string')
+        paths = [[(i,4)] for i in range(4)]
+        nodes = tree.get_or_create_nodes(paths)
+        self.assertEqual(DataNode.objects.get(uuid=tree.uuid).degree, 4)
+        self.assertEqual([node.index for node in nodes], range(4))
+        self.assertTreeFieldsAreValid(tree)
+
+    def testGetOrCreateNodes_savesDegreeOfExistingBranch(self):
+        tree = DataNode.objects.create(type='string')
+        tree.get_or_create_nodes([[(0,2)]])
+        nodes = tree.get_or_create_nodes([[(0,2),(i,3)] for i in range(3)])
+        branch = DataNode.objects.get(uuid=tree.get_node([(0,2)]).uuid)
+        self.assertEqual(branch.degree, 3)
+        self.assertEqual(
+            [node.parent_id for node in nodes], [branch.id] * 3)
+        self.assertTreeFieldsAreValid(tree)
+
+    def testGetOrCreateNodes_degreeMismatch(self):
+        tree = self.getTree(self.INPUT_DATA)
+        with self.assertRaises(DegreeMismatchError):
+            tree.get_or_create_nodes([[(2,3),(3,4)]])
@@ -1,8 +1,11 @@
 import os
+import shutil
+import tempfile
 from django.test import TestCase
 from django.core.exceptions import ValidationError
 
 from api.models.data_objects import DataObject, FileResource
+from api.models.tags import DataTag
 
 
 md5_1 = 'd8e8fca2dc0f896fd7cb4cb0031ba249'
@@ -105,6 +108,34 @@ class TestDataObject(TestCase):
             DataObject.get_by_value(filename_1, 'file')
 
 
+    def testGetByValueList_file(self):
+        md5s = ['%s%s' % (i, md5_1[1:]) for i in range(3)]
+        data_objects = [DataObject.create_and_initialize_file_resource(
+            filename='file%s.txt' % i, md5=md5s[i], source_type='result')
+                        for i in range(3)]
+        DataTag.objects.create(tag='mytag', data_object=data_objects[2])
+        identifiers = [
+            'file0.txt',
+            '$%s' % md5s[1][:8].upper(),
+            ':mytag',
+            'file0.txt@%s' % data_objects[0].uuid[:8],
+            'file0.txt',
+        ]
+        # One query to resolve the identifiers, one to load the files
+        with self.assertNumQueries(2):
+            retrieved = DataObject.get_by_value_list(identifiers, 'file')
+        self.assertEqual(
+            [do.uuid for do in retrieved],
+            [data_objects[i].uuid for i in [0, 1, 2, 0, 0]])
+
+    def testGetByValueList_fileNoMatch(self):
+        DataObject.create_and_initialize_file_resource(
+            filename=filename_1, md5=md5_1, source_type='result')
+        with self.assertRaises(ValidationError):
+            DataObject.get_by_value_list(
+                [filename_1, '%s:missingtag' % filename_1], 'file')
+
+
 class TestFileResource(TestCase):
 
     def testInitialize(self):
@@ -136,3 +167,86 @@ class TestFileResource(TestCase):
             data_object=data_object, filename=filename_1,
             md5=md5_1, source_type='result')
         self.assertEqual(resource.get_uuid(), data_object.uuid)
+
+
+class TestContentAddressedStorage(TestCase):
+
+    def setUp(self):
+        self.storage_root = tempfile.mkdtemp()
+        self.settings_override = self.settings(
+            STORAGE_CONTENT_ADDRESSED=True,
+            STORAGE_TYPE='local',
+            STORAGE_ROOT=self.storage_root)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.storage_root)
+
+    def _create_file(self, source_type='imported'):
+        return DataObject.create_and_initialize_file_resource(
+            filename=filename_1, md5=md5_1, source_type=source_type)
+
+    def _write_blob(self, path, age_seconds=7200):
+        os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write('test\n')
+        mtime = os.path.getmtime(path) - age_seconds
+        os.utime(path, (mtime, mtime))
+
+    def testInitialize(self):
+        do = self._create_file()
+        self.assertEqual(
+            do.file_resource.file_url,
+            'file://%s/blobs/d8/e8/%s' % (self.storage_root, md5_1))
+        self.assertEqual(do.file_resource.upload_status, 'incomplete')
+
+    def testDuplicateIsComplete(self):
+        first = self._create_file()
+        second = self._create_file(source_type='result')
+        self.assertEqual(second.file_resource.upload_status, 'incomplete')
+        first.file_resource.setattrs_and_save_with_retries(
+            {'upload_status': 'complete'})
+        third = self._create_file()
+        self.assertEqual(third.file_resource.file_url,
+                         first.file_resource.file_url)
+        self.assertEqual(third.file_resource.upload_status, 'complete')
+
+    def testLogsNotContentAddressed(self):
+        do = self._create_file(source_type='log')
+        self.assertTrue('/logs/' in do.file_resource.file_url)
+
+    def testCollectUnreferencedBlobs(self):
+        referenced_path = self._create_file().file_resource.file_url[
+            len('file://'):]
+        self._write_blob(referenced_path)
+        md5_2 = 'a' * 32
+        unreferenced_path = os.path.join(
+            self.storage_root, 'blobs', 'aa', 'aa', md5_2)
+        self._write_blob(unreferenced_path)
+        recent_path = os.path.join(
+            self.storage_root, 'blobs', 'bb', 'bb', 'b' * 32)
+        self._write_blob(recent_path, age_seconds=0)
+
+        self.assertEqual(
+            FileResource.collect_unreferenced_blobs(dry_run=True),
+            [unreferenced_path])
+        self.assertTrue(os.path.exists(unreferenced_path))
+        self.assertEqual(FileResource.collect_unreferenced_blobs(),
+                         [unreferenced_path])
+        self.assertFalse(os.path.exists(unreferenced_path))
+        self.assertTrue(os.path.exists(referenced_path))
+        self.assertTrue(os.path.exists(recent_path))
+
+    def testCollectUnreferencedBlobsInChunks(self):
+        referenced_path = self._create_file().file_resource.file_url[
+            len('file://'):]
+        self._write_blob(referenced_path)
+        for md5 in ['a' * 32, 'b' * 32]:
+            self._write_blob(os.path.join(
+                self.storage_root, 'blobs', md5[0:2], md5[2:4], md5))
+        # One query for each chunk, not one for each file
+        with self.assertNumQueries(2):
+            deleted = FileResource.collect_unreferenced_blobs(query_size=2)
+        self.assertEqual(len(deleted), 2)
+        self.assertTrue(os.path.exists(referenced_path))
@@ -1,6 +1,7 @@
 from django.test import TestCase
 
-from api.models import render_from_template, render_string_or_list, ArrayInputContext
+from api.models import render_from_template, render_string_or_list, \
+    ArrayInputContext, TemplateCache, template_cache
 
 
 class TestRenderFromTemplate(TestCase):
@@ -11,6 +12,30 @@ class TestRenderFromTemplate(TestCase):
         rendered_text = render_from_template(raw_text, context)
         self.assertEqual(rendered_text, 'My name is Inigo')
 
+    def testRenderFromTemplateUsesCache(self):
+        template_cache.clear()
+        raw_text = 'You killed my {{relation}}'
+        render_from_template(raw_text, {'relation': 'father'})
+        rendered_text = render_from_template(raw_text, {'relation': 'uncle'})
+        self.assertEqual(rendered_text, 'You killed my uncle')
+        stats = template_cache.get_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+class TestTemplateCache(TestCase):
+
+    def testLeastRecentlyUsedIsEvicted(self):
+        with self.settings(TEMPLATE_CACHE_SIZE=2):
+            cache = TemplateCache()
+            cache.get_template('{{one}}')
+            cache.get_template('{{two}}')
+            cache.get_template('{{one}}')
+            cache.get_template('{{three}}')
+            self.assertEqual(cache.get_stats()['size'], 2)
+            cache.get_template('{{one}}')
+            cache.get_template('{{two}}')
+            self.assertEqual(cache.get_stats()['hits'], 2)
+            self.assertEqual(cache.get_stats()['misses'], 4)
+
 class TestRenderFromStringOrList(TestCase):
 
     def testString(self):
@@ -292,6 +292,22 @@ class TestInputCalculator(TestCase):
         input_items = input_sets[0].input_items
         self.assertEqual(len(input_items), 2)
 
+
+    def testInputItemIsFlattenedLazily(self):
+        channel = 'a_parallel_channel'
+        step_run_input = getInputWithFullTree(
+            mode='gather(2)', channel_name=channel, group=0)
+        t = InputCalculator([step_run_input], channel, [])
+        input_item = t.get_input_sets()[0].input_items[0]
+        node_count = DataNode.objects.count()
+        self.assertFalse(input_item.is_flattened)
+        self.assertEqual(input_item.type, 'string')
+        self.assertEqual(DataNode.objects.count(), node_count)
+
+        data_node = input_item.data_node
+        self.assertEqual(DataNode.objects.count(), node_count + 9)
+        self.assertEqual(input_item.data_node.uuid, data_node.uuid)
+        self.assertEqual(t.record_skipped_clones(), 0)
         
 class TestInputSetGeneratorNode(TestCase):
 
@@ -3,7 +3,10 @@ import yaml
 
 from api.test.models.test_templates import get_workflow
 from api.models.data_objects import *
-from api.models.runs import Run, TaskNode
+from api.exceptions import ConcurrentModificationError
+from api.models.runs import Run
+from api.models.tasks import TaskEvent, TaskOutput
+from api.models.task_attempts import TaskAttempt, TaskAttemptEvent
 from api.models.input_calculator import InputCalculator
 from api.test.helper import request_run_from_template_file
 
@@ -49,76 +52,220 @@ class TestInputCalculator(TestCase):
         self.assertEqual(len(input_items), 1)
         self.assertEqual(input_items[0].channel, 'word_in')
 
+class TestKillChildren(TestCase):
+
+    def testKill(self):
+        with self.settings(TEST_DISABLE_ASYNC_DELAY=True,
+                           TEST_NO_RUN_TASK_ATTEMPT=True):
+            run = request_run_from_template_file(
+                os.path.join(os.path.dirname(__file__), '..', '..', 'test',
+                             'fixtures', 'simple', 'simple.yaml'),
+                word_in=['puppy', 'kitten', 'duckling'])
+        run = Run.objects.get(id=run.id)
+        self.assertEqual(run.tasks.filter(status_is_running=True).count(), 3)
+        stale_task = run.tasks.first()
+        with self.settings(TEST_DISABLE_ASYNC_DELAY=True, PRESERVE_ALL=True):
+            run.kill(detail='Killed by test')
+        self.assertEqual(run.tasks.filter(status_is_killed=True).count(), 3)
+        self.assertEqual(
+            TaskEvent.objects.filter(task__run=run,
+                                     event='Task was killed').count(), 3)
+        task_attempts = TaskAttempt.objects.filter(task__run=run)
+        self.assertEqual(task_attempts.count(), 3)
+        self.assertEqual(task_attempts.filter(status_is_killed=True,
+                                              status_is_running=False).count(),
+                         3)
+        # _change was incremented, so a copy loaded before the kill
+        # cannot overwrite it
+        with self.assertRaises(ConcurrentModificationError):
+            stale_task.save()
+
+    def testKillCleansUpOnlyKilledAttempts(self):
+        with self.settings(TEST_DISABLE_ASYNC_DELAY=True,
+                           TEST_NO_RUN_TASK_ATTEMPT=True):
+            run = request_run_from_template_file(
+                os.path.join(os.path.dirname(__file__), '..', '..', 'test',
+                             'fixtures', 'simple', 'simple.yaml'),
+                word_in=['puppy', 'kitten'])
+        run = Run.objects.get(id=run.id)
+        finished, running = TaskAttempt.objects.filter(task__run=run)
+        finished.setattrs_and_save_with_retries(
+            {'status_is_finished': True, 'status_is_running': False})
+        with self.settings(TEST_DISABLE_ASYNC_DELAY=True, PRESERVE_ALL=True):
+            run.kill(detail='Killed by test')
+        skipped = TaskAttemptEvent.objects.filter(
+            event='Skipped cleanup because PRESERVE_ALL is True')
+        self.assertEqual([event.task_attempt_id for event in skipped],
+                         [running.id])
+
 class MockTask(object):
 
     def __init__(self, data_path=[], status_is_finished=True):
         self.status_is_finished = status_is_finished
         self.data_path = data_path
 
-class TestTaskNode(TestCase):
+def is_complete(tasks):
+    expected = Run.get_expected_task_count([task.data_path for task in tasks])
+    finished = len([task for task in tasks if task.status_is_finished])
+    return finished >= expected
+
+class TestExpectedTaskCount(TestCase):
 
     def testEmpty(self):
-        node = TaskNode()
-        self.assertFalse(node.is_complete())
+        tasks = []
+        self.assertFalse(is_complete(tasks))
 
     def testScalarWithFinishedStatus(self):
         task = MockTask(status_is_finished=True)
-        tree = TaskNode.create_from_task_list([task])
-        self.assertTrue(tree.is_complete())
+        tasks = [task]
+        self.assertTrue(is_complete(tasks))
 
     def testScalarWithUnfinishedStatus(self):
         task = MockTask(status_is_finished=False)
-        tree = TaskNode.create_from_task_list([task])
-        self.assertFalse(tree.is_complete())
+        tasks = [task]
+        self.assertFalse(is_complete(tasks))
 
     def testArrayWithFinishedStatus(self):
         task1 = MockTask(status_is_finished=True, data_path=[[0,2]])
         task2 = MockTask(status_is_finished=True, data_path=[[1,2]])
-        tree = TaskNode.create_from_task_list([task1,task2])
-        self.assertTrue(tree.is_complete())
+        tasks = [task1,task2]
+        self.assertTrue(is_complete(tasks))
 
     def testArrayWithUnfinishedStatus(self):
         task1 = MockTask(status_is_finished=True, data_path=[[0,2]])
         task2 = MockTask(status_is_finished=False, data_path=[[1,2]])
-        tree = TaskNode.create_from_task_list([task1,task2])
-        self.assertFalse(tree.is_complete())
+        tasks = [task1,task2]
+        self.assertFalse(is_complete(tasks))
 
     def testArrayWithFinishedStatusAndMissingNodes(self):
         task1 = MockTask(status_is_finished=True, data_path=[[0,2]])
-        tree = TaskNode.create_from_task_list([task1])
-        self.assertFalse(tree.is_complete())
+        tasks = [task1]
+        self.assertFalse(is_complete(tasks))
 
     def testArrayWithUnfinishedStatusAndMissingNodes(self):
         task1 = MockTask(status_is_finished=False, data_path=[[0,2]])
-        tree = TaskNode.create_from_task_list([task1])
-        self.assertFalse(tree.is_complete())
+        tasks = [task1]
+        self.assertFalse(is_complete(tasks))
 
     def testTreeWithFinishedStatus(self):
         task11 = MockTask(status_is_finished=True, data_path=[[0,2],[0,2]])
         task12 = MockTask(status_is_finished=True, data_path=[[0,2],[1,2]])
         task21 = MockTask(status_is_finished=True, data_path=[[1,2],[0,2]])
         task22 = MockTask(status_is_finished=True, data_path=[[1,2],[1,2]])
-        tree = TaskNode.create_from_task_list([task11,task12,task21,task22])
-        self.assertTrue(tree.is_complete())
+        tasks = [task11,task12,task21,task22]
+        self.assertTrue(is_complete(tasks))
 
     def testTreeWithUnfinishedStatus(self):
         task11 = MockTask(status_is_finished=True, data_path=[[0,2],[0,2]])
         task12 = MockTask(status_is_finished=True, data_path=[[0,2],[1,2]])
         task21 = MockTask(status_is_finished=False, data_path=[[1,2],[0,2]])
         task22 = MockTask(status_is_finished=True, data_path=[[1,2],[1,2]])
-        tree = TaskNode.create_from_task_list([task11,task12,task21,task22])
-        self.assertFalse(tree.is_complete())
+        tasks = [task11,task12,task21,task22]
+        self.assertFalse(is_complete(tasks))
 
     def testTreeWithFinishedStatusAndMissingNodes(self):
         task11 = MockTask(status_is_finished=True, data_path=[[0,2],[0,2]])
         task12 = MockTask(status_is_finished=True, data_path=[[0,2],[1,2]])
         task22 = MockTask(status_is_finished=True, data_path=[[1,2],[1,2]])
-        tree = TaskNode.create_from_task_list([task11,task12,task22])
-        self.assertFalse(tree.is_complete())
+        tasks = [task11,task12,task22]
+        self.assertFalse(is_complete(tasks))
 
     def testTreeWithUnfinishedStatusAndMissingNodes(self):
         task11 = MockTask(status_is_finished=True, data_path=[[0,2],[0,2]])
         task21 = MockTask(status_is_finished=False, data_path=[[1,2],[0,2]])
         task22 = MockTask(status_is_finished=True, data_path=[[1,2],[1,2]])
-        tree = TaskNode.create_from_task_list([task11,task21,task22])
-        self.assertFalse(tree.is_complete())
+        tasks = [task11,task21,task22]
+        self.assertFalse(is_complete(tasks))
+
+    def testRaggedTree(self):
+        self.assertEqual(Run.get_expected_task_count(
+            [[[0,2],[0,2]], [[1,2],[2,3]]]), 5)
+
+
+class TestCompletionCounters(TestCase):
+
+    def testFinishWhenLastTaskFinishes(self):
+        with self.settings(TEST_DISABLE_ASYNC_DELAY=True,
+                           TEST_NO_RUN_TASK_ATTEMPT=True):
+            run = request_run_from_template_file(
+                os.path.join(os.path.dirname(__file__), '..', '..', 'test',
+                             'fixtures', 'simple', 'simple.yaml'),
+                word_in=['puppy', 'kitten'])
+        run = Run.objects.get(id=run.id)
+        self.assertEqual(run.expected_task_count, 2)
+        tasks = list(run.tasks.all())
+        # No attempt produced data, so there is nothing to push
+        TaskOutput.objects.filter(task__run=run).delete()
+        with self.settings(TEST_DISABLE_ASYNC_DELAY=True, PRESERVE_ALL=True):
+            tasks[0].finish()
+            self.assertFalse(Run.objects.get(id=run.id).status_is_finished)
+            tasks[1].finish()
+        run = Run.objects.get(id=run.id)
+        self.assertEqual(run.finished_task_count, 2)
+        self.assertTrue(run.status_is_finished)
+        self.assertFalse(run.reconcile_counters())
+
+    def testPushWithExistingTasks(self):
+        with self.settings(TEST_DISABLE_ASYNC_DELAY=True,
+                           TEST_NO_RUN_TASK_ATTEMPT=True):
+            run = request_run_from_template_file(
+                os.path.join(os.path.dirname(__file__), '..', '..', 'test',
+                             'fixtures', 'simple', 'simple.yaml'),
+                word_in=['puppy', 'kitten'])
+            run = Run.objects.get(id=run.id)
+            run.push('word_in', [])
+            run.push('word_in', [(1,2)])
+        self.assertEqual(run.tasks.count(), 2)
+        self.assertEqual(
+            Run.objects.get(id=run.id).skipped_clone_count, 3)
+
+    def testSkippedCloneCount(self):
+        with self.settings(TEST_DISABLE_ASYNC_DELAY=True,
+                           TEST_NO_RUN_TASK_ATTEMPT=True):
+            run = request_run_from_template_file(
+                os.path.join(os.path.dirname(__file__), '..', '..', 'test',
+                             'fixtures', 'simple', 'simple.yaml'),
+                word_in=['puppy', 'kitten'])
+        run = Run.objects.get(id=run.id)
+        run._add_skipped_clones(3)
+        run._add_skipped_clones(2)
+        self.assertEqual(Run.objects.get(id=run.id).skipped_clone_count, 5)
+        self.assertEqual(Run.get_stats()['skipped_clone_count'], 5)
+        # _change was refreshed, so the instance can still be saved
+        run.setattrs_and_save_with_retries({'name': 'renamed'})
+
+    def testCountExpectedTasksIncrementally(self):
+        with self.settings(TEST_DISABLE_ASYNC_DELAY=True,
+                           TEST_NO_CREATE_TASK=True):
+            run = request_run_from_template_file(
+                os.path.join(os.path.dirname(__file__), '..', '..', 'test',
+                             'fixtures', 'simple', 'simple.yaml'),
+                word_in='puppy')
+        run = Run.objects.get(id=run.id)
+        self.assertIsNone(run.expected_task_count)
+        run._count_expected_tasks([MockTask(data_path=[[0,2],[0,2]])])
+        self.assertEqual(run.expected_task_count, 3)
+        run._count_expected_tasks([MockTask(data_path=[[1,2],[2,3]]),
+                                   MockTask(data_path=[[0,2],[1,2]])])
+        self.assertEqual(run.expected_task_count, 5)
+        # Branches that were counted before add nothing
+        run._count_expected_tasks([MockTask(data_path=[[1,2],[0,3]])])
+        self.assertEqual(Run.objects.get(id=run.id).expected_task_count, 5)
+        self.assertEqual(run.branches.count(), 3)
+
+    def testReconcileCounters(self):
+        with self.settings(TEST_DISABLE_ASYNC_DELAY=True,
+                           TEST_NO_RUN_TASK_ATTEMPT=True):
+            run = request_run_from_template_file(
+                os.path.join(os.path.dirname(__file__), '..', '..', 'test',
+                             'fixtures', 'simple', 'simple.yaml'),
+                word_in=['puppy', 'kitten'])
+        run = Run.objects.get(id=run.id)
+        Run.objects.filter(id=run.id).update(expected_task_count=None,
+                                             finished_task_count=7)
+        run = Run.objects.get(id=run.id)
+        self.assertTrue(run.reconcile_counters())
+        run = Run.objects.get(id=run.id)
+        self.assertEqual(run.expected_task_count, 2)
+        self.assertEqual(run.finished_task_count, 0)
+        self.assertFalse(run.are_counters_complete())
@@ -0,0 +1,73 @@
+from django.test import TestCase
+
+from api.models.tasks import Task
+from api.models.task_queue import TaskQueueEntry
+
+
+def get_task(cores='1', memory='1', index=0):
+    return Task.objects.create(
+        interpreter='/bin/bash',
+        raw_command='echo true',
+        command='echo true',
+        resources={'memory': memory, 'cores': cores},
+        environment={'docker_image': 'ubuntu'},
+        data_path = [[index, 10],],
+    )
+
+
+class TestTaskQueueEntry(TestCase):
+
+    def testIsEnabled(self):
+        self.assertFalse(TaskQueueEntry.is_enabled())
+        with self.settings(SCHEDULER_MAX_CORES=4):
+            self.assertTrue(TaskQueueEntry.is_enabled())
+
+    def testAdmitWithinCapacity(self):
+        tasks = [get_task(cores='2', index=i) for i in range(3)]
+        with self.settings(SCHEDULER_MAX_CORES=4):
+            TaskQueueEntry.enqueue([task.uuid for task in tasks])
+            admitted = TaskQueueEntry.admit()
+            self.assertEqual(admitted, [tasks[0].uuid, tasks[1].uuid])
+            self.assertEqual(TaskQueueEntry.admit(), [])
+            stats = TaskQueueEntry.get_stats()
+            self.assertEqual(stats['queued'], 1)
+            self.assertEqual(stats['admitted'], 2)
+            self.assertEqual(stats['in_use']['cores'], 4)
+
+    def testFinishedTaskReleasesCapacity(self):
+        tasks = [get_task(cores='2', index=i) for i in range(2)]
+        with self.settings(SCHEDULER_MAX_CORES=2):
+            TaskQueueEntry.enqueue([task.uuid for task in tasks])
+            self.assertEqual(TaskQueueEntry.admit(), [tasks[0].uuid])
+            tasks[0].setattrs_and_save_with_retries(
+                {'status_is_finished': True})
+            self.assertEqual(TaskQueueEntry.admit(), [tasks[1].uuid])
+            self.assertEqual(TaskQueueEntry.objects.count(), 1)
+
+    def testPriorityAndNoSkipping(self):
+        big = get_task(cores='3', index=0)
+        small = get_task(cores='1', index=1)
+        retry = get_task(cores='2', index=2)
+        retry.setattrs_and_save_with_retries({'system_failure_count': 1})
+        with self.settings(SCHEDULER_MAX_CORES=4):
+            TaskQueueEntry.enqueue([big.uuid, small.uuid, retry.uuid])
+            # The retry goes first. The small task must not pass the big one.
+            self.assertEqual(TaskQueueEntry.admit(), [retry.uuid])
+
+    def testRequestLargerThanPool(self):
+        task = get_task(memory='64')
+        with self.settings(SCHEDULER_MAX_MEMORY_GB=8):
+            TaskQueueEntry.enqueue([task.uuid])
+            self.assertEqual(TaskQueueEntry.admit(), [task.uuid])
+            self.assertEqual(task.queue_entry.memory, 8)
+
+    def testFractionalAndInvalidRequests(self):
+        fractional = get_task(memory='2.5', index=0)
+        invalid = get_task(cores='many', index=1)
+        with self.settings(SCHEDULER_MAX_MEMORY_GB=8):
+            TaskQueueEntry.enqueue([fractional.uuid, invalid.uuid])
+            fractional = Task.objects.get(id=fractional.id)
+            invalid = Task.objects.get(id=invalid.id)
+            self.assertEqual(fractional.queue_entry.memory, 3)
+            self.assertEqual(invalid.queue_entry.cores,
+                             TaskQueueEntry.DEFAULT_CORES)
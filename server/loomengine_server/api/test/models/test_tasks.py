@@ -1,6 +1,14 @@
+from datetime import timedelta
 from django.test import TestCase
+from django.utils import timezone
+import os
 
+from api.heartbeats import get_heartbeat_store
+
+from api.test.helper import request_run_from_template_file
 from api.test.models import _get_string_data_node
+from api.models.input_calculator import InputCalculator
+from api.models.runs import Run
 from api.models.data_objects import *
 from api.models.tasks import *
 
@@ -66,6 +74,73 @@ class TestTask(TestCase):
         command = task.render_command()
         self.assertEqual(command, 'echo input1; echo salud, amor, dinero')
 
+    def testGetDataPathHash(self):
+        self.assertEqual(Task.get_data_path_hash([(0,2),(1,3)]),
+                         Task.get_data_path_hash([[0,2],[1,3]]))
+        self.assertNotEqual(Task.get_data_path_hash([(0,2),(1,3)]),
+                            Task.get_data_path_hash([(0,2)]))
+        self.assertEqual(get_task().data_path_hash,
+                         Task.get_data_path_hash([[0,1]]))
+
+    def testSaveMigratedDuplicate(self):
+        with self.settings(TEST_DISABLE_ASYNC_DELAY=True,
+                           TEST_NO_RUN_TASK_ATTEMPT=True):
+            run = request_run_from_template_file(
+                os.path.join(os.path.dirname(__file__), '..', '..', 'test',
+                             'fixtures', 'simple', 'simple.yaml'),
+                word_in='puppy')
+        task = run.tasks.get()
+        duplicate = Task.objects.create(
+            run=run, data_path=[[1,2]], interpreter=task.interpreter,
+            raw_command=task.raw_command, command=task.command,
+            resources=task.resources, environment=task.environment)
+        # Like a duplicate left by migration 0006, without a hash
+        Task.objects.filter(id=duplicate.id).update(
+            data_path=task.data_path, data_path_hash=None)
+        duplicate = Task.objects.get(id=duplicate.id)
+        duplicate.setattrs_and_save_with_retries({'status_is_failed': True})
+        duplicate = Task.objects.get(id=duplicate.id)
+        self.assertTrue(duplicate.status_is_failed)
+        self.assertIsNone(duplicate.data_path_hash)
+
+    def testCreateFromInputSetTwice(self):
+        with self.settings(TEST_DISABLE_ASYNC_DELAY=True,
+                           TEST_NO_CREATE_TASK=True):
+            run = request_run_from_template_file(
+                os.path.join(os.path.dirname(__file__), '..', '..', 'test',
+                             'fixtures', 'simple', 'simple.yaml'),
+                word_in='puppy')
+        input_set = InputCalculator(run.inputs.all(), 'word_in', [])\
+                    .get_input_sets()[0]
+        Task.create_from_input_set(input_set, run)
+        with self.assertRaises(TaskAlreadyExistsException):
+            Task.create_from_input_set(input_set, run)
+        self.assertEqual(run.tasks.count(), 1)
+
+
+    def testCreateFromInputSets(self):
+        with self.settings(TEST_DISABLE_ASYNC_DELAY=True,
+                           TEST_NO_CREATE_TASK=True):
+            run = request_run_from_template_file(
+                os.path.join(os.path.dirname(__file__), '..', '..', 'test',
+                             'fixtures', 'simple', 'simple.yaml'),
+                word_in=['puppy', 'kitten', 'duckling'])
+        input_sets = InputCalculator(run.inputs.all(), 'word_in', [])\
+                     .get_input_sets()
+        tasks = Task.create_from_input_sets(input_sets, run)
+        self.assertEqual(len(tasks), 3)
+        task = Task.objects.get(uuid=tasks[1].uuid)
+        self.assertEqual(task.command, 'echo kitten')
+        self.assertEqual(task.inputs.get().data_node.substitution_value,
+                         'kitten')
+        self.assertEqual(task.outputs.get().data_node.uuid,
+                         run.get_output('word_out').data_node.get_node(
+                             task.data_path).uuid)
+        self.assertTrue(Run.objects.get(uuid=run.uuid).status_is_running)
+
+        # Tasks already exist, so none are created
+        self.assertEqual(Task.create_from_input_sets(input_sets, run), [])
+        self.assertEqual(run.tasks.count(), 3)
 
 class TestTaskAttempt(TestCase):
 
@@ -82,3 +157,52 @@ class TestTaskAttempt(TestCase):
                          self.task.outputs.first().source.get('stream'))
         self.assertEqual(self.task_attempt.outputs.first().source.get('filename'),
                          'input2.txt')
+
+    def testHeartbeat(self):
+        old_heartbeat = self.task_attempt.last_heartbeat
+        change = TaskAttempt.objects.get(id=self.task_attempt.id)._change
+        self.task_attempt.heartbeat()
+        task_attempt = TaskAttempt.objects.get(id=self.task_attempt.id)
+        self.assertTrue(task_attempt.last_heartbeat > old_heartbeat)
+        # A heartbeat is not a versioned save
+        self.assertEqual(task_attempt._change, change)
+
+    def testHeartbeatWithCacheStore(self):
+        with self.settings(HEARTBEAT_STORE='cache'):
+            old_heartbeat = TaskAttempt.objects.get(
+                id=self.task_attempt.id).last_heartbeat
+            last_heartbeat = self.task_attempt.heartbeat()
+            task_attempt = TaskAttempt.objects.get(id=self.task_attempt.id)
+            self.assertEqual(task_attempt.last_heartbeat, old_heartbeat)
+            self.assertEqual(task_attempt.get_last_heartbeat(), last_heartbeat)
+            get_heartbeat_store().flush()
+            task_attempt = TaskAttempt.objects.get(id=self.task_attempt.id)
+            self.assertEqual(task_attempt.last_heartbeat, last_heartbeat)
+
+    def testIsUnresponsiveWithCacheStore(self):
+        TaskAttempt.objects.filter(id=self.task_attempt.id).update(
+            last_heartbeat=timezone.now() - timedelta(days=1))
+        task = Task.objects.get(id=self.task.id)
+        self.assertTrue(task.is_unresponsive())
+        with self.settings(HEARTBEAT_STORE='cache'):
+            self.task_attempt.heartbeat()
+            self.assertFalse(task.is_unresponsive())
+
+    def testGetUnresponsiveTasks(self):
+        self.assertEqual(list(Task.get_unresponsive_tasks()), [])
+        TaskAttempt.objects.filter(id=self.task_attempt.id).update(
+            last_heartbeat=timezone.now() - timedelta(days=1))
+        self.assertEqual(
+            [task.id for task in Task.get_unresponsive_tasks()],
+            [self.task.id])
+
+    def testGetMissedCleanup(self):
+        self.assertEqual(list(TaskAttempt.get_missed_cleanup()), [])
+        self.task_attempt.setattrs_and_save_with_retries({
+            'status_is_running': False, 'status_is_failed': True})
+        self.assertEqual(
+            [task_attempt.id for task_attempt
+             in TaskAttempt.get_missed_cleanup()],
+            [self.task_attempt.id])
+        with self.settings(PRESERVE_ON_FAILURE=True):
+            self.assertEqual(list(TaskAttempt.get_missed_cleanup()), [])
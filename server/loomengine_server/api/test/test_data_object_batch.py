@@ -0,0 +1,50 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+import json
+
+from api.models import DataObject
+
+
+class TestDataObjectBatch(TestCase):
+
+    url = '/api/data-objects/batch/'
+
+    def setUp(self):
+        self.client.force_login(User.objects.create(username='test'))
+
+    def _post(self, data):
+        return self.client.post(self.url, json.dumps(data),
+                                content_type='application/json')
+
+    def _get_file(self, filename):
+        return {'type': 'file',
+                'value': {'filename': filename,
+                          'md5': 'd8e8fca2dc0f896fd7cb4cb0031ba249',
+                          'source_type': 'imported'}}
+
+    def testCreateFiles(self):
+        with self.settings(STORAGE_ROOT='/tmp/storage'):
+            response = self._post([self._get_file('one.txt'),
+                                   self._get_file('two.txt')])
+        self.assertEqual(response.status_code, 201)
+        data_objects = response.json()
+        self.assertEqual(
+            [data_object['value']['filename'] for data_object in data_objects],
+            ['one.txt', 'two.txt'])
+        for data_object in data_objects:
+            self.assertEqual(data_object['value']['upload_status'],
+                             'incomplete')
+            self.assertTrue(data_object['value']['file_url'].startswith(
+                'file:///tmp/storage/'))
+        self.assertEqual(DataObject.objects.count(), 2)
+
+    def testInvalidDataObjectSavesNothing(self):
+        invalid_file = self._get_file('two.txt')
+        del invalid_file['value']['md5']
+        response = self._post([self._get_file('one.txt'), invalid_file])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(DataObject.objects.count(), 0)
+
+    def testNotAList(self):
+        response = self._post(self._get_file('one.txt'))
+        self.assertEqual(response.status_code, 400)
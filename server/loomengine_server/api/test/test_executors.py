@@ -0,0 +1,76 @@
+from django.test import TestCase
+import threading
+
+from api.executors import get_executor, AnsibleExecutor, LocalExecutor
+
+
+class MockObject(object):
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+def get_mock_task_attempt(resources):
+    template = MockObject(resources=resources)
+    return MockObject(task=MockObject(run=MockObject(template=template)))
+
+
+class TestGetExecutor(TestCase):
+
+    def testGetExecutor(self):
+        with self.settings(TASK_EXECUTOR='ansible'):
+            self.assertTrue(isinstance(get_executor(), AnsibleExecutor))
+        with self.settings(TASK_EXECUTOR='local'):
+            executor = get_executor()
+            self.assertTrue(isinstance(executor, LocalExecutor))
+            self.assertTrue(executor is get_executor())
+
+    def testGetExecutorInvalid(self):
+        with self.settings(TASK_EXECUTOR='carrier-pigeon'):
+            with self.assertRaises(Exception):
+                get_executor()
+
+
+class TestLocalExecutor(TestCase):
+
+    def testGetRequest(self):
+        executor = LocalExecutor(max_cores=4, max_memory_gb=8)
+        self.assertEqual(
+            executor._get_request(get_mock_task_attempt(
+                {'cores': '2', 'memory': '3'})),
+            (2, 3))
+        self.assertEqual(
+            executor._get_request(get_mock_task_attempt(None)),
+            (1, 1))
+
+    def testGetRequestLargerThanPool(self):
+        executor = LocalExecutor(max_cores=4, max_memory_gb=8)
+        self.assertEqual(
+            executor._get_request(get_mock_task_attempt(
+                {'cores': 16, 'memory': 64})),
+            (4, 8))
+
+    def testReserveWaitsForCapacity(self):
+        executor = LocalExecutor(max_cores=2, max_memory_gb=8)
+        executor._reserve(2, 1)
+        t = threading.Thread(target=executor._reserve, args=(1, 1))
+        t.start()
+        t.join(0.2)
+        self.assertTrue(t.is_alive())
+        executor._release(2, 1)
+        t.join(5)
+        self.assertFalse(t.is_alive())
+        self.assertEqual(executor.get_stats()['cores_in_use'], 1)
+
+    def testRemoveContainerCmdList(self):
+        executor = LocalExecutor(max_cores=2, max_memory_gb=8)
+        with self.settings(SERVER_NAME='loom'):
+            self.assertEqual(
+                executor._get_remove_container_cmd_list('123'),
+                ['docker', 'rm', '-f', 'loom-attempt-123'])
+
+    def testCleanupWithoutMonitor(self):
+        # e.g. cleanup in a different process than the one that ran it
+        executor = LocalExecutor(max_cores=2, max_memory_gb=8)
+        executor.DOCKER_COMMAND = 'true'
+        executor.cleanup(MockObject(uuid='123'))
+        self.assertEqual(executor.killed, set())
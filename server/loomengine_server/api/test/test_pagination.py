@@ -0,0 +1,43 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils import timezone
+
+from api.models import DataObject
+
+
+class TestKeysetPagination(TestCase):
+
+    def setUp(self):
+        self.client.force_login(User.objects.create(username='test'))
+        # Ties on datetime_created must be broken by id
+        now = timezone.now()
+        self.data_objects = [DataObject.get_by_value(str(i), 'string')
+                             for i in range(5)]
+        DataObject.objects.all().update(datetime_created=now)
+
+    def testPageThroughIndex(self):
+        uuids = []
+        url = '/api/data-objects/?page_size=2'
+        pages = 0
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            uuids.extend([item['uuid'] for item in response.data['results']])
+            url = response.data['next']
+            pages += 1
+        self.assertEqual(pages, 3)
+        self.assertEqual(
+            uuids,
+            [data_object.uuid for data_object
+             in reversed(self.data_objects)])
+
+    def testInvalidCursor(self):
+        response = self.client.get('/api/data-objects/?cursor=bogus')
+        self.assertEqual(response.status_code, 404)
+
+    def testLimitOffsetUnchanged(self):
+        response = self.client.get('/api/data-objects/?limit=2&offset=1')
+        self.assertEqual(response.data['count'], 5)
+        self.assertEqual(len(response.data['results']), 2)
+        response = self.client.get('/api/data-objects/')
+        self.assertEqual(len(response.data), 5)
@@ -0,0 +1,75 @@
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+import os
+
+from api.models import Run, Task
+from api.test.helper import request_run_from_template_file
+
+
+@override_settings(CACHES={
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'TIMEOUT': 0,
+    },
+    'responses': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'test-responses',
+    },
+})
+class TestResponseCache(TestCase):
+
+    def setUp(self):
+        self.client.force_login(User.objects.create(username='test'))
+        with self.settings(TEST_DISABLE_ASYNC_DELAY=True,
+                           TEST_NO_RUN_TASK_ATTEMPT=True):
+            self.run = request_run_from_template_file(
+                os.path.join(os.path.dirname(__file__), 'fixtures',
+                             'simple', 'simple.yaml'),
+                word_in='puppy')
+
+    def testNotModified(self):
+        url = '/api/runs/%s/' % self.run.uuid
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def testCacheHit(self):
+        url = '/api/runs/%s/?summary' % self.run.uuid
+        response = self.client.get(url)
+        # Only the session, the user, and the key lookup
+        with self.assertNumQueries(3):
+            cached_response = self.client.get(url)
+        self.assertEqual(response.content, cached_response.content)
+        self.assertEqual(response['ETag'], cached_response['ETag'])
+
+    def testSaveInvalidates(self):
+        url = '/api/runs/%s/' % self.run.uuid
+        etag = self.client.get(url)['ETag']
+        run = Run.objects.get(id=self.run.id)
+        run.setattrs_and_save_with_retries({'name': 'renamed'})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['name'], 'renamed')
+
+    def testTaskSaveInvalidatesSummary(self):
+        url = '/api/runs/%s/?summary' % self.run.uuid
+        etag = self.client.get(url)['ETag']
+        task = Task.objects.get(run__tree_id=self.run.tree_id)
+        task.setattrs_and_save_with_retries({'status_is_failed': True})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['tasks'][0]['status'], 'Failed')
+
+    def testTemplate(self):
+        url = '/api/templates/%s/' % self.run.template.uuid
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def testNotFound(self):
+        response = self.client.get('/api/runs/not-a-uuid/')
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,188 @@
+from django.contrib.auth.models import User
+from django.db.models import Max
+from django.test import TestCase
+import json
+import os
+
+from api.models import Run, Task, StatusChange, TaskAttempt
+from api.streams import stream_run_tree, stream_status_changes
+from api.test.helper import request_run_from_template_file
+from api.test.serializers import get_mock_context
+
+
+class TestStreamRunTree(TestCase):
+
+    def testStreamRunTree(self):
+        with self.settings(TEST_DISABLE_ASYNC_DELAY=True,
+                           TEST_NO_RUN_TASK_ATTEMPT=True):
+            run = request_run_from_template_file(
+                os.path.join(os.path.dirname(__file__), 'fixtures',
+                             'simple', 'simple.yaml'),
+                word_in=['puppy', 'kitten', 'duckling'])
+        run = Run.objects.get(id=run.id)
+        lines = list(stream_run_tree(run, get_mock_context(), chunk_size=2))
+        records = [json.loads(line) for line in lines]
+        self.assertTrue(all(line.endswith('\n') for line in lines))
+        self.assertEqual(records[-1]['type'], 'end')
+        counts = records[-1]['data']
+        self.assertEqual(counts['run'], 1)
+        self.assertEqual(counts['task'], 3)
+        tasks = [record['data'] for record in records
+                 if record['type'] == 'task']
+        self.assertEqual(len(tasks), 3)
+        self.assertTrue(all(task['run'] == run.uuid for task in tasks))
+        data_nodes = dict((record['data']['uuid'], record['data'])
+                          for record in records
+                          if record['type'] == 'data_node')
+        # Every channel on the Run points to a node in the export
+        run_record = records[0]['data']
+        for channel in run_record['inputs']:
+            self.assertIn(channel['data']['uuid'], data_nodes)
+        words = set([node['data_object']['value']
+                     for node in data_nodes.values()
+                     if node['data_object']])
+        self.assertEqual(words, set(['puppy', 'kitten', 'duckling']))
+
+    def testExportView(self):
+        with self.settings(TEST_DISABLE_ASYNC_DELAY=True,
+                           TEST_NO_RUN_TASK_ATTEMPT=True):
+            run = request_run_from_template_file(
+                os.path.join(os.path.dirname(__file__), 'fixtures',
+                             'simple', 'simple.yaml'),
+                word_in='puppy')
+        self.client.force_login(User.objects.create(username='test'))
+        response = self.client.get('/api/runs/%s/export/' % run.uuid)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        records = [json.loads(line) for line
+                   in ''.join(response.streaming_content).splitlines()]
+        self.assertEqual(records[-1]['data']['task'], 1)
+
+
+class TestStreamStatusChanges(TestCase):
+
+    def setUp(self):
+        with self.settings(TEST_DISABLE_ASYNC_DELAY=True,
+                           TEST_NO_RUN_TASK_ATTEMPT=True):
+            self.run = request_run_from_template_file(
+                os.path.join(os.path.dirname(__file__), 'fixtures',
+                             'simple', 'simple.yaml'),
+                word_in='puppy')
+
+    def _parse(self, message):
+        fields = dict(line.split(': ', 1)
+                      for line in message.splitlines() if line)
+        return fields.get('id'), fields['event'], json.loads(fields['data'])
+
+    def testFollowRun(self):
+        stream = stream_status_changes([self.run], poll_interval=0)
+        self.assertTrue(next(stream).startswith('retry:'))
+        # One status for each Run, Task, and TaskAttempt, then the long
+        # poll returns
+        snapshot = [self._parse(message) for message in stream]
+        self.assertEqual([data['type'] for id, event, data in snapshot],
+                         ['run', 'task', 'task_attempt'])
+        task = Task.objects.get(run=self.run)
+        task.setattrs_and_save_with_retries({'status_is_failed': True})
+        stream = stream_status_changes(
+            [self.run], last_id=int(snapshot[-1][0]), poll_interval=0)
+        next(stream)
+        messages = [self._parse(message) for message in stream]
+        self.assertEqual(len(messages), 1)
+        id, event, data = messages[0]
+        self.assertEqual(event, 'status')
+        self.assertEqual(data['uuid'], task.uuid)
+        self.assertEqual(data['status'], 'Failed')
+        self.assertEqual(data['run'], self.run.uuid)
+
+        # Reconnecting with the last id resumes after it
+        with self.settings(TEST_DISABLE_ASYNC_DELAY=True, PRESERVE_ALL=True):
+            self.run.kill('stop')
+        messages = []
+        while not messages or messages[-1][1] != 'end':
+            resumed = stream_status_changes([self.run], last_id=int(id),
+                                            poll_interval=0)
+            next(resumed)
+            for message in resumed:
+                messages.append(self._parse(message))
+                id = messages[-1][0]
+        self.assertEqual(messages[-1][2]['status'], 'Killed')
+        self.assertIn(('status', self.run.uuid, 'Killed'),
+                      [(event, data['uuid'], data.get('status'))
+                       for _, event, data in messages])
+        self.assertIn('event', [event for _, event, data in messages])
+
+    def testLongPollTimesOut(self):
+        last_id = StatusChange.objects.aggregate(Max('id'))['id__max']
+        stream = stream_status_changes([self.run], last_id=last_id,
+                                       poll_interval=0, max_seconds=0)
+        self.assertEqual(len(list(stream)), 1)
+
+    def testStatusRecordedOnTransitionsOnly(self):
+        task = Task.objects.get(run=self.run)
+        changes = StatusChange.objects.filter(uuid=task.uuid).order_by('id')
+        # Tasks from the bulk create path have a status too
+        self.assertEqual([change.status for change in changes],
+                         ['Waiting', 'Running'])
+        task.setattrs_and_save_with_retries({'command': 'echo changed'})
+        self.assertEqual(changes.count(), 2)
+        task.setattrs_and_save_with_retries({'status_is_failed': True})
+        self.assertEqual(changes.last().status, 'Failed')
+
+    def testTaskAttemptSaveWithoutStatusChange(self):
+        task_attempt = TaskAttempt.objects.get(task__run=self.run)
+        count = StatusChange.objects.count()
+        # With the default dummy response cache, only the update for
+        # _change and the save. The Run is not looked up.
+        with self.assertNumQueries(2):
+            task_attempt.save()
+        self.assertEqual(StatusChange.objects.count(), count)
+
+    def testEventsRecordedWithoutLoadingParents(self):
+        task_attempt = TaskAttempt.objects.get(task__run=self.run)
+        count = StatusChange.objects.count()
+        # full_clean, the event, the run_id of its Task, and the
+        # StatusChange. The Task is not loaded.
+        with self.assertNumQueries(4):
+            task_attempt.add_event('Test event')
+        run = Run.objects.get(id=self.run.id)
+        with self.assertNumQueries(3):
+            run.add_event('Test event')
+        self.assertEqual(
+            [(change.object_type, change.event) for change
+             in StatusChange.objects.order_by('id')[count:]],
+            [('task_attempt', 'Test event'), ('run', 'Test event')])
+
+    def testChangesView(self):
+        with self.settings(TEST_DISABLE_ASYNC_DELAY=True, PRESERVE_ALL=True):
+            self.run.kill('stop')
+        self.client.force_login(User.objects.create(username='test'))
+        response = self.client.get('/api/runs/%s/changes/' % self.run.uuid)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        messages = ''.join(response.streaming_content).split('\n\n')
+        id = self._parse(messages[-2])[0]
+        response = self.client.get('/api/runs/%s/changes/' % self.run.uuid,
+                                   HTTP_LAST_EVENT_ID=id)
+        messages = ''.join(response.streaming_content).split('\n\n')
+        self.assertIn('event: end', messages[-2])
+
+    def testChangesInRunsView(self):
+        with self.settings(TEST_DISABLE_ASYNC_DELAY=True,
+                           TEST_NO_RUN_TASK_ATTEMPT=True):
+            other_run = request_run_from_template_file(
+                os.path.join(os.path.dirname(__file__), 'fixtures',
+                             'simple', 'simple.yaml'),
+                word_in='kitten')
+        self.client.force_login(User.objects.create(username='test'))
+        response = self.client.get('/api/runs/changes/?runs=%s,%s' % (
+            self.run.uuid, other_run.uuid))
+        self.assertEqual(response.status_code, 200)
+        messages = [self._parse(message) for message
+                    in ''.join(response.streaming_content).split('\n\n')[1:]
+                    if message]
+        self.assertEqual(
+            set(data['run'] for id, event, data in messages),
+            set([self.run.uuid, other_run.uuid]))
+        response = self.client.get('/api/runs/changes/')
+        self.assertEqual(response.status_code, 400)
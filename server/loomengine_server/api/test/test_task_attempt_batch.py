@@ -0,0 +1,71 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+import json
+import os
+
+from api.models import TaskAttempt
+from api.test.helper import request_run_from_template_file
+
+
+class TestTaskAttemptBatch(TestCase):
+
+    def setUp(self):
+        self.client.force_login(User.objects.create(username='test'))
+        with self.settings(TEST_DISABLE_ASYNC_DELAY=True,
+                           TEST_NO_RUN_TASK_ATTEMPT=True):
+            run = request_run_from_template_file(
+                os.path.join(os.path.dirname(__file__), 'fixtures',
+                             'simple', 'simple.yaml'),
+                word_in='puppy')
+        self.task_attempt = TaskAttempt.objects.get(task__run=run)
+        self.url = '/api/task-attempts/%s/batch/' % self.task_attempt.uuid
+
+    def _post(self, data):
+        return self.client.post(self.url, json.dumps(data),
+                                content_type='application/json')
+
+    def testEventsAndOutputs(self):
+        output = self.task_attempt.outputs.get()
+        response = self._post({
+            'events': [
+                {'event': 'Copying inputs',
+                 'timestamp': '2017-01-01T00:00:00Z'},
+                {'event': 'Running analysis'}],
+            'outputs': [
+                {'uuid': output.uuid,
+                 'data': {'contents': 'puppy'}}]})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            [event.event for event
+             in self.task_attempt.events.order_by('timestamp')],
+            ['Copying inputs', 'Running analysis'])
+        output.refresh_from_db()
+        self.assertEqual(output.data_node.data_object.substitution_value,
+                         'puppy')
+
+    def testInvalidEventSavesNothing(self):
+        output = self.task_attempt.outputs.get()
+        response = self._post({
+            'events': [{'detail': 'no event'}],
+            'outputs': [
+                {'uuid': output.uuid,
+                 'data': {'contents': 'puppy'}}]})
+        self.assertEqual(response.status_code, 400)
+        output.refresh_from_db()
+        self.assertIsNone(output.data_node)
+
+    def testSystemError(self):
+        with self.settings(TEST_DISABLE_ASYNC_DELAY=True,
+                           TEST_NO_RUN_TASK_ATTEMPT=True,
+                           PRESERVE_ALL=True):
+            response = self._post({
+                'events': [{'event': 'TaskAttempt execution failed.',
+                            'is_error': True}],
+                'status': 'system_error'})
+        self.assertEqual(response.status_code, 201)
+        task_attempt = TaskAttempt.objects.get(id=self.task_attempt.id)
+        self.assertTrue(task_attempt.status_is_failed)
+
+    def testInvalidStatus(self):
+        response = self._post({'status': 'done'})
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,33 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+import os
+
+from api.models import TaskAttempt
+from api.test.helper import request_run_from_template_file
+
+
+class TestTaskAttemptSettings(TestCase):
+
+    def setUp(self):
+        self.client.force_login(User.objects.create(username='test'))
+        with self.settings(TEST_DISABLE_ASYNC_DELAY=True,
+                           TEST_NO_RUN_TASK_ATTEMPT=True):
+            run = request_run_from_template_file(
+                os.path.join(os.path.dirname(__file__), 'fixtures',
+                             'simple', 'simple.yaml'),
+                word_in='puppy')
+        task_attempt = TaskAttempt.objects.get(task__run=run)
+        self.url = '/api/task-attempts/%s/settings/' % task_attempt.uuid
+
+    def testLinkInputsWithLocalStorage(self):
+        with self.settings(STORAGE_TYPE='local', INPUT_STAGING_MODE='link',
+                           STORAGE_ROOT='/tmp/storage'):
+            settings = self.client.get(self.url).json()
+        self.assertEqual(settings['INPUT_STAGING_MODE'], 'link')
+        self.assertEqual(settings['STORAGE_ROOT'], '/tmp/storage')
+
+    def testCopyInputsWithGoogleStorage(self):
+        with self.settings(STORAGE_TYPE='google_storage',
+                           INPUT_STAGING_MODE='link'):
+            settings = self.client.get(self.url).json()
+        self.assertEqual(settings['INPUT_STAGING_MODE'], 'copy')
@@ -59,6 +59,7 @@ urlpatterns = [
     url(r'^', include(router.urls)),
     url(r'^status/$', api.views.status),
     url(r'^info/$', api.views.info),
+    url(r'^stats/$', api.views.stats),
     url(r'^auth-status/$', api.views.auth_status),
     url(r'^filemanager-settings/$', api.views.FileManagerSettingsView.as_view()),
     url(r'^doc/$', get_swagger_view(title='Loom API')),
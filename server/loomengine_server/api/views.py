@@ -1,8 +1,9 @@
 from django.contrib.auth import login, logout
 from django.contrib.auth.models import User
 from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
 import django.core.exceptions
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 import json
@@ -11,7 +12,7 @@ import os
 import rest_framework.response
 import rest_framework.viewsets
 import rest_framework.status
-from rest_framework.decorators import detail_route
+from rest_framework.decorators import detail_route, list_route
 from rest_framework.generics import RetrieveAPIView
 from rest_framework.views import APIView
 from rest_framework import authentication
@@ -22,6 +23,9 @@ from api import get_setting
 from api import models
 from api import serializers
 from api import async
+from api.pagination import KeysetPagination
+from api import response_cache
+from api import streams
 from loomengine_utils import version
 
 logger = logging.getLogger(__name__)
@@ -123,6 +127,26 @@ class ExpandableViewSet(rest_framework.viewsets.ModelViewSet):
                 status=rest_framework.status.HTTP_400_BAD_REQUEST)
         return super(ExpandableViewSet, self).list(self, request)
 
+    def _retrieve_with_cache(self, request, Model, fields, is_terminal,
+                             tree_id=None, **kwargs):
+        """Serve a detail or summary view from the response cache.
+        Model.objects.only(*fields) is enough to build the cache key,
+        so a hit costs one small query instead of the full serializer.
+        """
+        if request.accepted_renderer.format != 'json':
+            return super(ExpandableViewSet, self).retrieve(
+                request, **kwargs)
+        try:
+            instance = Model.objects.only('uuid', '_change', *fields).get(
+                uuid=kwargs.get('uuid'))
+        except ObjectDoesNotExist:
+            raise rest_framework.exceptions.NotFound()
+        return response_cache.get_response(
+            request, instance,
+            lambda: self.get_serializer(self.get_object()).data,
+            is_terminal(instance),
+            tree_id=tree_id(instance) if tree_id else None)
+
     def get_queryset(self):
         Serializer = self.get_serializer_class()
         queryset = Serializer.Meta.model.objects.all()
@@ -132,10 +156,11 @@ class ExpandableViewSet(rest_framework.viewsets.ModelViewSet):
 
 class DataObjectViewSet(rest_framework.viewsets.ModelViewSet):
     """Each DataObject represents a value of type file, string, boolean, 
-    integer, or float.
+    integer, or float. PARAMS: ?page_size=N pages through the index newest first. Follow "next" for each page after the first. LIST_ROUTES: "batch" takes a list of new DataObjects and creates them in one transaction.
     """
 
     lookup_field = 'uuid'
+    pagination_class = KeysetPagination
 
     def get_serializer_class(self):
         if self.action == 'partial_update':
@@ -163,6 +188,23 @@ class DataObjectViewSet(rest_framework.viewsets.ModelViewSet):
         queryset = self.get_serializer_class().apply_prefetch(queryset)
         return queryset.order_by('-datetime_created')
     
+    @list_route(methods=['post'], url_path='batch',
+                serializer_class=rest_framework.serializers.Serializer)
+    def batch(self, request):
+        data = json.loads(request.body)
+        if not isinstance(data, list):
+            raise rest_framework.exceptions.ValidationError(
+                'Expected a list of DataObjects')
+        data_objects = []
+        with transaction.atomic():
+            for data_object_data in data:
+                s = serializers.DataObjectSerializer(
+                    data=data_object_data, context={'request': request})
+                s.is_valid(raise_exception=True)
+                s.save()
+                data_objects.append(s.data)
+        return JsonResponse(data_objects, status=201, safe=False)
+
     @detail_route(methods=['post'], url_path='add-tag',
                   serializer_class=serializers.DataTagSerializer)
     def add_tag(self, request, uuid=None):
@@ -276,7 +318,7 @@ class TaskViewSet(ExpandableViewSet):
 
 
 class TaskAttemptViewSet(ExpandableViewSet):
-    """A TaskAttempt represents a single attempt at executing a Task. A Task may have multiple TaskAttempts due to retries. PARAMS: ?expand will show expanded version of linked objects (not allowed in index view). ?summary will show a summary version (not allowed in index view). ?url will show only the url and uuid fields (for testing only). DETAIL_ROUTES: "fail" will set a run to failed status. "finish" will set a run to finished status. "log-files" can be used to POST a new LogFile. "events" can be used to POST a new event. "settings" can be used to get settings for loom-task-monitor.
+    """A TaskAttempt represents a single attempt at executing a Task. A Task may have multiple TaskAttempts due to retries. PARAMS: ?expand will show expanded version of linked objects (not allowed in index view). ?summary will show a summary version (not allowed in index view). ?url will show only the url and uuid fields (for testing only). DETAIL_ROUTES: "fail" will set a run to failed status. "finish" will set a run to finished status. "heartbeat" records that the task monitor is alive. "log-files" can be used to POST a new LogFile. "events" can be used to POST a new event. "batch" takes a list of "events", a list of "outputs" updates, and an optional final "status" ("finished", "system_error", or "analysis_error") in one request, and saves events and outputs in one transaction. "settings" can be used to get settings for loom-task-monitor.
     """
     lookup_field = 'uuid'
 
@@ -331,6 +373,13 @@ class TaskAttemptViewSet(ExpandableViewSet):
         async.finish_task_attempt(task_attempt.uuid)
         return JsonResponse({}, status=201)
 
+    @detail_route(methods=['post'], url_path='heartbeat',
+                  serializer_class=rest_framework.serializers.Serializer)
+    def heartbeat(self, request, uuid=None):
+        task_attempt = self._get_task_attempt(request, uuid)
+        last_heartbeat = task_attempt.heartbeat()
+        return JsonResponse({'last_heartbeat': last_heartbeat}, status=201)
+
     @detail_route(methods=['post'], url_path='events',
                   serializer_class=serializers.TaskAttemptEventSerializer)
     def create_event(self, request, uuid=None):
@@ -346,9 +395,52 @@ class TaskAttemptViewSet(ExpandableViewSet):
             })
         s.is_valid(raise_exception=True)
         model = s.save()
+        task_attempt.record_events([model])
 
         return JsonResponse(s.data, status=201)
 
+    BATCH_STATUS_ACTIONS = {
+        'finished': lambda task_attempt: async.finish_task_attempt(
+            task_attempt.uuid),
+        'system_error': lambda task_attempt: task_attempt.system_error(),
+        'analysis_error': lambda task_attempt: task_attempt.analysis_error(),
+    }
+
+    @detail_route(methods=['post'], url_path='batch',
+                  serializer_class=rest_framework.serializers.Serializer)
+    def batch(self, request, uuid=None):
+        data = json.loads(request.body)
+        task_attempt = self._get_task_attempt(request, uuid)
+        status = data.get('status')
+        if status is not None and status not in self.BATCH_STATUS_ACTIONS:
+            raise rest_framework.exceptions.ValidationError(
+                {'status': 'Invalid status "%s". Valid values are %s' % (
+                    status, ', '.join(sorted(self.BATCH_STATUS_ACTIONS)))})
+        outputs = []
+        with transaction.atomic():
+            for output_data in data.get('outputs', []):
+                try:
+                    output = task_attempt.outputs.get(
+                        uuid=output_data.get('uuid'))
+                except ObjectDoesNotExist:
+                    raise rest_framework.exceptions.NotFound(
+                        'Output "%s" not found' % output_data.get('uuid'))
+                s = serializers.TaskAttemptOutputUpdateSerializer(
+                    output, data=output_data, partial=True,
+                    context={'request': request})
+                s.is_valid(raise_exception=True)
+                s.save()
+                outputs.append(s.data)
+            try:
+                task_attempt.add_events(data.get('events', []))
+            except django.core.exceptions.ValidationError as e:
+                raise rest_framework.exceptions.ValidationError(
+                    {'events': e.messages})
+        # Status changes read the outputs, so they run after the commit
+        if status is not None:
+            self.BATCH_STATUS_ACTIONS[status](task_attempt)
+        return JsonResponse({'outputs': outputs}, status=201)
+
     @detail_route(methods=['get'], url_path='settings')
     def get_task_monitor_settings(self, request, uuid=None):
         task_attempt = self._get_task_attempt(request, uuid)
@@ -363,19 +455,34 @@ class TaskAttemptViewSet(ExpandableViewSet):
             'PRESERVE_ON_FAILURE': get_setting('PRESERVE_ON_FAILURE'),
             'HEARTBEAT_INTERVAL_SECONDS':
             get_setting('TASKRUNNER_HEARTBEAT_INTERVAL_SECONDS'),
+            'INPUT_STAGING_MODE': self._get_input_staging_mode(),
+            'INPUT_COPY_JOBS': get_setting('INPUT_COPY_JOBS'),
+            'STORAGE_ROOT': get_setting('STORAGE_ROOT'),
         }, status=200)
 
+    def _get_input_staging_mode(self):
+        # Inputs can only be linked if the worker can see local storage
+        if get_setting('STORAGE_TYPE') != 'local':
+            return 'copy'
+        return get_setting('INPUT_STAGING_MODE')
+
 
 class TemplateViewSet(ExpandableViewSet):
-    """A Template is a pattern for analysis to be performed, but without assigned inputs. Templates can be nested under the 'steps' field. Only leaf nodes contain command, interpreter, resources, and environment. PARAMS: ?expand will show expanded version of linked objects to the full nested depth (not allowed in index view). ?summary will show a summary version to full nested depth (not allowed in index view). ?url will show only the url and uuid fields (for testing only).
+    """A Template is a pattern for analysis to be performed, but without assigned inputs. Templates can be nested under the 'steps' field. Only leaf nodes contain command, interpreter, resources, and environment. PARAMS: ?expand will show expanded version of linked objects to the full nested depth (not allowed in index view). ?summary will show a summary version to full nested depth (not allowed in index view). ?url will show only the url and uuid fields (for testing only). ?page_size=N pages through the index newest first. Follow "next" for each page after the first.
     """
     lookup_field = 'uuid'
+    pagination_class = KeysetPagination
 
     DEFAULT_SERIALIZER = serializers.TemplateSerializer
     EXPANDED_SERIALIZER = serializers.TemplateSerializer
     SUMMARY_SERIALIZER = serializers.SummaryTemplateSerializer
     URL_SERIALIZER = serializers.URLTemplateSerializer
 
+    def retrieve(self, request, **kwargs):
+        # Templates are not edited after they are created
+        return self._retrieve_with_cache(
+            request, models.Template, [], lambda template: True, **kwargs)
+
     def get_queryset(self):
         query_string = self.request.query_params.get('q', '')
         imported = 'imported' in self.request.query_params
@@ -484,16 +591,25 @@ class TemplateViewSet(ExpandableViewSet):
 
 
 class RunViewSet(ExpandableViewSet):
-    """A Run represents the execution of a Template on a specific set of inputs. Runs can be nested under the 'steps' field. Only leaf nodes contain command, interpreter, resources, environment, and tasks. PARAMS: ?expand will show expanded version of linked objects to the full nested depth (not allowed in index view). ?summary will show a summary version to full nested depth (not allowed in index view). ?url will show only the url and uuid fields (for testing only).
+    """A Run represents the execution of a Template on a specific set of inputs. Runs can be nested under the 'steps' field. Only leaf nodes contain command, interpreter, resources, environment, and tasks. PARAMS: ?expand will show expanded version of linked objects to the full nested depth (not allowed in index view). ?summary will show a summary version to full nested depth (not allowed in index view). ?url will show only the url and uuid fields (for testing only). ?page_size=N pages through the index newest first. Follow "next" for each page after the first. DETAIL_ROUTES: "export" streams the Run, its steps, Tasks, TaskAttempts, and DataNodes as newline-delimited JSON, for trees too large for ?expand. "changes" streams status changes and new events in the Run and its steps as Server-Sent Events, starting from the current status, or after the id given as Last-Event-ID or ?last_id. The stream is a long poll that closes after sending changes, and the client reconnects. LIST_ROUTES: "changes?runs=UUID,UUID" streams the changes in several Runs, so that one client can follow them with one stream.
     """
 
     lookup_field = 'uuid'
+    pagination_class = KeysetPagination
 
     DEFAULT_SERIALIZER = serializers.RunSerializer
     EXPANDED_SERIALIZER = serializers.ExpandedRunSerializer
     SUMMARY_SERIALIZER = serializers.SummaryRunSerializer
     URL_SERIALIZER = serializers.URLRunSerializer
 
+    def retrieve(self, request, **kwargs):
+        return self._retrieve_with_cache(
+            request, models.Run,
+            ['tree_id', 'status_is_finished', 'status_is_failed',
+             'status_is_killed'],
+            lambda run: run.has_terminal_status(),
+            tree_id=lambda run: run.tree_id, **kwargs)
+
     def get_queryset(self):
         query_string = self.request.query_params.get('q', '')
         parent_only = 'parent_only' in self.request.query_params
@@ -600,6 +716,55 @@ class RunViewSet(ExpandableViewSet):
             labels.append(label.label)
         return JsonResponse({'labels': labels}, status=200)
 
+    @detail_route(methods=['get'], url_path='export')
+    def export(self, request, uuid=None):
+        try:
+            run = models.Run.objects.get(uuid=uuid)
+        except ObjectDoesNotExist:
+            raise rest_framework.exceptions.NotFound()
+        return StreamingHttpResponse(
+            streams.stream_run_tree(run, {'request': request}),
+            content_type='application/x-ndjson')
+
+    @detail_route(methods=['get'], url_path='changes')
+    def changes(self, request, uuid=None):
+        try:
+            run = models.Run.objects.get(uuid=uuid)
+        except ObjectDoesNotExist:
+            raise rest_framework.exceptions.NotFound()
+        return self._stream_changes(request, [run])
+
+    @list_route(methods=['get'], url_path='changes')
+    def changes_in_runs(self, request):
+        uuids = [uuid for uuid
+                 in request.query_params.get('runs', '').split(',') if uuid]
+        if not uuids:
+            raise rest_framework.exceptions.ValidationError(
+                'Missing required parameter "runs"')
+        runs = list(models.Run.objects.filter(uuid__in=uuids))
+        if len(runs) != len(set(uuids)):
+            raise rest_framework.exceptions.NotFound()
+        return self._stream_changes(request, runs)
+
+    def _stream_changes(self, request, runs):
+        last_id = request.META.get('HTTP_LAST_EVENT_ID',
+                                   request.query_params.get('last_id'))
+        try:
+            last_id = int(last_id)
+        except (TypeError, ValueError):
+            last_id = None
+        response = StreamingHttpResponse(
+            streams.stream_status_changes(
+                runs, last_id=last_id,
+                poll_interval=get_setting(
+                    'STATUS_STREAM_POLL_INTERVAL_SECONDS'),
+                max_seconds=get_setting('STATUS_STREAM_MAX_SECONDS')),
+            content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # Don't let nginx buffer the stream
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
 
 class TaskAttemptLogFileViewSet(rest_framework.viewsets.ModelViewSet):
     """LogFiles represent the logs for TaskAttempts. The same data is available in the TaskAttempt endpoint. This endpoint is to allow updating a LogFile without updating the full TaskAttempt. DETAIL_ROUTES: "data-object" allows you to post the file DataObject for the LogFile.
@@ -707,6 +872,8 @@ class FileManagerSettingsView(RetrieveAPIView):
     def retrieve(self, request):
         return JsonResponse({
             'GCE_PROJECT': get_setting('GCE_PROJECT'),
+            'LOCAL_COPY_STRATEGIES': get_setting('LOCAL_COPY_STRATEGIES'),
+            'STORAGE_ROOT': get_setting('STORAGE_ROOT'),
         })
 
 @require_http_methods(["GET"])
@@ -722,6 +889,17 @@ def info(request):
     }
     return JsonResponse(data, status=200)
 
+@require_http_methods(["GET"])
+def stats(request):
+    # template_cache counts are for the server process that handles
+    # this request. task_queue and runs are shared by all processes.
+    data = {
+        'template_cache': models.template_cache.get_stats(),
+        'task_queue': models.TaskQueueEntry.get_stats(),
+        'runs': models.Run.get_stats(),
+    }
+    return JsonResponse(data, status=200)
+
 @require_http_methods(["GET"])
 def auth_status(request):
     if get_setting('LOGIN_REQUIRED')==False:
@@ -93,9 +93,21 @@ SERVER_URL_FOR_CLIENT = os.getenv('SERVER_URL_FOR_CLIENT', 'http://127.0.0.1:800
 STORAGE_ROOT = os.path.expanduser(os.getenv('LOOM_STORAGE_ROOT', '~/loom-data'))
 FILE_ROOT_FOR_WORKER = os.path.expanduser(
     os.getenv('FILE_ROOT_FOR_WORKER', STORAGE_ROOT))
+STORAGE_CONTENT_ADDRESSED = to_boolean(os.getenv('LOOM_STORAGE_CONTENT_ADDRESSED', 'False'))
+# Tried in order by clients copying between local paths
+LOCAL_COPY_STRATEGIES = to_list(os.getenv('LOOM_LOCAL_COPY_STRATEGIES', '[reflink,copy]'))
+BLOB_GC_INTERVAL_HOURS = int(os.getenv('LOOM_BLOB_GC_INTERVAL_HOURS', '24'))
+# "copy" or "link". "link" applies only to local storage.
+INPUT_STAGING_MODE = os.getenv('LOOM_INPUT_STAGING_MODE', 'copy').lower()
+INPUT_COPY_JOBS = int(os.getenv('LOOM_INPUT_COPY_JOBS', '4'))
 
 TASKRUNNER_HEARTBEAT_INTERVAL_SECONDS = int(os.getenv('LOOM_TASKRUNNER_HEARTBEAT_INTERVAL_SECONDS', '60'))
 TASKRUNNER_HEARTBEAT_TIMEOUT_SECONDS = int(os.getenv('LOOM_TASKRUNNER_HEARTBEAT_TIMEOUT_SECONDS', TASKRUNNER_HEARTBEAT_INTERVAL_SECONDS*2.5))
+# "database" or "cache". The cache store needs a cache shared by all processes.
+HEARTBEAT_STORE = os.getenv('LOOM_HEARTBEAT_STORE', 'database').lower()
+HEARTBEAT_FLUSH_INTERVAL_SECONDS = int(os.getenv('LOOM_HEARTBEAT_FLUSH_INTERVAL_SECONDS', '30'))
+HEARTBEAT_CACHE_BACKEND = os.getenv('LOOM_HEARTBEAT_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache')
+HEARTBEAT_CACHE_LOCATION = os.getenv('LOOM_HEARTBEAT_CACHE_LOCATION', 'loom-heartbeats')
 SYSTEM_CHECK_INTERVAL_MINUTES = int(os.getenv('LOOM_SYSTEM_CHECK_INTERVAL_MINUTES', '15'))
 PRESERVE_ON_FAILURE = to_boolean(os.getenv('LOOM_PRESERVE_ON_FAILURE', 'False'))
 PRESERVE_ALL = to_boolean(os.getenv('LOOM_PRESERVE_ALL', 'False'))
@@ -106,6 +118,26 @@ MAXIMUM_RETRIES_FOR_SYSTEM_FAILURE = int(os.getenv(
 
 DEFAULT_DOCKER_REGISTRY = os.getenv('LOOM_DEFAULT_DOCKER_REGISTRY', '')
 
+# Number of compiled jinja templates kept in memory by each process
+TEMPLATE_CACHE_SIZE = int(os.getenv('LOOM_TEMPLATE_CACHE_SIZE', '1000'))
+
+# Cached responses for Run and Template detail views. Entries are keyed on
+# each object's _change, so the cache must be shared by all server
+# processes to be invalidated by saves, e.g. memcached. The default dummy
+# cache stores nothing, but ETags still let clients skip unchanged bodies.
+RESPONSE_CACHE_BACKEND = os.getenv('LOOM_RESPONSE_CACHE_BACKEND', 'django.core.cache.backends.dummy.DummyCache')
+RESPONSE_CACHE_LOCATION = os.getenv('LOOM_RESPONSE_CACHE_LOCATION', 'loom-responses')
+RESPONSE_CACHE_TERMINAL_TTL_SECONDS = int(os.getenv('LOOM_RESPONSE_CACHE_TERMINAL_TTL_SECONDS', '86400'))
+RESPONSE_CACHE_ACTIVE_TTL_SECONDS = int(os.getenv('LOOM_RESPONSE_CACHE_ACTIVE_TTL_SECONDS', '5'))
+
+# Streams of status changes for clients that follow Runs. Each open stream
+# holds a server worker, so streams are long polls that end once they have
+# sent changes, or after STATUS_STREAM_MAX_SECONDS, and clients reconnect
+# where they left off.
+STATUS_STREAM_POLL_INTERVAL_SECONDS = float(os.getenv('LOOM_STATUS_STREAM_POLL_INTERVAL_SECONDS', '1'))
+STATUS_STREAM_MAX_SECONDS = int(os.getenv('LOOM_STATUS_STREAM_MAX_SECONDS', '5'))
+STATUS_CHANGE_RETENTION_HOURS = int(os.getenv('LOOM_STATUS_CHANGE_RETENTION_HOURS', '24'))
+
 # GCP settings
 GCE_EMAIL = os.getenv('GCE_EMAIL')
 GCE_PROJECT = os.getenv('GCE_PROJECT', '')
@@ -130,6 +162,19 @@ PLAYBOOK_PATH = os.path.join(SETTINGS_HOME, os.getenv('LOOM_PLAYBOOK_DIR', 'play
 RUN_TASK_ATTEMPT_PLAYBOOK = os.getenv('LOOM_RUN_TASK_ATTEMPT_PLAYBOOK')
 CLEANUP_TASK_ATTEMPT_PLAYBOOK = os.getenv('LOOM_CLEANUP_TASK_ATTEMPT_PLAYBOOK')
 
+# "ansible" runs the playbooks above. "local" runs loom-task-monitor directly.
+TASK_EXECUTOR = os.getenv('LOOM_TASK_EXECUTOR', 'ansible').lower()
+# Limits for the local executor. Defaults are the cores and memory of the host.
+LOCAL_EXECUTOR_MAX_CORES = to_int(os.getenv('LOOM_LOCAL_EXECUTOR_MAX_CORES'))
+LOCAL_EXECUTOR_MAX_MEMORY_GB = to_float(os.getenv('LOOM_LOCAL_EXECUTOR_MAX_MEMORY_GB'))
+
+# Capacity of the pool that the scheduler admits tasks into.
+# If none are set, tasks are not queued.
+SCHEDULER_MAX_CORES = to_int(os.getenv('LOOM_SCHEDULER_MAX_CORES'))
+SCHEDULER_MAX_MEMORY_GB = to_float(os.getenv('LOOM_SCHEDULER_MAX_MEMORY_GB'))
+SCHEDULER_MAX_DISK_SIZE_GB = to_float(os.getenv('LOOM_SCHEDULER_MAX_DISK_SIZE_GB'))
+SCHEDULER_INTERVAL_SECONDS = int(os.getenv('LOOM_SCHEDULER_INTERVAL_SECONDS', '10'))
+
 # Database settings
 # Any defaults must match defaults in playbook
 MYSQL_HOST = os.getenv('LOOM_MYSQL_HOST')
@@ -412,5 +457,13 @@ CACHES = {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
         'LOCATION': '232871b2',
         'TIMEOUT': 0,
-    }
+    },
+    'heartbeats': {
+        'BACKEND': HEARTBEAT_CACHE_BACKEND,
+        'LOCATION': HEARTBEAT_CACHE_LOCATION,
+    },
+    'responses': {
+        'BACKEND': RESPONSE_CACHE_BACKEND,
+        'LOCATION': RESPONSE_CACHE_LOCATION,
+    },
 }
@@ -1,8 +1,10 @@
 import json
 import requests
+import requests.adapters
 import time
 import datetime
 import urllib
+import urlparse
 
 from .exceptions import *
 
@@ -15,11 +17,36 @@ def disable_insecure_request_warning():
 class Connection(object):
     """Connection provides functions to create and work with objects in the 
     Loom database via the HTTP API
+
+    Requests share a pooled requests.Session, so TCP and TLS connections
+    are reused across calls. pool_size is the most connections kept open
+    to the server, which should be at least the number of threads that
+    share this Connection. With keep_alive=False each connection is
+    closed after one request. With gzip=True, responses may be compressed.
     """
 
-    def __init__(self, master_url, token=None):
+    DEFAULT_POOL_SIZE = 10
+
+    def __init__(self, master_url, token=None, pool_size=DEFAULT_POOL_SIZE,
+                 keep_alive=True, gzip=True):
         self.api_root_url = master_url + '/api/'
         self.token = token
+        self.session = self._create_session(pool_size, keep_alive, gzip)
+
+    def _create_session(self, pool_size, keep_alive, gzip):
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.headers.update({
+            'Connection': 'keep-alive' if keep_alive else 'close',
+            'Accept-Encoding': 'gzip, deflate' if gzip else 'identity',
+        })
+        return session
+
+    def close(self):
+        self.session.close()
 
     # ---- General methods ----
 
@@ -32,7 +59,7 @@ class Connection(object):
         url = self.api_root_url + relative_url
         disable_insecure_request_warning()      
         return self._make_request_to_server(
-            lambda: requests.post(
+            lambda: self.session.post(
                 url,
                 data=json.dumps(data),
                 headers=self._add_token({'content-type': 'application/json'}),
@@ -43,7 +70,7 @@ class Connection(object):
         url = self.api_root_url + relative_url
         disable_insecure_request_warning()
         return self._make_request_to_server(
-            lambda: requests.put(
+            lambda: self.session.put(
                 url,
                 data=json.dumps(data),
                 headers=self._add_token({'content-type': 'application/json'}),
@@ -53,20 +80,22 @@ class Connection(object):
         url = self.api_root_url + relative_url
         disable_insecure_request_warning()
         return self._make_request_to_server(
-            lambda: requests.patch(
+            lambda: self.session.patch(
                 url,
                 data=json.dumps(data),
                 headers=self._add_token({'content-type': 'application/json'}),
                 verify=False))
 
-    def _get(self, relative_url, raise_for_status=True, params=None):
+    def _get(self, relative_url, raise_for_status=True, params=None,
+             stream=False):
         url = self.api_root_url + relative_url
         disable_insecure_request_warning()
         return self._make_request_to_server(
-            lambda: requests.get(
+            lambda: self.session.get(
                 url,
                 verify=False, # Don't fail on unrecognized SSL certificate
                 params=params,
+                stream=stream,
                 headers=self._add_token({})), 
             raise_for_status=raise_for_status)
 
@@ -74,7 +103,7 @@ class Connection(object):
         url = self.api_root_url + relative_url
         disable_insecure_request_warning()
         return self._make_request_to_server(
-            lambda: requests.delete(
+            lambda: self.session.delete(
                 url,
                 headers=self._add_token({'content-type': 'application/json'}),
                 verify=False,
@@ -135,6 +164,38 @@ class Connection(object):
         response = self._get(relative_url, params=params)
         return response.json()
 
+    def _iterate_object_index(self, relative_url, params=None, page_size=100):
+        """Generator over an index that supports ?page_size and ?cursor.
+        Each page is requested only when the one before it is used up.
+        """
+        params = dict(params or {})
+        params['page_size'] = page_size
+        while True:
+            page = self._get_object_index(relative_url, params=params)
+            for item in page['results']:
+                yield item
+            if not page.get('next'):
+                return
+            # Only the cursor is taken from "next", since its host may
+            # not be reachable from here
+            params['cursor'] = urlparse.parse_qs(
+                urlparse.urlparse(page['next']).query)['cursor'][0]
+
+    def _get_page_size_for_max(self, max, page_size=100):
+        # To check "max" we need at most max+1 items
+        if max == float('inf'):
+            return page_size
+        return int(min(max+1, page_size))
+
+    def _list_up_to(self, iterator, max):
+        # Stop fetching pages once "max" is exceeded
+        items = []
+        for item in iterator:
+            items.append(item)
+            if len(items) > max:
+                break
+        return items
+
     # ---- Post/Put/Get [object_type] methods ----
 
     def post_data_object(self, data):
@@ -142,6 +203,14 @@ class Connection(object):
             data,
             'data-objects/')
 
+    def post_data_object_batch(self, data_objects):
+        """Create a list of DataObjects in one transaction. Returns the
+        new DataObjects in the same order.
+        """
+        return self._post_object(
+            data_objects,
+            'data-objects/batch/')
+
     def get_data_object(self, data_object_id):
         return self._get_object(
             'data-objects/%s/' % data_object_id)
@@ -171,10 +240,9 @@ class Connection(object):
         data = self._get_object_index(url, params=params)
         return data
 
-    def get_data_object_index(
+    def iterate_data_object_index(
             self, query_string=None, source_type=None,
-            labels=None,
-            type=None, min=0, max=float('inf')):
+            labels=None, type=None, page_size=100):
         url = 'data-objects/'
         params = {}
         if query_string:
@@ -185,7 +253,19 @@ class Connection(object):
             params['type'] = type
         if labels:
             params['labels'] = ','.join(labels)
-        data_objects =  self._get_object_index(url, params=params)
+        return self._iterate_object_index(url, params=params,
+                                          page_size=page_size)
+
+    def get_data_object_index(
+            self, query_string=None, source_type=None,
+            labels=None,
+            type=None, min=0, max=float('inf')):
+        data_objects = self._list_up_to(
+            self.iterate_data_object_index(
+                query_string=query_string, source_type=source_type,
+                labels=labels, type=type,
+                page_size=self._get_page_size_for_max(max)),
+            max)
         if len(data_objects) < min:
             raise IdMatchedTooFewDataObjectsError(
                 'Found %s DataObjects, expected at least %s' \
@@ -256,8 +336,8 @@ class Connection(object):
         params['offset'] = offset
         return self._get_object_index(url, params=params)
 
-    def get_template_index(self, query_string='', imported=False,
-                           labels=None, min=0, max=float('inf')):
+    def iterate_template_index(self, query_string=None, imported=False,
+                               labels=None, page_size=100):
         url = 'templates/'
         params = {}
         if query_string:
@@ -266,7 +346,16 @@ class Connection(object):
             params['imported'] = '1'
         if labels:
             params['labels'] = ','.join(labels)
-        templates = self._get_object_index(url, params=params)
+        return self._iterate_object_index(url, params=params,
+                                          page_size=page_size)
+
+    def get_template_index(self, query_string='', imported=False,
+                           labels=None, min=0, max=float('inf')):
+        templates = self._list_up_to(
+            self.iterate_template_index(
+                query_string=query_string, imported=imported,
+                labels=labels, page_size=self._get_page_size_for_max(max)),
+            max)
         if len(templates) < min:
             raise Error('Found %s templates, expected at least %s' %(len(templates), min))
         if len(templates) > max:
@@ -283,6 +372,61 @@ class Connection(object):
             'runs/%s/' % run_id
         )
 
+    def export_run(self, run_id):
+        """Generator over the records of a Run tree, as dicts with "type"
+        and "data". Records are parsed as they arrive, so memory does
+        not grow with the size of the tree.
+        """
+        response = self._get('runs/%s/export/' % run_id, stream=True)
+        try:
+            for line in response.iter_lines():
+                if line:
+                    yield json.loads(line)
+        finally:
+            response.close()
+
+    def follow_run(self, run_id):
+        """Generator over status changes and new events in a Run and its
+        steps, as dicts with "event" and "data". The first changes give
+        the current status of each Run, Task, and TaskAttempt. When the
+        server closes the stream, this reconnects and picks up after
+        the last change, until the "end" event, when the Run has a
+        terminal status.
+        """
+        last_id = None
+        while True:
+            params = {}
+            if last_id is not None:
+                params['last_id'] = last_id
+            response = self._get('runs/%s/changes/' % run_id,
+                                 params=params, stream=True)
+            try:
+                for message in self._iterate_server_sent_events(response):
+                    if message.get('id') is not None:
+                        last_id = message['id']
+                    yield {'event': message.get('event'),
+                           'data': json.loads(message.get('data', 'null'))}
+                    if message.get('event') == 'end':
+                        return
+            finally:
+                response.close()
+
+    def _iterate_server_sent_events(self, response):
+        message = {}
+        for line in response.iter_lines():
+            if not line:
+                # A blank line ends the message
+                if 'event' in message or 'data' in message:
+                    yield message
+                message = {}
+            elif line.startswith(':'):
+                # Comments keep the connection alive
+                continue
+            else:
+                field, _, value = line.partition(':')
+                message[field] = value[1:] if value.startswith(' ') \
+                                 else value
+
     def get_run_index_with_limit(self, query_string=None, parent_only=False,
                                  labels=None, limit=10, offset=0):
         url = 'runs/'
@@ -297,9 +441,8 @@ class Connection(object):
         params['offset'] = offset
         return self._get_object_index(url, params=params)
 
-    def get_run_index(self, query_string=None, parent_only=False,
-                      labels=None,
-                      min=0, max=float('inf')):
+    def iterate_run_index(self, query_string=None, parent_only=False,
+                          labels=None, page_size=100):
         url = 'runs/'
         params = {}
         if query_string:
@@ -308,7 +451,17 @@ class Connection(object):
             params['parent_only'] = '1'
         if labels:
             params['labels'] = ','.join(labels)
-        runs = self._get_object_index(url, params=params)
+        return self._iterate_object_index(url, params=params,
+                                          page_size=page_size)
+
+    def get_run_index(self, query_string=None, parent_only=False,
+                      labels=None,
+                      min=0, max=float('inf')):
+        runs = self._list_up_to(
+            self.iterate_run_index(
+                query_string=query_string, parent_only=parent_only,
+                labels=labels, page_size=self._get_page_size_for_max(max)),
+            max)
         if len(runs) < min:
             raise Error('Found %s template runs, expected at least %s' %(len(runs), min))
         if len(runs) > max:
@@ -380,6 +533,25 @@ class Connection(object):
             {},
             'task-attempts/%s/finish/' % task_attempt_id)
 
+    def post_task_attempt_batch(self, task_attempt_id, events=None,
+                                outputs=None, status=None):
+        """Save events and output updates in one transaction, then set
+        status, if given, to "finished", "system_error", or
+        "analysis_error"
+        """
+        data = {'events': events or [],
+                'outputs': outputs or []}
+        if status is not None:
+            data['status'] = status
+        return self._post_object(
+            data,
+            'task-attempts/%s/batch/' % task_attempt_id)
+
+    def post_task_attempt_heartbeat(self, task_attempt_id):
+        return self._post_object(
+            {},
+            'task-attempts/%s/heartbeat/' % task_attempt_id)
+
     def post_abstract_file_import(self, file_import):
         return self._post_object(
             file_import,
@@ -502,7 +674,7 @@ class Connection(object):
         )
 
     def create_token(self, username=None, password=None):
-        response = requests.post(
+        response = self.session.post(
             self.api_root_url+'tokens/',
             auth=(username, password),
         )
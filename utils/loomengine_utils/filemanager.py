@@ -1,19 +1,26 @@
 import copy
 import errno
+import fcntl
 import glob
 import google.cloud.storage
+import io
 import logging
+import mimetypes
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ApplyResult, ThreadPool
 import os
 import random
 from requests.exceptions import HTTPError
 import shutil
 import sys
 import tempfile
+import threading
 import time
 import urlparse
 import warnings
 
 from . import execute_with_retries
+from . import md5cache
 from . import md5calc
 from .exceptions import *
 from .connection import Connection
@@ -137,6 +144,8 @@ class AbstractFile:
         raise Exception('Child class must override this method')
 
     def copy_to(self, destination, expected_md5=None):
+        """Returns the number of bytes copied, or None if not known
+        """
         if self.retry or destination.retry:
             tries_remaining = 2
         else:
@@ -145,8 +154,10 @@ class AbstractFile:
         while True:
             try:
                 copier = Copier(self, destination)
-                copier.copy()
-                destination.verify_md5(expected_md5)
+                md5 = copier.copy()
+                destination.verify_md5(expected_md5, md5=md5)
+                if md5 is not None:
+                    destination.cache_md5(md5)
                 break
             except Md5ValidationError as e:
                 logger.info('Copied file did not have the expected md5. '\
@@ -154,11 +165,17 @@ class AbstractFile:
                 if tries_remaining == 0:
                     raise
                 tries_remaining -= 1
-                destination.delete()
+                if destination.exists():
+                    destination.delete()
+        return copier.size
 
-    def verify_md5(self, expected_md5):
+    def verify_md5(self, expected_md5, md5=None):
+        """md5 is the hash of the bytes written, if the copier calculated
+        it while copying. Otherwise the file is read again.
+        """
         if expected_md5:
-            md5 = self.calculate_md5()
+            if md5 is None:
+                md5 = self.calculate_md5()
             if md5 != expected_md5:
                 raise Md5ValidationError(
                     'Expected md5 "%s" for file "%s", but found md5 "%s"'
@@ -166,6 +183,11 @@ class AbstractFile:
 
     def calculate_md5(self):
         raise Exception('Child class must override this method')
+    def cache_md5(self, md5):
+        """Remember the md5 of a file just written, if this type of
+        File caches it
+        """
+        pass
     def get_url(self):
         raise Exception('Child class must override this method')
     def get_path(self):
@@ -190,11 +212,20 @@ class LocalFile(AbstractFile):
     type = 'local'
 
     def __init__(self, url, settings, retry=False):
+        self.settings = settings
         self.url = _urlparse(url)
         self.retry = retry
 
     def calculate_md5(self):
-        return md5calc.calculate_md5sum(self.get_path())
+        cache = md5cache.get_cache()
+        md5 = cache.get(self.get_path())
+        if md5 is None:
+            md5 = md5calc.calculate_md5sum(self.get_path())
+            cache.set(self.get_path(), md5)
+        return md5
+
+    def cache_md5(self, md5):
+        md5cache.get_cache().set(self.get_path(), md5, check_recent=False)
 
     def get_url(self):
         return self.url.geturl()
@@ -342,11 +373,30 @@ class AbstractCopier:
         self.destination = destination
         self.expected_md5=expected_md5
         self.retry = self.source.retry or self.destination.retry
+        # Bytes copied, if the copy measured them
+        self.size = None
             
-    def copy(self, path):
+    def copy(self):
+        """Returns the md5 of the bytes copied if it was calculated
+        while copying, otherwise None. Sets self.size.
+        """
         raise Exception('Child class must override method')
 
 class LocalCopier(AbstractCopier):
+    """Copies with the first of LOCAL_COPY_STRATEGIES in the server settings
+    that works, falling back to "copy". "reflink" makes a copy-on-write
+    clone, "hardlink" links to the same data, and "copy" writes the data
+    again. The file is written under a temporary name and renamed, so the
+    destination is never seen partly written.
+
+    "hardlink" is only used for copies into STORAGE_ROOT. A hardlink from
+    storage into a task's working directory or an export would let an
+    edit in place change the stored file for every run that uses it.
+    """
+
+    DEFAULT_STRATEGIES = ['copy']
+    # From linux/fs.h
+    FICLONE = 0x40049409
 
     def copy(self):
         # Retry has no effect in local copier
@@ -357,7 +407,56 @@ class LocalCopier(AbstractCopier):
                 pass
             else:
                 raise
-        shutil.copy(self.source.get_path(), self.destination.get_path())
+        settings = self.destination.settings or {}
+        strategies = settings.get('LOCAL_COPY_STRATEGIES') \
+                     or self.DEFAULT_STRATEGIES
+        if not self._is_in_storage(settings.get('STORAGE_ROOT')):
+            strategies = [strategy for strategy in strategies
+                          if strategy != 'hardlink']
+        if 'copy' not in strategies:
+            strategies = strategies + ['copy']
+        temp_path = '%s.tmp-%06x' % (
+            self.destination.get_path(), random.randint(0, 0xffffff))
+        for strategy in strategies:
+            try:
+                md5 = getattr(self, '_%s' % strategy)(
+                    self.source.get_path(), temp_path)
+                break
+            except (OSError, IOError) as e:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                if strategy == strategies[-1]:
+                    raise
+                logger.debug('   %s failed with error "%s"' % (strategy, e))
+        self.size = os.path.getsize(temp_path)
+        os.rename(temp_path, self.destination.get_path())
+        return md5
+
+    def _is_in_storage(self, storage_root):
+        if not storage_root:
+            return False
+        storage_root = os.path.join(os.path.realpath(storage_root), '')
+        return os.path.realpath(
+            self.destination.get_path()).startswith(storage_root)
+
+    def _reflink(self, source_path, destination_path):
+        with open(source_path, 'rb') as source, \
+             open(destination_path, 'wb') as destination:
+            fcntl.ioctl(destination.fileno(), self.FICLONE, source.fileno())
+        shutil.copymode(source_path, destination_path)
+        # Same data as the source, so the same md5 if the source has
+        # not changed since it was hashed
+        return md5cache.get_cache().get(source_path)
+
+    def _hardlink(self, source_path, destination_path):
+        # link() does not follow symlinks, e.g. a linked task input
+        os.link(os.path.realpath(source_path), destination_path)
+        return md5cache.get_cache().get(source_path)
+
+    def _copy(self, source_path, destination_path):
+        md5 = md5calc.copy_with_md5sum(source_path, destination_path)
+        shutil.copymode(source_path, destination_path)
+        return md5
 
 
 class GoogleStorageCopier(AbstractCopier):
@@ -378,21 +477,43 @@ class GoogleStorageCopier(AbstractCopier):
             logger.info("   copied %s of %s bytes ..." % (rewritten, size))
             if not rewrite_token:
                 logger.info("   copy completed ...")
+                self.size = size
                 break
+        # Copied by the server, which checks the md5
+        return None
 
 
 class Local2GoogleStorageCopier(AbstractCopier):
 
     def copy(self):
         if self.retry:
-            execute_with_retries(
-                lambda: self.destination.blob.upload_from_filename(
-                    self.source.get_path()),
+            md5 = execute_with_retries(
+                self._upload,
                 (Exception,),
                 logger,
                 'File upload')
         else:
-            self.destination.blob.upload_from_filename(self.source.get_path())
+            md5 = self._upload()
+        # Storage calculates the md5 of what it received, and returns it
+        # with the upload response
+        if md5 is not None and self.destination.blob.md5_hash:
+            stored_md5 = self.destination.calculate_md5()
+            if md5 != stored_md5:
+                raise Md5ValidationError(
+                    'Uploaded md5 "%s" for file "%s", but storage has md5 "%s"'
+                    % (md5, self.destination.get_url(), stored_md5))
+        return md5
+
+    def _upload(self):
+        path = self.source.get_path()
+        with io.open(path, 'rb') as f:
+            reader = md5calc.Md5Reader(f)
+            self.size = os.fstat(f.fileno()).st_size
+            self.destination.blob.upload_from_file(
+                reader,
+                content_type=mimetypes.guess_type(path)[0],
+                size=self.size)
+        return reader.md5sum()
 
 
 class GoogleStorage2LocalCopier(AbstractCopier):
@@ -409,32 +530,85 @@ class GoogleStorage2LocalCopier(AbstractCopier):
                     (os.path.dirname(self.destination.get_path()),
                      e))
         if self.retry:
-            execute_with_retries(
-                lambda: self.source.blob.download_to_filename(
-                    self.destination.get_path()),
+            return execute_with_retries(
+                self._download,
                 (Exception,),
                 logger,
                 'File download')
         else:
-            self.source.blob.download_to_filename(self.destination.get_path())
+            return self._download()
+
+    def _download(self):
+        with io.open(self.destination.get_path(), 'wb') as f:
+            writer = md5calc.Md5Writer(f)
+            self.source.blob.download_to_file(writer)
+        self.size = writer.hashed_bytes
+        return writer.md5sum()
+
+
+class _ExitInThread(Exception):
+    """ThreadPool workers die on SystemExit without returning a result,
+    so it is passed back to the caller as a regular exception instead.
+    """
+
+    def __init__(self, code):
+        self.code = code
+
+
+def _call_in_thread(function, *args, **kwargs):
+    try:
+        return function(*args, **kwargs)
+    except SystemExit as e:
+        raise _ExitInThread(e.code)
 
 
 class FileManager:
     """Manages file import/export
+
+    With jobs > 1, import_from_patterns runs as a pipeline. Files are
+    hashed and checked for duplicates by a pool of jobs threads, registered
+    with the server in batches as hashes become ready, and copied by a
+    second pool of jobs threads, so hashing later files overlaps copying
+    earlier ones.
     """
 
-    def __init__(self, master_url, token=None):
-        self.connection = Connection(master_url, token=token)
+    # Most new files registered in one request
+    REGISTER_BATCH_SIZE = 100
+
+    def __init__(self, master_url, token=None, jobs=1):
+        self.jobs = max(jobs, 1)
+        # Hashing threads, copying threads, and the caller share connections
+        self.connection = Connection(
+            master_url, token=token,
+            pool_size=max(Connection.DEFAULT_POOL_SIZE, 2*self.jobs+1))
         self.settings = self.connection.get_filemanager_settings()
+        # Bytes copied by imports, as measured by the copies
+        self.copied_bytes = 0
+        self._copied_bytes_lock = threading.Lock()
 
     def import_from_patterns(self, patterns, comments, original_copy=False,
                              force_duplicates=False, retry=False):
-
-        files = []
+        start_time = time.time()
+        start_bytes = self.copied_bytes
+        sources = []
         for pattern in patterns:
-            files.extend(self.import_from_pattern(
-                pattern, comments, original_copy=original_copy,
-                force_duplicates=force_duplicates, retry=retry))
+            sources.extend(FileSet(pattern, self.settings, retry=retry))
+        if self.jobs > 1:
+            files = self._import_in_pipeline(
+                sources, comments, original_copy=original_copy,
+                force_duplicates=force_duplicates, retry=retry)
+        else:
+            files = [self.import_file(
+                source.get_url(),
+                comments,
+                original_copy=original_copy,
+                force_duplicates=force_duplicates,
+                retry=retry,
+            ) for source in sources]
+        if sources:
+            self._log_import_stats(len(sources),
+                                   self.copied_bytes - start_bytes,
+                                   time.time() - start_time)
         return files
 
     def import_from_pattern(self, pattern, comments, original_copy=False,
@@ -463,12 +637,139 @@ class FileManager:
                     source, comments, force_duplicates=force_duplicates)
                 return self._execute_file_import(data_object, source, retry=retry)
         except HTTPError as e:
-            if e.response.status_code==400:
-                errors = e.response.json()
-                raise SystemExit(
-                    "ERROR! %s" % errors)
-            else:
-                raise
+            self._handle_http_error(e)
+
+    def _handle_http_error(self, e):
+        if e.response.status_code==400:
+            errors = e.response.json()
+            raise SystemExit(
+                "ERROR! %s" % errors)
+        else:
+            raise
+
+    def _import_in_pipeline(self, sources, comments, original_copy=False,
+                            force_duplicates=False, retry=False):
+        hash_pool = ThreadPool(self.jobs)
+        copy_pool = ThreadPool(self.jobs)
+        try:
+            prepared = hash_pool.imap(
+                lambda source: _call_in_thread(
+                    self._prepare_file_import, source, comments,
+                    original_copy=original_copy,
+                    force_duplicates=force_duplicates),
+                sources)
+            results = []
+            # Files hashed in parallel can have the same name and md5.
+            # Unless forced, each is registered once, keyed on
+            # (filename, md5), and copied once, keyed on uuid.
+            registered = None if force_duplicates else {}
+            copies = {}
+            for batch in self._iterate_ready_batches(prepared):
+                for (source, data_object) in self._register_files(
+                        batch, registered=registered):
+                    if data_object['uuid'] in copies:
+                        results.append(copies[data_object['uuid']])
+                    elif original_copy \
+                       or data_object['value']['upload_status'] == 'complete':
+                        results.append(data_object)
+                    else:
+                        copies[data_object['uuid']] = copy_pool.apply_async(
+                            _call_in_thread,
+                            (self._execute_file_import, data_object, source),
+                            {'retry': retry})
+                        results.append(copies[data_object['uuid']])
+            return [result.get() if isinstance(result, ApplyResult)
+                    else result for result in results]
+        except _ExitInThread as e:
+            raise SystemExit(e.code)
+        except HTTPError as e:
+            self._handle_http_error(e)
+        finally:
+            hash_pool.terminate()
+            copy_pool.terminate()
+
+    def _iterate_ready_batches(self, prepared):
+        """Yields lists of items from a ThreadPool.imap iterator. Each
+        list has the next item and any that follow it already finished,
+        so registration waits for at most one file to be hashed.
+        """
+        while True:
+            try:
+                batch = [prepared.next()]
+            except StopIteration:
+                return
+            while len(batch) < self.REGISTER_BATCH_SIZE:
+                try:
+                    batch.append(prepared.next(timeout=0))
+                except (TimeoutError, StopIteration):
+                    break
+            yield batch
+
+    def _prepare_file_import(self, source, comments, original_copy=False,
+                             force_duplicates=False):
+        """Returns (source, duplicate, None) if a duplicate was found,
+        or (source, None, value) for a new file that must be registered.
+        """
+        filename = source.get_filename()
+        logger.info('Calculating md5 on file "%s"...' % source.get_url())
+        md5 = source.calculate_md5()
+        if not force_duplicates:
+            duplicate = self._get_last_duplicate_with_warning(filename, md5)
+            if duplicate is not None:
+                return (source, duplicate, None)
+        return (source, None, self._get_file_value(
+            source, filename, md5, comments, original_copy=original_copy))
+
+    def _register_files(self, batch, registered=None):
+        """Creates data objects for the new files in batch with one
+        request. Returns (source, data_object) for every item in order.
+        If registered is a dict, a file with the same filename and md5
+        as one registered earlier, in this batch or a previous one,
+        gets that data object instead. New ones are added to registered.
+        """
+        new_values = []
+        new_keys = set()
+        for (source, duplicate, value) in batch:
+            if duplicate is not None:
+                continue
+            key = (value['filename'], value['md5'])
+            if registered is not None \
+               and (key in registered or key in new_keys):
+                continue
+            new_values.append(value)
+            new_keys.add(key)
+        if new_values:
+            new_data_objects = iter(self.connection.post_data_object_batch(
+                [{'type': 'file', 'value': value} for value in new_values]))
+        results = []
+        for (source, duplicate, value) in batch:
+            if duplicate is not None:
+                results.append((source, duplicate))
+                continue
+            key = (value['filename'], value['md5'])
+            if registered is not None and key in registered:
+                self._warn_duplicate(*key)
+                results.append((source, registered[key]))
+                continue
+            data_object = next(new_data_objects)
+            logger.info('   registered file %s@%s' % (
+                data_object['value']['filename'],
+                data_object['uuid']))
+            if registered is not None:
+                registered[key] = data_object
+            results.append((source, data_object))
+        return results
+
+    def _log_import_stats(self, file_count, copied_bytes, seconds):
+        # Duplicates and files the server already has are not copied,
+        # so they count as 0 bytes
+        megabytes = copied_bytes / 1024.0**2
+        seconds = max(seconds, 0.001)
+        logger.info(
+            'Processed %s files, copied %.1f MB in %.1f seconds '\
+            '(%.1f files/s, %.1f MB/s)' % (
+                file_count, megabytes, seconds,
+                file_count / seconds, megabytes / seconds))
 
     def _create_file_data_object_for_import(self, source, comments,
                                             force_duplicates=True):
@@ -477,28 +778,13 @@ class FileManager:
         md5 = source.calculate_md5()
 
         if not force_duplicates:
-            files = self._get_file_duplicates(filename, md5)
-            if len(files) > 0:
-                warnings.warn(
-                    'WARNING! The name and md5 hash "%s$%s" is already in use by one '
-                    'or more files. '\
-                    'Use "--force-duplicates" to create another copy, but if you '\
-                    'do you will have to use @uuid to reference these files.'
-                    % (filename, md5))
-                return files[-1]
-
-        value = {
-            'filename': filename,
-            'md5': md5,
-            'imported_from_url': source.get_url(),
-            'source_type': 'imported',
-        }
-        if comments:
-            value['import_comments'] = comments
+            duplicate = self._get_last_duplicate_with_warning(filename, md5)
+            if duplicate is not None:
+                return duplicate
 
         return self.connection.post_data_object({
             'type': 'file',
-            'value': value
+            'value': self._get_file_value(source, filename, md5, comments)
         })
 
     def _create_file_data_object_from_original_copy(self, source, comments,
@@ -508,35 +794,49 @@ class FileManager:
         md5 = source.calculate_md5()
 
         if not force_duplicates:
-            files = self._get_file_duplicates(filename, md5)
-            if len(files) > 0:
-                warnings.warn(
-                    'WARNING! The name and md5 hash "%s$%s" is already in use by one '
-                    'or more files. '\
-                    'Use "--force-duplicates" to create another copy, but if you '\
-                    'do you will have to use @uuid to reference these files.'
-                    % (filename, md5))
-                return files[-1]
+            duplicate = self._get_last_duplicate_with_warning(filename, md5)
+            if duplicate is not None:
+                return duplicate
+
+        file_data_object = self.connection.post_data_object({
+            'type': 'file',
+            'value': self._get_file_value(
+                source, filename, md5, comments, original_copy=True)
+        })
+        logger.info('   registered file %s@%s' % (
+            file_data_object['value']['filename'],
+            file_data_object['uuid']))
+        return file_data_object
 
+    def _get_file_value(self, source, filename, md5, comments,
+                        original_copy=False):
         value = {
             'filename': filename,
             'md5': md5,
-            'file_url': source.get_url(),
             'imported_from_url': source.get_url(),
-            'upload_status': 'complete',
             'source_type': 'imported',
         }
+        if original_copy:
+            value['file_url'] = source.get_url()
+            value['upload_status'] = 'complete'
         if comments:
             value['import_comments'] = comments
-
-        file_data_object = self.connection.post_data_object({
-            'type': 'file',
-            'value': value
-        })
-        logger.info('   registered file %s@%s' % (
-            file_data_object['value']['filename'],
-            file_data_object['uuid']))
-        return file_data_object
+        return value
+
+    def _get_last_duplicate_with_warning(self, filename, md5):
+        files = self._get_file_duplicates(filename, md5)
+        if len(files) > 0:
+            self._warn_duplicate(filename, md5)
+            return files[-1]
+        return None
+
+    def _warn_duplicate(self, filename, md5):
+        warnings.warn(
+            'WARNING! The name and md5 hash "%s$%s" is already in use by one '
+            'or more files. '\
+            'Use "--force-duplicates" to create another copy, but if you '\
+            'do you will have to use @uuid to reference these files.'
+            % (filename, md5))
 
     def _get_file_duplicates(self, filename, md5):
         files = self.connection.get_data_object_index(
@@ -641,7 +941,10 @@ class FileManager:
                 retry=retry)
             logger.info(
                 '   copying to destination %s ...' % destination.get_url())
-            source.copy_to(destination)
+            # The copy is hashed as it is written, so checking it against
+            # the registered md5 needs no extra read
+            size = source.copy_to(
+                destination, expected_md5=file_data_object['value']['md5'])
         except ApplicationDefaultCredentialsError as e:
             self._set_upload_status(file_data_object, 'failed')
             raise SystemExit(
@@ -652,6 +955,9 @@ class FileManager:
             self._set_upload_status(file_data_object, 'failed')
             raise
 
+        if size:
+            with self._copied_bytes_lock:
+                self.copied_bytes += size
         # Signal that the upload completed successfully
         file_data_object = self._set_upload_status(
             file_data_object, 'complete')
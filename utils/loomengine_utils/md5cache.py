@@ -0,0 +1,148 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+
+"""Caches md5 hashes of local files in a sqlite file, so files that have
+not changed since they were last hashed or copied are not read again.
+
+Entries are keyed on the file's device and inode, and are only used if
+the size and modification time still match, so a changed or replaced
+file is hashed again and its entry overwritten. Files modified within
+RECENT_SECONDS are not cached, since a write in the same tick of the
+filesystem clock would not change the modification time.
+
+LOOM_MD5_CACHE_FILE sets the cache location, by default
+~/.loom/md5-cache.sqlite (or under LOOM_SETTINGS_HOME). Set it to an empty
+string to disable the cache. LOOM_MD5_CACHE_MAX_ENTRIES caps the number of
+entries, by default 100000, and the least recently used are removed first.
+The cache is only an optimization, so any error reading or writing it
+disables it for the rest of the process.
+"""
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 100000
+RECENT_SECONDS = 2
+# Entries added between checks for the size cap
+PRUNE_INTERVAL = 1000
+PRUNE_SQL = 'DELETE FROM md5 WHERE rowid IN (SELECT rowid FROM md5 '\
+            'ORDER BY last_used DESC LIMIT -1 OFFSET ?)'
+
+
+def _get_default_path():
+    settings_home = os.path.expanduser(
+        os.getenv('LOOM_SETTINGS_HOME', '~/.loom'))
+    return os.path.join(settings_home, 'md5-cache.sqlite')
+
+def _get_mtime_ns(stat):
+    # Python 2 has no st_mtime_ns. The float is less precise, but the same
+    # for every stat of an unchanged file.
+    mtime_ns = getattr(stat, 'st_mtime_ns', None)
+    if mtime_ns is None:
+        mtime_ns = int(round(stat.st_mtime * 10**9))
+    return mtime_ns
+
+
+class Md5Cache(object):
+
+    def __init__(self, path, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.db = None
+        self.is_disabled = not path
+        self.entries_added = 0
+
+    def get(self, file_path):
+        """Returns the cached md5 of the file, or None
+        """
+        stat = os.stat(file_path)
+        row = self._execute(
+            'SELECT md5 FROM md5 WHERE device=? AND inode=? AND size=? '\
+            'AND mtime_ns=?', self._get_key(stat), fetch=True)
+        if not row:
+            return None
+        self._execute(
+            'UPDATE md5 SET last_used=? WHERE device=? AND inode=?',
+            (time.time(), stat.st_dev, stat.st_ino))
+        return row[0]
+
+    def set(self, file_path, md5, check_recent=True):
+        """check_recent=False caches even a recently modified file. Use it
+        only when md5 was calculated from the bytes as they were written.
+        """
+        stat = os.stat(file_path)
+        if check_recent and time.time() - stat.st_mtime < RECENT_SECONDS:
+            return
+        self._execute(
+            'INSERT OR REPLACE INTO md5 '\
+            '(device, inode, size, mtime_ns, md5, last_used) '\
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            self._get_key(stat) + (md5, time.time()))
+        self.entries_added += 1
+        if self.entries_added % PRUNE_INTERVAL == 0:
+            self._prune()
+
+    def clear(self):
+        self._execute('DELETE FROM md5')
+
+    def _get_key(self, stat):
+        return (stat.st_dev, stat.st_ino, stat.st_size, _get_mtime_ns(stat))
+
+    def _prune(self):
+        self._execute(PRUNE_SQL, (self.max_entries,))
+
+    def _execute(self, sql, params=(), fetch=False):
+        with self.lock:
+            if self.is_disabled:
+                return None
+            try:
+                if self.db is None:
+                    self.db = self._connect()
+                cursor = self.db.execute(sql, params)
+                if fetch:
+                    return cursor.fetchone()
+                self.db.commit()
+            except (sqlite3.Error, OSError, IOError) as e:
+                logger.warn('Disabling md5 cache "%s" after error "%s"'
+                            % (self.path, e))
+                self.is_disabled = True
+            return None
+
+    def _connect(self):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        # Shared by the threads of an import. self.lock serializes access.
+        db = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        # Entries can be recalculated, so skip fsync on commit
+        db.execute('PRAGMA synchronous=OFF')
+        db.execute(
+            'CREATE TABLE IF NOT EXISTS md5 ('\
+            'device INTEGER, inode INTEGER, size INTEGER, mtime_ns INTEGER, '\
+            'md5 TEXT, last_used REAL, PRIMARY KEY (device, inode))')
+        db.execute(
+            'CREATE INDEX IF NOT EXISTS md5_last_used ON md5 (last_used)')
+        db.execute(PRUNE_SQL, (self.max_entries,))
+        db.commit()
+        return db
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache():
+    """Returns the Md5Cache for this process
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = Md5Cache(
+                os.getenv('LOOM_MD5_CACHE_FILE', _get_default_path()),
+                max_entries=int(os.getenv('LOOM_MD5_CACHE_MAX_ENTRIES',
+                                          DEFAULT_MAX_ENTRIES)))
+        return _cache
@@ -1,11 +1,107 @@
 import hashlib
+import io
 
-def calculate_md5sum(file_path):
-    with open(file_path, 'rb') as f:
-        m = hashlib.md5()
+# Large reads into one reused buffer keep syscalls and allocations
+# per byte low on multi-GB files
+BUFFER_SIZE = 1024*1024*4
+
+def calculate_md5sum(file_path, buffer_size=BUFFER_SIZE):
+    m = hashlib.md5()
+    buf = bytearray(buffer_size)
+    view = memoryview(buf)
+    with io.open(file_path, 'rb', buffering=0) as f:
+        while True:
+            size = f.readinto(buf)
+            if not size:
+                break
+            m.update(view[:size])
+    return m.hexdigest()
+
+def copy_with_md5sum(source_path, destination_path, buffer_size=BUFFER_SIZE):
+    """Copy a file and return the md5 of the bytes copied,
+    reading the source only once.
+    """
+    m = hashlib.md5()
+    buf = bytearray(buffer_size)
+    view = memoryview(buf)
+    with io.open(source_path, 'rb', buffering=0) as source, \
+         io.open(destination_path, 'wb', buffering=0) as destination:
         while True:
-            data = f.read(8192)
-            if not data:
+            size = source.readinto(buf)
+            if not size:
                 break
-            m.update(data)
+            m.update(view[:size])
+            written = 0
+            while written < size:
+                written += destination.write(view[written:size])
     return m.hexdigest()
+
+
+class Md5Reader(object):
+    """Wraps a file opened for reading and calculates the md5 of the
+    bytes read, for clients that read the stream themselves. Bytes read
+    again after a seek back, e.g. when an upload resumes, are hashed once.
+    md5sum() is None if a seek skipped bytes that were never read.
+    """
+
+    def __init__(self, file_obj):
+        self.file_obj = file_obj
+        self.md5 = hashlib.md5()
+        self.hashed_bytes = 0
+        self.is_complete = True
+
+    def read(self, size=-1):
+        position = self.file_obj.tell()
+        data = self.file_obj.read(size)
+        if position > self.hashed_bytes:
+            self.is_complete = False
+        elif position + len(data) > self.hashed_bytes:
+            self.md5.update(data[self.hashed_bytes - position:])
+            self.hashed_bytes = position + len(data)
+        return data
+
+    def seek(self, offset, whence=0):
+        return self.file_obj.seek(offset, whence)
+
+    def tell(self):
+        return self.file_obj.tell()
+
+    def md5sum(self):
+        if not self.is_complete:
+            return None
+        return self.md5.hexdigest()
+
+
+class Md5Writer(object):
+    """Wraps a file opened for writing and calculates the md5 of the
+    bytes written. md5sum() is None if a seek moved away from the end
+    of the bytes written, since later writes may overwrite them.
+    """
+
+    def __init__(self, file_obj):
+        self.file_obj = file_obj
+        self.md5 = hashlib.md5()
+        self.hashed_bytes = 0
+        self.is_complete = True
+
+    def write(self, data):
+        self.file_obj.write(data)
+        self.md5.update(data)
+        self.hashed_bytes += len(data)
+
+    def seek(self, offset, whence=0):
+        result = self.file_obj.seek(offset, whence)
+        if self.file_obj.tell() != self.hashed_bytes:
+            self.is_complete = False
+        return result
+
+    def tell(self):
+        return self.file_obj.tell()
+
+    def flush(self):
+        self.file_obj.flush()
+
+    def md5sum(self):
+        if not self.is_complete:
+            return None
+        return self.md5.hexdigest()
@@ -0,0 +1,89 @@
+import BaseHTTPServer
+import SocketServer
+import json
+import requests
+import threading
+import time
+
+from loomengine_utils import connection
+
+
+"""Micro-benchmark of request latency against a local stub server,
+with a pooled Connection and with a new TCP connection per request.
+It is not collected by the test runner. Run it directly to print timings:
+
+python -m loomengine_utils.test.benchmark_connection
+"""
+
+
+REQUEST_COUNT = 200
+
+
+class StubHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    # Send headers and body together, or delayed ACKs on the kept-alive
+    # socket add ~40ms to every response
+    wbufsize = -1
+
+    def do_GET(self):
+        self.server.client_ports.add(self.client_address[1])
+        body = json.dumps({'version': '0.0.0'})
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self):
+        BaseHTTPServer.HTTPServer.__init__(
+            self, ('127.0.0.1', 0), StubHandler)
+        self.client_ports = set()
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%s' % self.server_address[1]
+
+
+def time_requests(get):
+    start = time.time()
+    for i in range(REQUEST_COUNT):
+        get()
+    return (time.time() - start) / REQUEST_COUNT
+
+def main():
+    server = StubServer()
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    try:
+        pooled = connection.Connection(server.url)
+        pooled_latency = time_requests(pooled.get_version)
+        pooled.close()
+        pooled_sockets = len(server.client_ports)
+
+        server.client_ports.clear()
+        url = server.url + '/api/version/'
+        unpooled_latency = time_requests(
+            lambda: requests.get(url, headers={'Connection': 'close'}))
+        unpooled_sockets = len(server.client_ports)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    print '%s requests: pooled %.2f ms/request on %s socket(s), '\
+        'unpooled %.2f ms/request on %s sockets' % (
+            REQUEST_COUNT, pooled_latency * 1000, pooled_sockets,
+            unpooled_latency * 1000, unpooled_sockets)
+
+
+if __name__ == '__main__':
+    main()
@@ -10,14 +10,22 @@ class MockResponse:
         # Return mock data
         return {}
 
+    def iter_lines(self):
+        return iter(['{"type": "end", "data": {}}', ''])
+
+    def close(self):
+        pass
+
 
 class MockConnection(connection.Connection):
     # Overrides connection.Connection methods that need a server
     # with mock methods
 
-    def _get(self, relative_url, raise_for_status=True, params=None):
+    def _get(self, relative_url, raise_for_status=True, params=None,
+             stream=False):
         self.method = 'GET'
         self.url = relative_url
+        self.stream = stream
         return MockResponse()
 
     def _post(self, data, relative_url):
@@ -39,6 +47,25 @@ class MockConnection(connection.Connection):
         return MockResponse()
 
 
+class MockPagedConnection(connection.Connection):
+    # Serves an index of 5 items in pages of ?page_size, and
+    # records the params of each request
+
+    def __init__(self, *args, **kwargs):
+        super(MockPagedConnection, self).__init__(*args, **kwargs)
+        self.requests = []
+
+    def _get_object_index(self, relative_url, params=None):
+        self.requests.append(dict(params))
+        start = int(params.get('cursor', 0))
+        end = start + params['page_size']
+        page = {'results': range(5)[start:end], 'next': None}
+        if end < 5:
+            page['next'] = 'http://elsewhere/api/%s?page_size=%s&cursor=%s' \
+                           % (relative_url, params['page_size'], end)
+        return page
+
+
 class TestConnection(unittest.TestCase):
 
     data = {'mock', 'data'}
@@ -52,6 +79,85 @@ class TestConnection(unittest.TestCase):
         self.assertEqual(self.connection.method, 'POST')
         self.assertEqual(self.connection.data, self.data)
 
+    def test_post_data_object_batch(self):
+        self.connection.post_data_object_batch([self.data])
+        self.assertEqual(self.connection.url, 'data-objects/batch/')
+        self.assertEqual(self.connection.method, 'POST')
+        self.assertEqual(self.connection.data, [self.data])
+
+    def test_post_task_attempt_batch(self):
+        events = [{'event': 'Copying inputs'}]
+        self.connection.post_task_attempt_batch(
+            '123', events=events, status='finished')
+        self.assertEqual(self.connection.url, 'task-attempts/123/batch/')
+        self.assertEqual(self.connection.method, 'POST')
+        self.assertEqual(self.connection.data, {
+            'events': events, 'outputs': [], 'status': 'finished'})
+
+    def test_export_run(self):
+        records = list(self.connection.export_run('123'))
+        self.assertEqual(self.connection.url, 'runs/123/export/')
+        self.assertTrue(self.connection.stream)
+        self.assertEqual(records, [{'type': 'end', 'data': {}}])
+
+
+class MockStreamResponse(MockResponse):
+
+    def __init__(self, lines):
+        self.lines = lines
+
+    def iter_lines(self):
+        return iter(self.lines)
+
+
+class MockFollowConnection(connection.Connection):
+    # The first stream is closed by the server before the run ends
+
+    def __init__(self, *args, **kwargs):
+        super(MockFollowConnection, self).__init__(*args, **kwargs)
+        self.requests = []
+        self.responses = [
+            ['retry: 1000', '',
+             'id: 7', 'event: status',
+             'data: {"type": "run", "status": "Running"}', '',
+             ': keep-alive', ''],
+            ['id: 8', 'event: event', 'data: {"event": "Run was killed"}', '',
+             'id: 8', 'event: end', 'data: {"status": "Killed"}', '']]
+
+    def _get(self, relative_url, raise_for_status=True, params=None,
+             stream=False):
+        self.requests.append(params)
+        return MockStreamResponse(self.responses.pop(0))
+
+
+class TestFollowRun(unittest.TestCase):
+
+    def test_follow_run(self):
+        mock_connection = MockFollowConnection('root_url')
+        messages = list(mock_connection.follow_run('123'))
+        self.assertEqual([message['event'] for message in messages],
+                         ['status', 'event', 'end'])
+        self.assertEqual(messages[0]['data']['status'], 'Running')
+        self.assertEqual(mock_connection.requests, [{}, {'last_id': '7'}])
+
+
+class TestPagedIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.connection = MockPagedConnection('root_url')
+
+    def test_iterate_run_index(self):
+        runs = self.connection.iterate_run_index(page_size=2)
+        self.assertEqual(self.connection.requests, [])
+        self.assertEqual(list(runs), range(5))
+        self.assertEqual(len(self.connection.requests), 3)
+
+    def test_get_run_index_stops_after_max(self):
+        with self.assertRaises(connection.Error):
+            self.connection.get_run_index(max=1)
+        self.assertEqual(len(self.connection.requests), 1)
+        self.assertEqual(self.connection.requests[0]['page_size'], 2)
+
 
 if __name__ == '__main__':
     unittest.main()
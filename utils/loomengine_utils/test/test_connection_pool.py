@@ -0,0 +1,59 @@
+import json
+import requests
+import unittest
+
+from loomengine_utils import connection
+
+
+class RecordingAdapter(object):
+    """Stands in for the send method of the adapter a Connection mounts,
+    and records the urllib3 pool each request would be sent on
+    """
+
+    def __init__(self, adapter):
+        self.adapter = adapter
+        self.pools = []
+        self.headers = []
+        adapter.send = self.send
+
+    def send(self, request, **kwargs):
+        self.pools.append(self.adapter.get_connection(request.url))
+        self.headers.append(request.headers)
+        response = requests.Response()
+        response.status_code = 200
+        response.url = request.url
+        response._content = json.dumps({'version': '0.0.0'})
+        return response
+
+
+class TestConnectionPool(unittest.TestCase):
+
+    url = 'http://loom.example.com'
+
+    def _get_recording_adapter(self, conn):
+        return RecordingAdapter(conn.session.get_adapter(self.url))
+
+    def test_requests_reuse_one_pool(self):
+        conn = connection.Connection(self.url, pool_size=4)
+        recorder = self._get_recording_adapter(conn)
+        for i in range(3):
+            self.assertEqual(conn.get_version(), '0.0.0')
+        self.assertEqual(len(recorder.pools), 3)
+        self.assertEqual(len(set([id(pool) for pool in recorder.pools])), 1)
+        self.assertEqual(recorder.adapter._pool_maxsize, 4)
+        self.assertEqual(recorder.headers[0]['Connection'], 'keep-alive')
+
+    def test_http_and_https_share_adapter(self):
+        conn = connection.Connection(self.url)
+        self.assertIs(conn.session.get_adapter('http://loom.example.com'),
+                      conn.session.get_adapter('https://loom.example.com'))
+
+    def test_no_keep_alive(self):
+        conn = connection.Connection(self.url, keep_alive=False)
+        recorder = self._get_recording_adapter(conn)
+        conn.get_version()
+        self.assertEqual(recorder.headers[0]['Connection'], 'close')
+
+
+if __name__ == '__main__':
+    unittest.main()
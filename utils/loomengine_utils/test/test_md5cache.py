@@ -0,0 +1,74 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from .. import md5cache
+
+
+class TestMd5Cache(unittest.TestCase):
+
+    md5 = 'd8e8fca2dc0f896fd7cb4cb0031ba249'
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.cache = md5cache.Md5Cache(
+            os.path.join(self.tempdir, 'cache', 'md5-cache.sqlite'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def _write_file(self, name, content, age_seconds=60):
+        path = os.path.join(self.tempdir, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        mtime = time.time() - age_seconds
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def test_get_after_set(self):
+        path = self._write_file('file', 'test\n')
+        self.assertIsNone(self.cache.get(path))
+        self.cache.set(path, self.md5)
+        self.assertEqual(self.cache.get(path), self.md5)
+
+    def test_changed_file(self):
+        path = self._write_file('file', 'test\n')
+        self.cache.set(path, self.md5)
+        os.utime(path, None)
+        self.assertIsNone(self.cache.get(path))
+
+    def test_recent_file(self):
+        path = self._write_file('file', 'test\n', age_seconds=0)
+        self.cache.set(path, self.md5)
+        self.assertIsNone(self.cache.get(path))
+        self.cache.set(path, self.md5, check_recent=False)
+        self.assertEqual(self.cache.get(path), self.md5)
+
+    def test_max_entries(self):
+        self.cache.max_entries = 2
+        paths = [self._write_file('file%s' % i, str(i)) for i in range(3)]
+        for path in paths:
+            self.cache.set(path, self.md5)
+        self.cache._prune()
+        self.assertIsNone(self.cache.get(paths[0]))
+        self.assertEqual(self.cache.get(paths[2]), self.md5)
+
+    def test_disabled(self):
+        cache = md5cache.Md5Cache('')
+        path = self._write_file('file', 'test\n')
+        cache.set(path, self.md5)
+        self.assertIsNone(cache.get(path))
+
+    def test_error_disables_cache(self):
+        # A directory where the database file should be
+        os.makedirs(self.cache.path)
+        path = self._write_file('file', 'test\n')
+        self.cache.set(path, self.md5)
+        self.assertTrue(self.cache.is_disabled)
+        self.assertIsNone(self.cache.get(path))
+
+
+if __name__ == '__main__':
+    unittest.main()
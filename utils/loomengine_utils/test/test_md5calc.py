@@ -0,0 +1,75 @@
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from .. import md5calc
+
+
+class TestMd5Calc(unittest.TestCase):
+
+    # Not a multiple of the buffer size, to cover a short last read
+    content = os.urandom(1000) * 10
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.source = os.path.join(self.tempdir, 'source')
+        with open(self.source, 'wb') as f:
+            f.write(self.content)
+        self.md5 = hashlib.md5(self.content).hexdigest()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_calculate_md5sum(self):
+        self.assertEqual(
+            md5calc.calculate_md5sum(self.source, buffer_size=4096),
+            self.md5)
+
+    def test_copy_with_md5sum(self):
+        destination = os.path.join(self.tempdir, 'destination')
+        md5 = md5calc.copy_with_md5sum(self.source, destination,
+                                       buffer_size=4096)
+        self.assertEqual(md5, self.md5)
+        with open(destination, 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+
+    def test_reader_hashes_reread_bytes_once(self):
+        with io.open(self.source, 'rb') as f:
+            reader = md5calc.Md5Reader(f)
+            reader.read(3000)
+            # e.g. a resumed upload
+            reader.seek(1000)
+            while reader.read(4096):
+                pass
+        self.assertEqual(reader.md5sum(), self.md5)
+
+    def test_reader_skipped_bytes(self):
+        with io.open(self.source, 'rb') as f:
+            reader = md5calc.Md5Reader(f)
+            reader.seek(1000)
+            reader.read()
+        self.assertIsNone(reader.md5sum())
+
+    def test_writer(self):
+        destination = os.path.join(self.tempdir, 'destination')
+        with io.open(destination, 'wb') as f:
+            writer = md5calc.Md5Writer(f)
+            writer.write(self.content[:3000])
+            writer.write(self.content[3000:])
+        self.assertEqual(writer.md5sum(), self.md5)
+
+    def test_writer_seek_back(self):
+        destination = os.path.join(self.tempdir, 'destination')
+        with io.open(destination, 'wb') as f:
+            writer = md5calc.Md5Writer(f)
+            writer.write(self.content)
+            writer.seek(0)
+            writer.write(self.content)
+        self.assertIsNone(writer.md5sum())
+
+
+if __name__ == '__main__':
+    unittest.main()
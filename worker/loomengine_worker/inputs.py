@@ -1,3 +1,4 @@
+from multiprocessing.pool import ThreadPool
 import os
 
 class BaseInput(object):
@@ -7,42 +8,42 @@ class BaseInput(object):
         self.filemanager = task_attempt.filemanager
         self.settings = task_attempt.settings
 
+    def get_files(self):
+        """Returns (data_object, path) for each file to stage in the
+        working directory
+        """
+        return []
+
 
 class FileInput(BaseInput):
 
-    def copy(self):
+    def get_files(self):
         data_object = self.data_contents
-        data_object_id = '@%s' % data_object['uuid']
-        self.filemanager.export_file(
-            data_object_id,
-            destination_url=self.settings['WORKING_DIR'],
-            retry=True)
+        return [(data_object, os.path.join(
+            self.settings['WORKING_DIR'], data_object['value']['filename']))]
 
 
 class FileListInput(BaseInput):
 
-    def copy(self):
+    def get_files(self):
         data_object_list = self.data_contents
         filename_array = [data_object['value']['filename']
                           for data_object in data_object_list]
         duplicates = self._get_duplicates(filename_array)
 
         filename_counts = {}
+        files = []
         for data_object in data_object_list:
-	    filename = data_object['value']['filename']
+            filename = data_object['value']['filename']
             # Increment filenames if there are duplicates in an array,       
             # e.g. file__0__.txt, file__1__.txt, file__2__.txt
             if filename in duplicates:
                 counter = filename_counts.setdefault(filename, 0)
                 filename_counts[filename] += 1
                 filename = self._rename_duplicate(filename, counter)
-
-            data_object_id = '@%s' % data_object['uuid']
-            self.filemanager.export_file(
-                data_object_id,
-                destination_url=os.path.join(
-                    self.settings['WORKING_DIR'], filename),
-                retry=True)
+            files.append((data_object, os.path.join(
+                self.settings['WORKING_DIR'], filename)))
+        return files
 
     def _get_duplicates(self, array):
         seen = set()
@@ -63,9 +64,63 @@ class FileListInput(BaseInput):
 
 
 class NoOpInput(BaseInput):
+    pass
+
 
-    def copy(self):
-        return
+class InputStager(object):
+    """Puts input files in the working directory. With INPUT_STAGING_MODE
+    "link", a file in local storage is staged as a symlink to the stored
+    copy, and has_links tells the TaskMonitor to bind STORAGE_ROOT
+    read-only into the container, so the link resolves and the task
+    cannot modify the stored copy. Other files are exported,
+    INPUT_COPY_JOBS at a time.
+    """
+
+    def __init__(self, task_attempt):
+        self.filemanager = task_attempt.filemanager
+        self.settings = task_attempt.settings
+        self.has_links = False
+
+    def stage(self, files):
+        files_to_copy = []
+        for (data_object, path) in files:
+            storage_path = self._get_storage_path(data_object)
+            if storage_path:
+                os.symlink(storage_path, path)
+                self.has_links = True
+            else:
+                files_to_copy.append((data_object, path))
+        if not files_to_copy:
+            return
+        pool = ThreadPool(max(int(self.settings.get('INPUT_COPY_JOBS', 1)), 1))
+        try:
+            pool.map(self._copy, files_to_copy)
+        finally:
+            pool.terminate()
+
+    def _get_storage_path(self, data_object):
+        if self.settings.get('INPUT_STAGING_MODE') != 'link':
+            return None
+        file_url = data_object['value']['file_url']
+        if not file_url.startswith('file://'):
+            return None
+        path = file_url[len('file://'):]
+        storage_root = os.path.join(self.settings['STORAGE_ROOT'], '')
+        if not path.startswith(storage_root) or not os.path.isfile(path):
+            return None
+        return path
+
+    def _copy(self, file_to_copy):
+        (data_object, path) = file_to_copy
+        try:
+            self.filemanager.export_file(
+                '@%s' % data_object['uuid'],
+                destination_url=path,
+                retry=True)
+        except SystemExit as e:
+            # ThreadPool workers die on SystemExit without returning a
+            # result, so pass it back as a regular exception
+            raise Exception(e.code)
 
 
 def _get_input_info(input):
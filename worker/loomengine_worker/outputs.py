@@ -40,9 +40,7 @@ class FileContentsOutput(BaseOutput):
         filename = self.output['source']['filename']
         text = self._read_file(filename)
         self.output.update({'data': {'contents': text}})
-	self.connection.update_task_attempt_output(
-            self.output['uuid'],
-            self.output)
+	self.task_attempt._update_output(self.output)
 
     def _read_file(self, filename):
         file_path = os.path.join(
@@ -60,9 +58,7 @@ class FileContentsScatterOutput(FileContentsOutput):
         text = self._read_file(filename)
         contents_list = parser.parse(text)
         self.output.update({'data': {'contents': contents_list}})
-	self.connection.update_task_attempt_output(
-            self.output['uuid'],
-            self.output)
+	self.task_attempt._update_output(self.output)
 
 
 class FileListContentsScatterOutput(FileContentsOutput):
@@ -77,9 +73,7 @@ class FileListContentsScatterOutput(FileContentsOutput):
 	        self.settings['WORKING_DIR'], filename)
             contents_list.append(self._read_file(file_path))
         self.output.update({'data': {'contents': contents_list}})
-        self.connection.update_task_attempt_output(
-            self.output['uuid'],
-            self.output)
+        self.task_attempt._update_output(self.output)
 
 
 class StreamOutput(BaseOutput):
@@ -92,9 +86,7 @@ class StreamOutput(BaseOutput):
         else:
             text = self._get_stderr()
         self.output.update({'data': {'contents': text}})
-	self.connection.update_task_attempt_output(
-            self.output['uuid'],
-            self.output)
+	self.task_attempt._update_output(self.output)
 
     def _get_stdout(self):
         return self.task_attempt._get_stdout()
@@ -116,9 +108,7 @@ class StreamScatterOutput(StreamOutput):
         parser = OutputParser(self.output)
         contents_list = parser.parse(text)
         self.output.update({'data': {'contents': contents_list}})
-	self.connection.update_task_attempt_output(
-            self.output['uuid'],
-            self.output)
+	self.task_attempt._update_output(self.output)
 
 
 class GlobScatterOutput(BaseOutput):
@@ -143,9 +133,7 @@ class GlobContentsScatterOutput(FileContentsOutput):
         for file_path in file_path_list:
             contents_list.append(self._read_file(file_path))
         self.output.update({'data': {'contents': contents_list}})
-	self.connection.update_task_attempt_output(
-            self.output['uuid'],
-            self.output)
+	self.task_attempt._update_output(self.output)
 
 
 def _get_output_info(output):
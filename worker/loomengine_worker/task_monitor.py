@@ -11,6 +11,7 @@ import logging
 import os
 import pytz
 import requests
+import signal
 import string
 import sys
 import threading
@@ -22,13 +23,15 @@ from loomengine_utils import execute_with_retries
 from loomengine_utils.filemanager import FileManager
 from loomengine_utils.connection import Connection
 from loomengine_worker.outputs import TaskAttemptOutput
-from loomengine_worker.inputs import TaskAttemptInput
+from loomengine_worker.inputs import InputStager, TaskAttemptInput
 
 
 class TaskMonitor(object):
 
     DOCKER_SOCKET = 'unix://var/run/docker.sock'
     LOOM_RUN_SCRIPT_NAME = '.loom_run_script'
+    # Events are sent in batches, at most this long after they happen
+    EVENT_FLUSH_INTERVAL_SECONDS = 10
 
     def __init__(self, args=None, mock_connection=None, mock_filemanager=None):
         if args is None:
@@ -39,6 +42,13 @@ class TaskMonitor(object):
             'LOG_LEVEL': args.log_level,
         }
         self.is_failed=False
+        self.has_linked_inputs = False
+
+        # Events and output updates wait here until the next batch
+        self._pending_events = []
+        self._pending_outputs = []
+        self._pending_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
 
         self.logger = get_stdout_logger(
             __name__, self.settings['LOG_LEVEL'])
@@ -113,6 +123,7 @@ class TaskMonitor(object):
         t.start()
 
         last_heartbeat = self._send_heartbeat()
+        last_flush = time.time()
 
         while t.is_alive():
             time.sleep(polling_interval)
@@ -120,6 +131,15 @@ class TaskMonitor(object):
                .total_seconds() > \
                (heartbeat_interval - polling_interval):
                 last_heartbeat = self._send_heartbeat()
+            if time.time() - last_flush > self.EVENT_FLUSH_INTERVAL_SECONDS:
+                # Events are not critical, so a failed batch is retried
+                # with the next one
+                try:
+                    self._flush()
+                except Exception as e:
+                    self.logger.warning(
+                        'Failed to send events. %s' % self._get_error_text(e))
+                last_flush = time.time()
 
     def run(self):
         try:
@@ -136,14 +156,23 @@ class TaskMonitor(object):
                 self._finish()
         finally:
             self._delete_container()
+            try:
+                self._flush()
+            except Exception as e:
+                self.logger.error(
+                    'Failed to send events. %s' % self._get_error_text(e))
 
     def _copy_inputs(self):
         self._event('Copying inputs')
         if self.task_attempt.get('inputs') is None:
             return
         try:
+            files = []
             for input in self.task_attempt['inputs']:
-                TaskAttemptInput(input, self).copy()
+                files.extend(TaskAttemptInput(input, self).get_files())
+            stager = InputStager(self)
+            stager.stage(files)
+            self.has_linked_inputs = stager.has_links
         except Exception as e:
             error = self._get_error_text(e)
             self._report_system_error(detail='Copying inputs failed. %s' % error)
@@ -214,18 +243,29 @@ class TaskMonitor(object):
             command = interpreter.split(' ')
             command.append(self.LOOM_RUN_SCRIPT_NAME)
 
+            volumes = [container_dir]
+            binds = {host_dir: {
+                'bind': container_dir,
+                'mode': 'rw',
+            }}
+            if self.has_linked_inputs:
+                # Inputs are symlinks to files in storage, which must
+                # resolve at the same path in the container
+                storage_root = self.settings['STORAGE_ROOT']
+                volumes.append(storage_root)
+                binds[storage_root] = {
+                    'bind': storage_root,
+                    'mode': 'ro',
+                }
+
             self.container = self.docker_client.create_container(
                 image=docker_image,
                 command=command,
-                volumes=[container_dir],
+                volumes=volumes,
                 host_config=self.docker_client.create_host_config(
-                    binds={host_dir: {
-                        'bind': container_dir,
-                        'mode': 'rw',
-                    }}),
+                    binds=binds),
                 working_dir=container_dir,
-                name=self.settings['SERVER_NAME']+'-attempt-'+self.settings[
-                    'TASK_ATTEMPT_ID'],
+                name=self._get_container_name(),
             )
             self._set_container_id(self.container['Id'])
         except Exception as e:
@@ -354,7 +394,9 @@ class TaskMonitor(object):
 
     def _finish(self):
         try:
-            self._finish()
+            # Output updates that are still pending are saved with the
+            # finished status
+            self._flush(status='finished')
         except Exception as e:
             error = self._get_error_text(e)
             self._report_system_error(detail='Setting finished status failed. %s' % error)
@@ -364,11 +406,9 @@ class TaskMonitor(object):
     # Updates to TaskAttempt
 
     def _send_heartbeat(self):
-        task_attempt = self.connection.update_task_attempt(
-            self.settings['TASK_ATTEMPT_ID'],
-            {}
-        )
-        return parse(task_attempt.get('last_heartbeat'))
+        heartbeat = self.connection.post_task_attempt_heartbeat(
+            self.settings['TASK_ATTEMPT_ID'])
+        return parse(heartbeat.get('last_heartbeat'))
 
     def _set_container_id(self, container_id):
         self.connection.update_task_attempt(
@@ -387,20 +427,52 @@ class TaskMonitor(object):
             self.logger.error("%s. %s" % (event, detail))
         else:
             self.logger.info("%s. %s" % (event, detail))
-        self.connection.post_task_attempt_event(
-            self.settings['TASK_ATTEMPT_ID'],
-            {
+        with self._pending_lock:
+            self._pending_events.append({
                 'event': event,
                 'detail': detail,
-                'is_error': is_error
+                'is_error': is_error,
+                'timestamp': datetime.utcnow().replace(
+                    tzinfo=pytz.utc).isoformat(),
             })
 
+    def _update_output(self, output):
+        with self._pending_lock:
+            self._pending_outputs.append(output)
+
+    def _flush(self, status=None):
+        """Send pending events and output updates, and status if given,
+        in one request
+        """
+        with self._flush_lock:
+            with self._pending_lock:
+                events, self._pending_events = self._pending_events, []
+                outputs, self._pending_outputs = self._pending_outputs, []
+            if not events and not outputs and status is None:
+                return
+            try:
+                self.connection.post_task_attempt_batch(
+                    self.settings['TASK_ATTEMPT_ID'],
+                    events=events, outputs=outputs, status=status)
+            except:
+                # Keep everything for the next batch
+                with self._pending_lock:
+                    self._pending_events = events + self._pending_events
+                    self._pending_outputs = outputs + self._pending_outputs
+                raise
+
+    def _flush_failure(self, status):
+        # Outputs of a failed attempt are not needed, and an output
+        # the server rejected would make the status update fail too
+        with self._pending_lock:
+            self._pending_outputs = []
+        self._flush(status=status)
+
     def _report_system_error(self, detail=''):
         self.is_failed=True
         try:
             self._event("TaskAttempt execution failed.", detail=detail, is_error=True)
-            self.connection.post_task_attempt_system_error(
-                self.settings['TASK_ATTEMPT_ID'])
+            self._flush_failure('system_error')
         except:
             # If there is an error reporting failure, don't raise it
             # because it will mask the root cause of failure
@@ -410,15 +482,16 @@ class TaskMonitor(object):
         self.is_failed=True
         try:
             self._event("TaskAttempt execution failed.", detail=detail, is_error=True)
-            self.connection.post_task_attempt_analysis_error(
-                self.settings['TASK_ATTEMPT_ID'])
+            self._flush_failure('analysis_error')
         except:
             # If there is an error reporting failure, don't raise it
             # because it will mask the root cause of failure
             pass
 
-    def _finish(self):
-        self.connection.post_task_attempt_finish(self.settings['TASK_ATTEMPT_ID'])
+    def _get_container_name(self):
+        # The server also uses this name to remove the container
+        return self.settings['SERVER_NAME']+'-attempt-'+self.settings[
+            'TASK_ATTEMPT_ID']
 
     def _delete_container(self):
         try:
@@ -433,6 +506,30 @@ class TaskMonitor(object):
         self.docker_client.stop(self.container)
         self.docker_client.remove_container(self.container)
 
+    def handle_sigterm(self, signum, frame):
+        """Removes the container and exits. The run thread may be blocked
+        on the container, so the process exits without waiting for it.
+        """
+        self.logger.info('Received SIGTERM. Removing container.')
+        try:
+            # By name, in case the run thread is still creating it
+            if 'SERVER_NAME' in self.settings \
+               and not self.settings.get('PRESERVE_ALL'):
+                self.docker_client.remove_container(
+                    self._get_container_name(), force=True)
+        except docker.errors.NotFound:
+            pass
+        except Exception as e:
+            self.logger.error('Failed to remove container. %s'
+                              % self._get_error_text(e))
+        try:
+            self._event('TaskMonitor was stopped')
+            self._flush()
+        except Exception as e:
+            self.logger.error(
+                'Failed to send events. %s' % self._get_error_text(e))
+        os._exit(128 + signum)
+
     def _get_error_text(self, e):
         if hasattr(self, 'settings') and self.settings.get('DEBUG'):
             return traceback.format_exc()
@@ -504,6 +601,7 @@ def get_stdout_logger(name, log_level_string):
 # pip entrypoint requires a function with no arguments
 def main():
     monitor = TaskMonitor()
+    signal.signal(signal.SIGTERM, monitor.handle_sigterm)
     monitor.run_with_heartbeats(monitor.run)
 
 